@@ -0,0 +1,30 @@
+"""todo image
+
+Revision ID: 3f8d21c6a9e4
+Revises: b41c7e9a2d53
+Create Date: 2026-10-18 11:02:17.540921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8d21c6a9e4'
+down_revision: Union[str, Sequence[str], None] = 'b41c7e9a2d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image', sqlmodel.sql.sqltypes.AutoString(), server_default='', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.drop_column('image')
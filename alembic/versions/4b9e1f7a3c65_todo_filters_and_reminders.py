@@ -0,0 +1,38 @@
+"""todo filters and reminders
+
+Revision ID: 4b9e1f7a3c65
+Revises: c81a5d3e7f20
+Create Date: 2026-10-19 14:02:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '4b9e1f7a3c65'
+down_revision: Union[str, Sequence[str], None] = 'c81a5d3e7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The active / completed filters read only their part of a list
+    op.create_index(
+        'ix_todo_list_id_completed_order_id', 'todo', ['list_id', 'completed', 'order', 'id'], unique=False
+    )
+    op.add_column('todo', sa.Column('due_at', sa.DateTime(), nullable=True))
+    op.add_column('todo', sa.Column('remind_at', sa.DateTime(), nullable=True))
+    # The reminder scheduler loads what is due next by range over this
+    op.create_index('ix_todo_remind_at', 'todo', ['remind_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todo_remind_at', table_name='todo')
+    op.drop_column('todo', 'remind_at')
+    op.drop_column('todo', 'due_at')
+    op.drop_index('ix_todo_list_id_completed_order_id', table_name='todo')
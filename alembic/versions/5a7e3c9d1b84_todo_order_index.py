@@ -0,0 +1,29 @@
+"""todo order index
+
+Revision ID: 5a7e3c9d1b84
+Revises: 9c5e0b7d4a12
+Create Date: 2026-10-18 16:40:05.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7e3c9d1b84'
+down_revision: Union[str, Sequence[str], None] = '9c5e0b7d4a12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset paging of the list and streaming export walk this index
+    op.create_index('ix_todo_order_id', 'todo', ['order', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todo_order_id', table_name='todo')
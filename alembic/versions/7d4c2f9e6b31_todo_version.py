@@ -0,0 +1,28 @@
+"""todo version
+
+Revision ID: 7d4c2f9e6b31
+Revises: e2b6f4a8c013
+Create Date: 2026-10-18 22:31:08.274615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4c2f9e6b31'
+down_revision: Union[str, Sequence[str], None] = 'e2b6f4a8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todo', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('todo', 'version')
@@ -0,0 +1,56 @@
+"""todo journal
+
+Revision ID: 8f3a6c2d9b17
+Revises: 4b9e1f7a3c65
+Create Date: 2026-10-20 10:41:18.530972
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3a6c2d9b17'
+down_revision: Union[str, Sequence[str], None] = '4b9e1f7a3c65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'journalentry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('list_id', sa.Integer(), nullable=False),
+        sa.Column('op', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('rows', sa.JSON(), nullable=False),
+        sa.Column('undoes', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['list_id'], ['todolist.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_journalentry_list_id_id', 'journalentry', ['list_id', 'id'], unique=False)
+    # Compaction finds entries older than the keep window by range over this
+    op.create_index('ix_journalentry_created_at', 'journalentry', ['created_at'], unique=False)
+    op.create_table(
+        'journalsnapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('list_id', sa.Integer(), nullable=False),
+        sa.Column('upto', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False),
+        sa.Column('rows', sa.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(['list_id'], ['todolist.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_journalsnapshot_list_id', 'journalsnapshot', ['list_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_journalsnapshot_list_id', table_name='journalsnapshot')
+    op.drop_table('journalsnapshot')
+    op.drop_index('ix_journalentry_created_at', table_name='journalentry')
+    op.drop_index('ix_journalentry_list_id_id', table_name='journalentry')
+    op.drop_table('journalentry')
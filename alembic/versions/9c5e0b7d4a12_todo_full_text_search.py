@@ -0,0 +1,80 @@
+"""todo full text search
+
+Revision ID: 9c5e0b7d4a12
+Revises: 3f8d21c6a9e4
+Create Date: 2026-10-18 12:26:03.917345
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '9c5e0b7d4a12'
+down_revision: Union[str, Sequence[str], None] = '3f8d21c6a9e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        # A tsvector column kept up to date by a trigger, with a GIN index on it
+        op.execute("ALTER TABLE todo ADD COLUMN search_vector tsvector")
+        op.execute("""
+            CREATE FUNCTION todo_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('english', coalesce(NEW.text, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute("""
+            CREATE TRIGGER todo_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF text, description ON todo
+            FOR EACH ROW EXECUTE FUNCTION todo_search_vector_update()
+        """)
+        op.execute("UPDATE todo SET text = text")
+        op.execute("CREATE INDEX ix_todo_search_vector ON todo USING gin (search_vector)")
+    else:
+        # SQLite: an FTS5 index over the todo table, kept in sync by triggers
+        op.execute("""
+            CREATE VIRTUAL TABLE todo_fts USING fts5(
+                text, description, content='todo', content_rowid='id'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER todo_fts_insert AFTER INSERT ON todo BEGIN
+                INSERT INTO todo_fts(rowid, text, description) VALUES (new.id, new.text, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER todo_fts_delete AFTER DELETE ON todo BEGIN
+                INSERT INTO todo_fts(todo_fts, rowid, text, description) VALUES ('delete', old.id, old.text, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER todo_fts_update AFTER UPDATE OF text, description ON todo BEGIN
+                INSERT INTO todo_fts(todo_fts, rowid, text, description) VALUES ('delete', old.id, old.text, old.description);
+                INSERT INTO todo_fts(rowid, text, description) VALUES (new.id, new.text, new.description);
+            END
+        """)
+        op.execute("INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX ix_todo_search_vector")
+        op.execute("DROP TRIGGER todo_search_vector_trigger ON todo")
+        op.execute("DROP FUNCTION todo_search_vector_update()")
+        op.execute("ALTER TABLE todo DROP COLUMN search_vector")
+    else:
+        op.execute("DROP TRIGGER todo_fts_update")
+        op.execute("DROP TRIGGER todo_fts_delete")
+        op.execute("DROP TRIGGER todo_fts_insert")
+        op.execute("DROP TABLE todo_fts")
@@ -0,0 +1,54 @@
+"""fractional todo order
+
+Revision ID: b41c7e9a2d53
+Revises: 6998bed2a4fe
+Create Date: 2026-10-18 10:12:41.228310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c7e9a2d53'
+down_revision: Union[str, Sequence[str], None] = '6998bed2a4fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+todo = sa.table('todo', sa.column('id', sa.Integer()), sa.column('order', sa.Float()))
+
+
+def renumber() -> None:
+    """Give every row a distinct whole-number key, keeping the current order."""
+    bind = op.get_bind()
+    ids = bind.execute(sa.select(todo.c.id).order_by(todo.c.order, todo.c.id)).scalars().all()
+    if ids:
+        bind.execute(
+            todo.update().where(todo.c.id == sa.bindparam('todo_id')).values(order=sa.bindparam('new_order')),
+            [{'todo_id': todo_id, 'new_order': n} for n, todo_id in enumerate(ids)],
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.alter_column('order',
+               existing_type=sa.Integer(),
+               type_=sa.Float(),
+               existing_nullable=False,
+               existing_server_default=sa.text('0'))
+    # Rows created before 6998bed2a4fe all got order 0, so spread them out
+    renumber()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    renumber()
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.alter_column('order',
+               existing_type=sa.Float(),
+               type_=sa.Integer(),
+               existing_nullable=False,
+               existing_server_default=sa.text('0'))
@@ -0,0 +1,51 @@
+"""todo archive
+
+Revision ID: c81a5d3e7f20
+Revises: 7d4c2f9e6b31
+Create Date: 2026-10-19 09:14:52.607381
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81a5d3e7f20'
+down_revision: Union[str, Sequence[str], None] = '7d4c2f9e6b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todo', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_todo_completed_at', 'todo', ['completed_at'], unique=False)
+    # Tasks completed before this was tracked start their clock now
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    op.execute(sa.text('UPDATE todo SET completed_at = :now WHERE completed').bindparams(now=now))
+    op.create_table(
+        'archivedtodo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('text', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('image', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('list_id', sa.Integer(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['list_id'], ['todolist.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_archivedtodo_list_id_completed_at_id', 'archivedtodo', ['list_id', 'completed_at', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_archivedtodo_list_id_completed_at_id', table_name='archivedtodo')
+    op.drop_table('archivedtodo')
+    op.drop_index('ix_todo_completed_at', table_name='todo')
+    op.drop_column('todo', 'completed_at')
@@ -0,0 +1,69 @@
+"""todo subtasks
+
+Revision ID: d7a2e5c91b48
+Revises: 8f3a6c2d9b17
+Create Date: 2026-10-21 09:17:52.264031
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a2e5c91b48'
+down_revision: Union[str, Sequence[str], None] = '8f3a6c2d9b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todo', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.add_column('todo', sa.Column('subtasks', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('todo', sa.Column('subtasks_done', sa.Integer(), server_default='0', nullable=False))
+    if op.get_bind().dialect.name != 'sqlite':
+        # SQLite can only add the constraint by rebuilding the table, which
+        # would drop the full-text search triggers on it
+        op.create_foreign_key('fk_todo_parent_id_todo', 'todo', 'todo', ['parent_id'], ['id'])
+    # Deleting a task checks for subtasks still pointing at it
+    op.create_index('ix_todo_parent_id', 'todo', ['parent_id'], unique=False)
+    # The list shows top-level tasks only, and an expanded task reads its
+    # subtasks in order: both are a range of (list_id, parent_id)
+    op.drop_index('ix_todo_list_id_order_id', table_name='todo')
+    op.drop_index('ix_todo_list_id_completed_order_id', table_name='todo')
+    op.create_index('ix_todo_list_id_parent_id_order_id', 'todo', ['list_id', 'parent_id', 'order', 'id'], unique=False)
+    op.create_index(
+        'ix_todo_list_id_parent_id_completed_order_id', 'todo',
+        ['list_id', 'parent_id', 'completed', 'order', 'id'], unique=False,
+    )
+    # Existing tasks are all top-level, so the closure table starts empty
+    op.create_table(
+        'todotree',
+        sa.Column('ancestor', sa.Integer(), nullable=False),
+        sa.Column('descendant', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor'], ['todo.id']),
+        sa.ForeignKeyConstraint(['descendant'], ['todo.id']),
+        sa.PrimaryKeyConstraint('ancestor', 'descendant'),
+    )
+    op.create_index('ix_todotree_descendant_ancestor', 'todotree', ['descendant', 'ancestor'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todotree_descendant_ancestor', table_name='todotree')
+    op.drop_table('todotree')
+    op.drop_index('ix_todo_list_id_parent_id_completed_order_id', table_name='todo')
+    op.drop_index('ix_todo_list_id_parent_id_order_id', table_name='todo')
+    op.create_index(
+        'ix_todo_list_id_completed_order_id', 'todo', ['list_id', 'completed', 'order', 'id'], unique=False
+    )
+    op.create_index('ix_todo_list_id_order_id', 'todo', ['list_id', 'order', 'id'], unique=False)
+    op.drop_index('ix_todo_parent_id', table_name='todo')
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_todo_parent_id_todo', 'todo', type_='foreignkey')
+    op.drop_column('todo', 'subtasks_done')
+    op.drop_column('todo', 'subtasks')
+    op.drop_column('todo', 'parent_id')
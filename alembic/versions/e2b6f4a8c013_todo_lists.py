@@ -0,0 +1,53 @@
+"""todo lists
+
+Revision ID: e2b6f4a8c013
+Revises: 5a7e3c9d1b84
+Create Date: 2026-10-18 20:12:44.903117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6f4a8c013'
+down_revision: Union[str, Sequence[str], None] = '5a7e3c9d1b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    todolist = op.create_table(
+        'todolist',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('owner', sqlmodel.sql.sqltypes.AutoString(), server_default='', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_todolist_owner', 'todolist', ['owner'], unique=False)
+    # Existing tasks all go on one list
+    op.bulk_insert(todolist, [{'id': 1, 'name': 'Todos', 'owner': ''}])
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("SELECT setval('todolist_id_seq', 1)")
+    op.add_column('todo', sa.Column('list_id', sa.Integer(), server_default='1', nullable=False))
+    if op.get_bind().dialect.name != 'sqlite':
+        # SQLite can only add the constraint by rebuilding the table, which
+        # would drop the full-text search triggers on it
+        op.create_foreign_key('fk_todo_list_id_todolist', 'todo', 'todolist', ['list_id'], ['id'])
+    # Every list query filters on list_id first, so lead the index with it
+    op.drop_index('ix_todo_order_id', table_name='todo')
+    op.create_index('ix_todo_list_id_order_id', 'todo', ['list_id', 'order', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todo_list_id_order_id', table_name='todo')
+    op.create_index('ix_todo_order_id', 'todo', ['order', 'id'], unique=False)
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_todo_list_id_todolist', 'todo', type_='foreignkey')
+    op.drop_column('todo', 'list_id')
+    op.drop_index('ix_todolist_owner', table_name='todolist')
+    op.drop_table('todolist')
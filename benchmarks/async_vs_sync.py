@@ -0,0 +1,99 @@
+"""Compare event throughput of blocking and async database handlers.
+
+Starts N simulated clients in one event loop, like the websocket events of
+N browser tabs served by one worker. Each client toggles a todo over and
+over. The "sync" run does it the way handlers used to (a blocking
+rx.session() inside the coroutine); the "async" run uses todo_app.db.asession.
+
+    REFLEX_DB_URL=postgresql://... python benchmarks/async_vs_sync.py --clients 1 10 50
+
+--latency-ms adds a simulated network round-trip to every statement, which
+makes the difference visible on a local SQLite file too.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reflex as rx
+import sqlmodel
+from todo_app.db import asession
+from todo_app.models import DEFAULT_LIST_ID, Todo, TodoList
+
+
+def setup(rows: int) -> list[int]:
+    engine = rx.model.get_engine()
+    sqlmodel.SQLModel.metadata.create_all(engine)
+    with rx.session() as session:
+        # The bench todos go on the default list, which a fresh database doesn't have yet
+        if session.get(TodoList, DEFAULT_LIST_ID) is None:
+            session.add(TodoList(id=DEFAULT_LIST_ID, name="Todos"))
+        session.add_all(Todo(text=f"bench {n}", order=n, list_id=DEFAULT_LIST_ID) for n in range(rows))
+        session.commit()
+        return session.exec(sqlmodel.select(Todo.id).where(Todo.text.startswith("bench "))).all()
+
+
+def cleanup():
+    with rx.session() as session:
+        session.execute(sqlmodel.delete(Todo).where(Todo.text.startswith("bench ")))
+        session.commit()
+
+
+async def sync_toggle(todo_id: int, latency: float):
+    with rx.session() as session:
+        time.sleep(latency)
+        todo = session.get(Todo, todo_id)
+        todo.completed = not todo.completed
+        time.sleep(latency)
+        session.commit()
+
+
+async def async_toggle(todo_id: int, latency: float):
+    async with asession() as session:
+        await asyncio.sleep(latency)
+        todo = await session.get(Todo, todo_id)
+        todo.completed = not todo.completed
+        await asyncio.sleep(latency)
+        await session.commit()
+
+
+async def run(toggle, clients: int, events: int, ids: list[int], latency: float) -> float:
+    async def client(n: int):
+        for i in range(events):
+            await toggle(ids[(n * events + i) % len(ids)], latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return clients * events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--events", type=int, default=50, help="events per client")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    ids = setup(args.rows)
+    latency = args.latency_ms / 1000
+
+    # One event loop for everything: pooled async connections belong to it
+    async def compare():
+        print(f"{'clients':>8} {'sync ev/s':>12} {'async ev/s':>12} {'speedup':>8}")
+        for clients in args.clients:
+            sync_rate = await run(sync_toggle, clients, args.events, ids, latency)
+            async_rate = await run(async_toggle, clients, args.events, ids, latency)
+            print(f"{clients:>8} {sync_rate:>12.1f} {async_rate:>12.1f} {async_rate / sync_rate:>7.2f}x")
+
+    try:
+        asyncio.run(compare())
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
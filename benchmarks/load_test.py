@@ -0,0 +1,260 @@
+"""Drive State event handlers with simulated sessions and report how they do.
+
+Each simulated session is its own State instance, like one browser tab. It
+calls handlers in a realistic mix, all concurrently in one event loop, the
+way one worker serves many websockets. Runs against a table of each size
+given in --rows, spread evenly over --lists lists (sessions are spread over
+the lists too), and for every handler reports:
+
+  * p50 / p95 / p99 latency (ms) and events per second
+  * SQL statements per event (counted with SQLAlchemy engine events)
+  * bytes of state delta per event (what would be sent to the browser)
+
+Results are written as JSON. Pass --baseline with an earlier file to print
+the change per metric and exit non-zero when something got worse than
+--tolerance. Every table in the --db-url database is emptied before each
+size is seeded, so never point it at a database you want to keep.
+
+    python benchmarks/load_test.py --db-url sqlite:///bench.db --rows 10 1000 100000
+    python benchmarks/load_test.py --db-url sqlite:///bench.db --rows 100000 --lists 100
+    python benchmarks/load_test.py --db-url postgresql://... --out new.json --baseline old.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# How often each handler runs in the default mix (relative weights)
+DEFAULT_MIX = {
+    "on_mount": 5,
+    "add_todo": 10,
+    "toggle_complete": 35,
+    "reorder_todos": 10,
+    "view_details": 25,
+    "save_selected_todo": 15,
+}
+
+# Metrics where a bigger number is worse, and where a smaller one is
+WORSE_IF_HIGHER = ("p50_ms", "p95_ms", "p99_ms", "sql_per_event", "delta_bytes_per_event")
+WORSE_IF_LOWER = ("events_per_sec",)
+
+# SQL statements run by the event currently being measured
+_statements: contextvars.ContextVar[list | None] = contextvars.ContextVar("statements", default=None)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Session:
+    """One simulated browser tab: a State instance plus what it has on screen."""
+
+    def __init__(self, state_cls, rng: random.Random, list_id: int):
+        self.state = state_cls(_reflex_internal_init=True)
+        self.state.list_id = list_id
+        self.rng = rng
+
+    # Arguments for a handler, based on what this tab currently shows
+    def args_for(self, name: str) -> tuple | None:
+        todos = self.state.todos
+        if name == "add_todo":
+            self.state.new_todo = f"load test {self.rng.random():.6f}"
+            return ()
+        if name == "toggle_complete":
+            return (self.rng.choice(todos).id,) if todos else None
+        if name == "reorder_todos":
+            if len(todos) < 2:
+                return None
+            # A drag of one item to a nearby spot
+            ids = [todo.id for todo in todos]
+            moved = ids.pop(self.rng.randrange(len(ids)))
+            ids.insert(self.rng.randrange(len(ids) + 1), moved)
+            return (ids,)
+        if name == "view_details":
+            return (self.rng.choice(todos).id,) if todos else None
+        if name == "save_selected_todo":
+            if self.state.selected_todo is None:
+                return None
+            self.state.selected_todo["description"] = f"edited {self.rng.random():.6f}"
+            return ()
+        return ()
+
+
+def encode_delta(state) -> int:
+    from reflex.utils.format import json_dumps
+
+    size = len(json_dumps(state.get_delta()))
+    state._clean()
+    return size
+
+
+async def run_event(session: Session, handlers, name: str, samples: dict):
+    args = session.args_for(name)
+    if args is None:
+        return
+    statements = []
+    token = _statements.set(statements)
+    start = time.perf_counter()
+    try:
+        result = handlers[name].fn(session.state, *args)
+        if asyncio.iscoroutine(result):
+            await result
+    finally:
+        elapsed = time.perf_counter() - start
+        _statements.reset(token)
+    sample = samples.setdefault(name, {"latency": [], "sql": [], "delta": []})
+    sample["latency"].append(elapsed)
+    sample["sql"].append(len(statements))
+    sample["delta"].append(encode_delta(session.state))
+
+
+def summarize(samples: dict, wall: float) -> dict:
+    def stats(latency, sql, delta, seconds):
+        return {
+            "events": len(latency),
+            "p50_ms": percentile(latency, 50) * 1000,
+            "p95_ms": percentile(latency, 95) * 1000,
+            "p99_ms": percentile(latency, 99) * 1000,
+            "events_per_sec": len(latency) / seconds if seconds else 0.0,
+            "sql_per_event": statistics.fmean(sql) if sql else 0.0,
+            "delta_bytes_per_event": statistics.fmean(delta) if delta else 0.0,
+        }
+
+    report = {
+        name: stats(sample["latency"], sample["sql"], sample["delta"], sum(sample["latency"]))
+        for name, sample in sorted(samples.items())
+    }
+    everything = {key: [value for sample in samples.values() for value in sample[key]] for key in ("latency", "sql", "delta")}
+    report["all"] = stats(everything["latency"], everything["sql"], everything["delta"], wall)
+    return report
+
+
+def seed(rows: int, lists: int):
+    import reflex as rx
+    import sqlmodel
+    from todo_app.models import Todo, TodoList
+
+    engine = rx.model.get_engine()
+    sqlmodel.SQLModel.metadata.create_all(engine)
+    with rx.session() as session:
+        # Empty every table, the ones pointing at todos and lists first
+        for table in reversed(sqlmodel.SQLModel.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.execute(sqlmodel.insert(TodoList), [{"id": n + 1, "name": f"list {n + 1}", "owner": ""} for n in range(lists)])
+        session.execute(
+            sqlmodel.insert(Todo),
+            [
+                {"text": f"todo {n}", "description": "", "completed": n % 3 == 0, "image": "",
+                 "order": float(n // lists), "list_id": n % lists + 1}
+                for n in range(rows)
+            ],
+        )
+        session.commit()
+
+
+async def run_size(args, rows: int) -> dict:
+    from todo_app.cache import snapshots
+    from todo_app.state import State
+
+    seed(rows, args.lists)
+    snapshots.clear()
+    handlers = State.event_handlers
+    names, weights = zip(*args.mix.items())
+    samples: dict = {}
+
+    async def client(n: int):
+        rng = random.Random(args.seed * 1000 + n)
+        session = Session(State, rng, n % args.lists + 1)
+        await run_event(session, handlers, "on_mount", samples)
+        for _ in range(args.events):
+            await run_event(session, handlers, rng.choices(names, weights)[0], samples)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(args.sessions)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for rows, handlers in results["results"].items():
+        for name, metrics in handlers.items():
+            old = baseline.get("results", {}).get(rows, {}).get(name)
+            if not old:
+                continue
+            for metric in WORSE_IF_HIGHER + WORSE_IF_LOWER:
+                before, after = old.get(metric), metrics[metric]
+                if not before:
+                    continue
+                change = (after - before) / before
+                worse = change > tolerance if metric in WORSE_IF_HIGHER else change < -tolerance
+                flag = "  REGRESSION" if worse else ""
+                print(f"{rows:>8} {name:<20} {metric:<22} {before:>12.2f} -> {after:>12.2f} ({change:+.1%}){flag}")
+                if worse:
+                    regressions.append(f"{rows} rows / {name} / {metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--db-url", required=True,
+        help="throwaway database to run against; every table in it is emptied first",
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100_000])
+    parser.add_argument("--lists", type=int, default=1, help="lists the rows are spread over")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--events", type=int, default=20, help="events per session")
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX, help='handler weights as JSON, e.g. \'{"toggle_complete": 1}\'')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative change before it counts as a regression")
+    args = parser.parse_args()
+
+    # Must be set before reflex reads its config
+    os.environ["REFLEX_DB_URL"] = args.db_url
+    import sqlalchemy
+
+    @sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements is not None:
+            statements.append(statement)
+
+    async def run_all():
+        return {str(rows): await run_size(args, rows) for rows in args.rows}
+
+    results = {
+        "config": {key: getattr(args, key) for key in ("rows", "lists", "sessions", "events", "mix", "seed")},
+        "results": asyncio.run(run_all()),
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'rows':>8} {'handler':<20} {'events':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ev/s':>9} {'sql/ev':>7} {'delta B':>9}")
+    for rows, handlers in results["results"].items():
+        for name, m in handlers.items():
+            print(f"{rows:>8} {name:<20} {m['events']:>7} {m['p50_ms']:>8.2f} {m['p95_ms']:>8.2f} {m['p99_ms']:>8.2f} "
+                  f"{m['events_per_sec']:>9.1f} {m['sql_per_event']:>7.2f} {m['delta_bytes_per_event']:>9.0f}")
+    print(f"results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Simulate a lagging read replica of a SQLite database.
+
+Copies the primary database file to the replica file every --interval
+seconds, but each copy only lands --lag seconds after it was taken, so the
+replica always trails the primary by about that much. Run it next to the
+app with read_db_url pointing at the replica:
+
+    python benchmarks/replica_lag.py --primary reflex.db --replica replica.db --lag 1.5
+    TODO_READ_DB_URL=sqlite:///replica.db TODO_REPLICA_MAX_LAG_S=2 reflex run
+
+While it runs, a session should always see its own writes straight away,
+and other sessions should see them once the lag has passed. Set --lag above
+replica_max_lag_s to see what reads that are too stale look like.
+
+On Postgres, use a real streaming standby instead and delay it with
+recovery_min_apply_delay in its postgresql.conf.
+"""
+import argparse
+import collections
+import sqlite3
+import time
+
+
+# Take a consistent copy of a database into memory
+def snapshot(path: str) -> sqlite3.Connection:
+    copy = sqlite3.connect(":memory:")
+    with sqlite3.connect(path) as source:
+        source.backup(copy)
+    return copy
+
+
+# Overwrite the replica with a snapshot
+def apply(copy: sqlite3.Connection, path: str):
+    with sqlite3.connect(path) as target:
+        copy.backup(target)
+    copy.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--primary", default="reflex.db")
+    parser.add_argument("--replica", default="replica.db")
+    parser.add_argument("--lag", type=float, default=1.0, help="seconds the replica trails the primary")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between snapshots")
+    args = parser.parse_args()
+
+    # Snapshots taken but not applied yet, as (taken at, snapshot)
+    pending = collections.deque()
+    apply(snapshot(args.primary), args.replica)
+    print(f"Replicating {args.primary} to {args.replica} with {args.lag}s lag (Ctrl+C to stop)")
+    try:
+        while True:
+            now = time.monotonic()
+            pending.append((now, snapshot(args.primary)))
+            while pending and pending[0][0] <= now - args.lag:
+                apply(pending.popleft()[1], args.replica)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
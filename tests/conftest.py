@@ -0,0 +1,64 @@
+import inspect
+import os
+import tempfile
+
+# Settings are read when the app is imported, so set them before any test
+# module imports it. Every test module shares this database.
+DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["REFLEX_DB_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["TODO_WRITE_BEHIND_MS"] = "100"
+os.environ["TODO_CHANGE_FEED"] = "local"
+os.environ["REFLEX_UPLOADED_FILES_DIR"] = tempfile.mkdtemp()
+
+import pytest  # noqa: E402
+import reflex as rx  # noqa: E402
+import sqlalchemy  # noqa: E402
+from reflex.istate.data import RouterData  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+from todo_app.cache import snapshots  # noqa: E402
+from todo_app.models import DEFAULT_LIST_ID, TodoList  # noqa: E402
+from todo_app.state import State  # noqa: E402
+
+engine = sqlalchemy.create_engine(os.environ["REFLEX_DB_URL"])
+
+
+# Every test starts from empty tables and the default list
+@pytest.fixture(autouse=True)
+def fresh_database():
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(TodoList(id=DEFAULT_LIST_ID, name="Todos"))
+        session.commit()
+    snapshots.clear()
+
+
+# Add rows and return them with their ids filled in
+def add(*rows):
+    with Session(engine, expire_on_commit=False) as session:
+        session.add_all(rows)
+        session.commit()
+        for row in rows:
+            session.refresh(row)
+    return rows
+
+
+# A fresh copy of a row read back from the database
+def reload(model, row_id: int):
+    with Session(engine) as session:
+        return session.get(model, row_id)
+
+
+# A State for the browser tab with client token `token`
+def session_state(token: str = "a") -> State:
+    root = rx.State(_reflex_internal_init=True)
+    root.router = RouterData.from_router_data({"token": token})
+    return root.get_substate(State.get_full_name().split("."))
+
+
+# Run a State event handler outside the app
+async def call(state: State, name: str, *args):
+    result = State.event_handlers[name].fn(state, *args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
@@ -0,0 +1,38 @@
+import pytest
+from sqlmodel import Session, select
+from starlette.testclient import TestClient
+from conftest import engine
+from todo_app import api, metrics
+from todo_app.models import DEFAULT_LIST_ID, Todo
+
+
+@pytest.fixture
+def client():
+    with TestClient(api.api) as client:
+        yield client
+
+
+# An import body bigger than SPOOL_BYTES is spooled to disk and imported whole
+def test_import_spooled_to_disk(client, monkeypatch):
+    monkeypatch.setattr(api, "SPOOL_BYTES", 16)
+    body = "".join(f'{{"text": "todo {n}"}}\n' for n in range(100)).encode()
+    response = client.post(f"/todos/import?format=ndjson&list={DEFAULT_LIST_ID}", content=body)
+    assert response.json() == {"imported": 100}
+    with Session(engine) as session:
+        assert len(session.exec(select(Todo)).all()) == 100
+
+
+def test_import_rejects_bad_records(client):
+    response = client.post(f"/todos/import?format=ndjson&list={DEFAULT_LIST_ID}", content=b'{"text": ""}\n')
+    assert response.status_code == 400
+    assert response.json() == {"error": "Record 1 has no text."}
+
+
+# The slow-handler log can be switched at runtime; a bad threshold is refused
+def test_slow_log(client, monkeypatch):
+    monkeypatch.setattr(metrics, "slow_log", {"enabled": False, "threshold_ms": 250.0})
+    assert client.post("/metrics/slow_log?enabled=1&threshold_ms=100").json() == {"enabled": True, "threshold_ms": 100.0}
+    for threshold in ("abc", "-5", "nan", "inf"):
+        response = client.post(f"/metrics/slow_log?enabled=0&threshold_ms={threshold}")
+        assert response.status_code == 400
+    assert metrics.slow_log == {"enabled": True, "threshold_ms": 100.0}
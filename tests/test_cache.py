@@ -0,0 +1,60 @@
+import asyncio
+from todo_app.cache import OVERSIZE_SHARE, SnapshotCache
+
+
+# Read `key` through the cache, loading `rows` rows on a miss
+def get(cache: SnapshotCache, key, rows: int, partition=None) -> tuple:
+    async def load():
+        return range(rows)
+
+    return asyncio.run(cache.get(key, load, partition))
+
+
+# The least recently used snapshots go once the rows add up past max_rows
+def test_bounded_by_rows():
+    cache = SnapshotCache(max_entries=100, max_rows=8 * OVERSIZE_SHARE)
+    for key in "abcdefgh":
+        get(cache, key, 8)
+    assert cache.stats()["rows"] == 64
+    get(cache, "a", 8)
+    get(cache, "i", 8)
+    assert cache.stats()["rows"] == 64
+    assert cache.stats()["entries"] == 8
+    misses = cache.misses
+    get(cache, "a", 8)
+    assert cache.misses == misses
+    get(cache, "b", 8)
+    assert cache.misses == misses + 1
+
+
+# A snapshot too big to share the cache is served but not kept
+def test_oversized_snapshot_not_kept():
+    cache = SnapshotCache(max_rows=100 * OVERSIZE_SHARE)
+    get(cache, "small", 10)
+    assert len(get(cache, "huge", 101)) == 101
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["rows"] == 10
+    get(cache, "huge", 101)
+    assert cache.hits == 0
+
+
+# Still bounded by entries too
+def test_bounded_by_entries():
+    cache = SnapshotCache(max_entries=2)
+    for key in "abc":
+        get(cache, key, 1)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["rows"] == 2
+
+
+# A write to a partition drops its snapshots and the rows they held
+def test_bump_frees_rows():
+    cache = SnapshotCache()
+    get(cache, "page", 30, partition=1)
+    get(cache, "page", 20, partition=2)
+    cache.bump(1)
+    assert cache.stats()["rows"] == 20
+    get(cache, "page", 30, partition=1)
+    assert cache.misses == 3
+    cache.clear()
+    assert (cache.stats()["entries"], cache.stats()["rows"]) == (0, 0)
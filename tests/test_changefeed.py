@@ -0,0 +1,130 @@
+import asyncio
+from conftest import add, call, session_state
+from todo_app import changefeed
+from todo_app.cache import snapshots
+from todo_app.changefeed import MAX_CHANGES, Change, LocalBroker, PostgresBroker, resync
+from todo_app.models import DEFAULT_LIST_ID, Todo
+
+
+# A follower whose queue fills up gets one resync instead of the backlog,
+# then changes one by one again
+def test_overflow_becomes_resync():
+    async def run():
+        broker = LocalBroker(queue_size=3)
+        subscription = broker.subscribe(1)
+        broker.dispatch([Change(1, n, "update", {"text": str(n)}, 2) for n in range(4)])
+        first = await subscription.get(0.1)
+        broker.dispatch([Change(1, 9, "delete")])
+        return broker, first, await subscription.get(0.1)
+
+    broker, first, then = asyncio.run(run())
+    assert first == [resync(1)]
+    assert broker.overflows == 1
+    assert then == [Change(1, 9, "delete")]
+
+
+# Followers only get changes to the list they follow, and none once closed
+def test_dispatch_by_list():
+    async def run():
+        broker = LocalBroker(queue_size=10)
+        mine, other = broker.subscribe(1), broker.subscribe(2)
+        broker.dispatch([Change(1, 1, "delete"), Change(2, 2, "delete")])
+        got = await mine.get(0.1), await other.get(0.1)
+        other.close()
+        broker.dispatch([Change(2, 3, "delete")])
+        return got, await other.get(0.01)
+
+    (mine, other), closed = asyncio.run(run())
+    assert mine == [Change(1, 1, "delete")]
+    assert other == [Change(2, 2, "delete")]
+    assert closed == []
+
+
+# Only the lists with more than MAX_CHANGES changes collapse to a resync
+def test_compact():
+    many = [Change(1, n, "delete") for n in range(MAX_CHANGES + 1)]
+    few = [Change(2, n, "delete") for n in range(MAX_CHANGES)]
+    assert changefeed._compact(many + few) == [resync(1)] + few
+    assert changefeed._compact(few) == few
+
+
+# A NOTIFY payload too big to send goes out as a resync of each list in it
+def test_oversized_notify_becomes_resync():
+    class Recorder:
+        async def execute(self, statement, params):
+            sent.append(params["payload"])
+
+    sent = []
+    changes = [Change(1, n, "update", {"text": "x" * 100}, 2) for n in range(MAX_CHANGES)]
+    asyncio.run(PostgresBroker(10).stage(Recorder(), changes))
+    assert sent == [changefeed._encode([resync(1)])]
+
+
+# When the LISTEN connection fails, followers resync: whatever was sent in
+# the meantime is lost
+def test_listener_failure_resyncs(monkeypatch):
+    def unreachable():
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(changefeed, "get_async_engine", unreachable)
+    monkeypatch.setattr(changefeed, "RETRY_SECONDS", 0.01)
+
+    async def run():
+        broker = PostgresBroker(10)
+        subscription = broker.subscribe(1)
+        try:
+            return await subscription.get(1)
+        finally:
+            broker._listener.cancel()
+
+    assert asyncio.run(run()) == [resync(1)]
+
+
+# Writes by one session show up in another session following the list
+def test_second_session_applies_changes():
+    first_todo, second_todo = add(
+        Todo(text="one", list_id=DEFAULT_LIST_ID, order=1),
+        Todo(text="two", list_id=DEFAULT_LIST_ID, order=2),
+    )
+
+    async def run():
+        writer, follower = session_state("a"), session_state("b")
+        await call(writer, "on_mount")
+        await call(follower, "on_mount")
+        subscription = changefeed.get_feed().subscribe(DEFAULT_LIST_ID)
+        try:
+            await call(writer, "toggle_complete", first_todo.id)
+            writer.set_new_todo("three")
+            await call(writer, "add_todo")
+            # What follow_changes does with them
+            for change in await subscription.get(1):
+                await follower._apply_change(change)
+            await follower._load_counts()
+        finally:
+            subscription.close()
+        return follower
+
+    follower = asyncio.run(run())
+    assert [(row.text, row.completed) for row in follower.todos] == [("one", True), ("two", False), ("three", False)]
+    assert follower._versions[first_todo.id] == first_todo.version + 1
+    assert (follower.count_all, follower.count_completed) == (3, 1)
+
+
+# Changes no newer than what a session shows are skipped, and a resync
+# reloads the list from the database
+def test_second_session_skips_stale_and_resyncs():
+    todo, = add(Todo(text="one", list_id=DEFAULT_LIST_ID))
+
+    async def run():
+        follower = session_state("b")
+        await call(follower, "on_mount")
+        await follower._apply_change(Change(DEFAULT_LIST_ID, todo.id, "update", {"text": "old"}, todo.version))
+        stale = follower.todos[0].text
+        add(Todo(text="two", list_id=DEFAULT_LIST_ID, order=5))
+        snapshots.bump(DEFAULT_LIST_ID)
+        await follower._apply_change(resync(DEFAULT_LIST_ID))
+        return stale, follower
+
+    stale, follower = asyncio.run(run())
+    assert stale == "one"
+    assert [row.text for row in follower.todos] == ["one", "two"]
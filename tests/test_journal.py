@@ -0,0 +1,146 @@
+from datetime import timedelta
+from sqlmodel import Session, select
+from conftest import add, engine, reload
+from todo_app import journal, services
+from todo_app.models import DEFAULT_LIST_ID, JournalEntry, JournalSnapshot, Todo, TodoTree
+
+
+# Update some fields of a todo and journal it, the way State does
+def journaled_update(session: Session, todo: Todo, values: dict) -> int:
+    old = journal.before(session, values, [todo.id])
+    version = services.update_todo(session, todo.id, todo.version, values)
+    return journal.record(session, todo.list_id, "update", journal.updates({todo.id: version}, old, {todo.id: values}))
+
+
+# Delete todos (with their subtasks) and journal it, the way State does
+def journaled_delete(session: Session, todos: list[Todo]) -> int:
+    gone, _ = services.delete_todos(session, DEFAULT_LIST_ID, {todo.id: todo.version for todo in todos})
+    return journal.record(session, DEFAULT_LIST_ID, "delete", journal.images(gone))
+
+
+# Undo an update, then redo it by undoing the undo
+def test_undo_and_redo_update():
+    todo, = add(Todo(text="before", list_id=DEFAULT_LIST_ID))
+    with Session(engine) as session:
+        entry_id = journaled_update(session, todo, {"text": "after", "completed": True})
+        session.commit()
+    with Session(engine) as session:
+        undone = journal.revert(session, entry_id)
+        session.commit()
+    restored = reload(Todo, todo.id)
+    assert (restored.text, restored.completed, restored.completed_at) == ("before", False, None)
+    assert restored.version == todo.version + 2
+    assert undone.conflicts == []
+    assert [(change.op, change.fields["text"], change.version) for change in undone.changes] == [
+        ("update", "before", todo.version + 2),
+    ]
+    with Session(engine) as session:
+        redone = journal.revert(session, undone.entry_id)
+        session.commit()
+    again = reload(Todo, todo.id)
+    assert (again.text, again.completed) == ("after", True)
+    assert again.completed_at is not None
+    assert redone.conflicts == []
+    assert reload(JournalEntry, redone.entry_id).undoes == undone.entry_id
+
+
+# Undoing a bulk delete puts every row back with its id, version and
+# fields, subtasks under their parents, with the parents' rollups
+def test_undo_bulk_delete_keeps_ids_and_versions():
+    first, second = add(
+        Todo(text="first", list_id=DEFAULT_LIST_ID, version=4, description="notes"),
+        Todo(text="second", list_id=DEFAULT_LIST_ID, version=2),
+    )
+    sub, = add(Todo(text="sub", list_id=DEFAULT_LIST_ID, parent_id=second.id, completed=True))
+    with Session(engine) as session:
+        services.attach_subtasks(session, [(sub.id, second.id)])
+        session.commit()
+    second = reload(Todo, second.id)
+    with Session(engine) as session:
+        entry_id = journaled_delete(session, [first, second])
+        session.commit()
+    assert reload(Todo, first.id) is None
+    assert reload(Todo, sub.id) is None
+    with Session(engine) as session:
+        undone = journal.revert(session, entry_id)
+        session.commit()
+    assert undone.conflicts == []
+    for todo in (first, second, sub):
+        back = reload(Todo, todo.id)
+        assert (back.text, back.version, back.parent_id) == (todo.text, todo.version, todo.parent_id)
+    assert reload(Todo, first.id).description == "notes"
+    parent = reload(Todo, second.id)
+    assert (parent.subtasks, parent.subtasks_done) == (1, 1)
+    with Session(engine) as session:
+        assert session.exec(select(TodoTree.ancestor).where(TodoTree.descendant == sub.id)).all() == [second.id]
+    assert {change.id for change in undone.changes if change.op == "insert"} == {first.id, second.id, sub.id}
+
+
+# Rows someone else changed since the entry are left alone and reported
+def test_undo_skips_rows_changed_since():
+    mine, theirs = add(
+        Todo(text="mine", list_id=DEFAULT_LIST_ID),
+        Todo(text="theirs", list_id=DEFAULT_LIST_ID),
+    )
+    with Session(engine) as session:
+        old = journal.before(session, ["text"], [mine.id, theirs.id])
+        versions = {todo.id: services.update_todo(session, todo.id, todo.version, {"text": "edited"}) for todo in (mine, theirs)}
+        entry_id = journal.record(
+            session, DEFAULT_LIST_ID, "update", journal.updates(versions, old, dict.fromkeys(versions, {"text": "edited"}))
+        )
+        session.commit()
+    with Session(engine) as session:
+        services.update_todo(session, theirs.id, versions[theirs.id], {"text": "changed again"})
+        session.commit()
+    with Session(engine) as session:
+        undone = journal.revert(session, entry_id)
+        session.commit()
+    assert undone.conflicts == [theirs.id]
+    assert reload(Todo, mine.id).text == "mine"
+    assert reload(Todo, theirs.id).text == "changed again"
+    assert [change.id for change in undone.changes] == [mine.id]
+
+
+# An entry whose rows all changed since writes nothing and journals nothing
+def test_undo_with_only_conflicts():
+    todo, = add(Todo(text="before", list_id=DEFAULT_LIST_ID))
+    with Session(engine) as session:
+        entry_id = journaled_update(session, todo, {"text": "after"})
+        services.update_todo(session, todo.id, todo.version + 1, {"text": "later"})
+        session.commit()
+    with Session(engine) as session:
+        undone = journal.revert(session, entry_id)
+        session.commit()
+    assert (undone.entry_id, undone.changes, undone.conflicts) == (None, [], [todo.id])
+
+
+# Old entries are folded into one snapshot of the list's rows; newer ones
+# stay, and compacting again replaces the snapshot
+def test_compact_list_into_snapshot():
+    todo, = add(Todo(text="before", list_id=DEFAULT_LIST_ID))
+    with Session(engine) as session:
+        old_id = journaled_update(session, todo, {"text": "after"})
+        session.get(JournalEntry, old_id).created_at -= timedelta(days=30)
+        session.commit()
+    todo = reload(Todo, todo.id)
+    with Session(engine) as session:
+        new_id = journaled_update(session, todo, {"text": "latest"})
+        session.commit()
+    cutoff = services.utcnow() - timedelta(days=7)
+    with Session(engine) as session:
+        removed = journal.compact_list(session, DEFAULT_LIST_ID, cutoff)
+        session.commit()
+    assert removed == 1
+    assert reload(JournalEntry, old_id) is None
+    assert reload(JournalEntry, new_id) is not None
+    with Session(engine) as session:
+        snapshot, = session.exec(select(JournalSnapshot)).all()
+    assert snapshot.upto == new_id
+    assert [(row["id"], row["text"]) for row in snapshot.rows] == [(todo.id, "latest")]
+    with Session(engine) as session:
+        assert journal.compact_list(session, DEFAULT_LIST_ID, cutoff) == 0
+        session.commit()
+    with Session(engine) as session:
+        assert len(session.exec(select(JournalSnapshot)).all()) == 1
+    with Session(engine) as session:
+        assert journal.revert(session, old_id) is None
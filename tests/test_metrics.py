@@ -0,0 +1,32 @@
+import asyncio
+import reflex as rx
+from reflex.event import Event
+from todo_app import metrics
+from todo_app.state import State
+
+
+# Run preprocess for a State handler and return the record it opened
+def preprocess(state, handler: str):
+    async def run():
+        await metrics.MetricsMiddleware().preprocess(None, state, Event(token="a", name=f"{State.get_full_name()}.{handler}"))
+        return metrics._current.get()
+
+    return asyncio.run(run())
+
+
+# Regular handlers are timed; background ones never reach postprocess, so
+# they aren't
+def test_times_regular_handlers_only():
+    root = rx.State(_reflex_internal_init=True)
+    assert preprocess(root, "on_mount").handler == "on_mount"
+    assert preprocess(root, "follow_changes") is None
+    assert preprocess(root, "rebalance_orders") is None
+
+
+# When the handler can't be looked up, the event just isn't timed
+def test_lookup_failure_skips_timing(monkeypatch):
+    def broken(self, event):
+        raise AttributeError("changed in a newer Reflex")
+
+    monkeypatch.setattr(rx.State, "_get_event_handler", broken)
+    assert preprocess(rx.State(_reflex_internal_init=True), "on_mount") is None
@@ -0,0 +1,111 @@
+import asyncio
+from sqlmodel import Session, select
+from conftest import add, call, engine, session_state
+from todo_app.models import DEFAULT_LIST_ID, Todo
+from todo_app.ordering import GAP, MIN_GAP, _stable_indices, key_between, plan_reorder, rebalance, too_dense
+from todo_app.state import State
+
+
+# Keys 0, 1, 2, ... for ids 1, 2, 3, ...
+def evenly(count: int) -> dict[int, float]:
+    return {todo_id: float(todo_id - 1) for todo_id in range(1, count + 1)}
+
+
+# The ids in the order their keys (after `changes`) sort them
+def sorted_ids(current: dict[int, float], changes: dict[int, float]) -> list[int]:
+    keys = {**current, **changes}
+    return sorted(keys, key=keys.get)
+
+
+def test_key_between():
+    assert key_between(None, None) == 0.0
+    assert key_between(None, 3.0) == 3.0 - GAP
+    assert key_between(3.0, None) == 3.0 + GAP
+    assert key_between(1.0, 2.0) == 1.5
+
+
+def test_stable_indices_is_a_longest_increasing_run():
+    assert _stable_indices([]) == set()
+    assert _stable_indices([0, 1, 2]) == {0, 1, 2}
+    assert len(_stable_indices([2, 1, 0])) == 1
+    assert _stable_indices([3, 0, 1, 2]) == {1, 2, 3}
+    assert _stable_indices([0, 4, 1, 2, 3]) == {0, 2, 3, 4}
+
+
+# The order stays as it is: nothing is written
+def test_plan_unchanged():
+    assert plan_reorder([1, 2, 3], evenly(3)) == ({}, False)
+
+
+# Dragging one item anywhere writes that one row only
+def test_plan_single_moves():
+    current = evenly(5)
+    for ids in ([5, 1, 2, 3, 4], [2, 3, 4, 5, 1], [1, 4, 2, 3, 5]):
+        changes, dense = plan_reorder(ids, current)
+        assert len(changes) == 1
+        assert not dense
+        assert sorted_ids(current, changes) == ids
+
+
+# Reversing a list keeps one row and moves every other one
+def test_plan_reversal():
+    current = evenly(6)
+    ids = [6, 5, 4, 3, 2, 1]
+    changes, dense = plan_reorder(ids, current)
+    assert len(changes) == 5
+    assert not dense
+    assert sorted_ids(current, changes) == ids
+
+
+# A run of moved items squeezed between neighbours too close together asks
+# for a rebalance
+def test_plan_too_dense():
+    current = {1: 0.0, 2: MIN_GAP / 2, 3: 1.0}
+    changes, dense = plan_reorder([1, 3, 2], current)
+    assert dense
+    assert too_dense(0.0, MIN_GAP / 4)
+    assert not too_dense(0.0, 1.0)
+    assert not too_dense(None, 0.0)
+
+
+# Rebalancing renumbers the list evenly in the caller's transaction: it
+# keeps the order, and writes nothing the caller doesn't commit
+def test_rebalance_in_callers_transaction():
+    todos = add(*(Todo(text=str(n), list_id=DEFAULT_LIST_ID, order=n * MIN_GAP / 10) for n in (3, 1, 2)))
+    with Session(engine) as session:
+        rebalance(session, DEFAULT_LIST_ID)
+        session.rollback()
+    with Session(engine) as session:
+        assert [todo.order for todo in session.exec(select(Todo).order_by(Todo.id)).all()] == [todo.order for todo in todos]
+    with Session(engine) as session:
+        rebalance(session, DEFAULT_LIST_ID)
+        session.commit()
+    with Session(engine) as session:
+        rows = session.exec(select(Todo).order_by(Todo.order)).all()
+    assert [(row.text, row.order) for row in rows] == [("1", 0.0), ("2", GAP), ("3", 2 * GAP)]
+
+
+# Moves through State keep writing one row each, until the keys run out of
+# room and the handler asks for a rebalance
+def test_moves_until_rebalance():
+    todos = list(add(*(Todo(text=str(n), list_id=DEFAULT_LIST_ID, order=float(n)) for n in range(3))))
+
+    async def run():
+        state = session_state()
+        await call(state, "on_mount")
+        moves, followup = 0, None
+        while followup is None:
+            # Keep dropping the last task between the first two
+            followup = await call(state, "reorder_todos", [todos[0].id, todos[2].id, todos[1].id])
+            todos[1], todos[2] = todos[2], todos[1]
+            moves += 1
+        return state, moves, followup
+
+    state, moves, followup = asyncio.run(run())
+    assert followup is State.rebalance_orders
+    # Each move halved the gap, so it took about as many moves as a float has bits
+    assert 20 < moves < 60
+    assert [row.id for row in state.todos] == [todo.id for todo in todos]
+    with Session(engine) as session:
+        versions = {todo.id: todo.version for todo in session.exec(select(Todo)).all()}
+    assert versions[todos[0].id] == 1
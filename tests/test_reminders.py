@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+from conftest import add, reload
+from todo_app import reminders
+from todo_app.models import DEFAULT_LIST_ID, Todo
+from todo_app.reminders import FIRE_BATCH, ManualClock, ReminderScheduler
+
+START = datetime(2030, 1, 1, 9, 0)
+
+
+# A todo with a reminder `seconds` after START
+def reminded(text: str, seconds: float) -> Todo:
+    return Todo(text=text, list_id=DEFAULT_LIST_ID, remind_at=START + timedelta(seconds=seconds))
+
+
+# Set a todo's reminder in the database, the way a session saving it does
+async def set_reminder(scheduler: ReminderScheduler, todo_id: int, remind_at: datetime | None):
+    async with reminders.asession() as session:
+        todo = await session.get(Todo, todo_id)
+        todo.remind_at = remind_at
+        todo.version += 1
+        await session.commit()
+    scheduler.schedule(todo_id, remind_at)
+
+
+# Reminders fire once due, earliest first, and the lag is how late each went out
+def test_fires_in_order_when_due():
+    late, early, later = add(reminded("late", 10), reminded("early", 5), reminded("later", 20))
+
+    async def run():
+        clock = ManualClock(START)
+        scheduler = ReminderScheduler(clock)
+        before = await scheduler.fire_due()
+        clock.advance(15)
+        fired = await scheduler.fire_due()
+        return scheduler, before, fired
+
+    scheduler, before, fired = asyncio.run(run())
+    assert before == []
+    assert [(change.id, change.op, change.fields["text"]) for change in fired] == [
+        (early.id, "remind", "early"), (late.id, "remind", "late"),
+    ]
+    assert list(scheduler.lag_seconds) == [10.0, 5.0]
+    assert scheduler.fired_total == 2
+    assert reload(Todo, early.id).remind_at is None
+    assert reload(Todo, early.id).version == early.version + 1
+    assert reload(Todo, later.id).remind_at == later.remind_at
+
+
+# A reminder set after the window was loaded fires from the heap; one that
+# was moved fires at its new time only, and one that was removed not at all
+def test_schedule_and_reschedule():
+    moved, removed = add(reminded("moved", 20), reminded("removed", 25))
+    added, = add(Todo(text="added", list_id=DEFAULT_LIST_ID))
+
+    async def run():
+        clock = ManualClock(START)
+        scheduler = ReminderScheduler(clock)
+        await scheduler.fire_due()
+        await set_reminder(scheduler, added.id, START + timedelta(seconds=30))
+        await set_reminder(scheduler, moved.id, START + timedelta(seconds=40))
+        await set_reminder(scheduler, removed.id, None)
+        clock.advance(35)
+        first = await scheduler.fire_due()
+        clock.advance(10)
+        second = await scheduler.fire_due()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [change.id for change in first] == [added.id]
+    assert [change.id for change in second] == [moved.id]
+
+
+# Reminders set beyond the loaded window wait for theirs to be loaded
+def test_loads_the_next_window():
+    far, = add(reminded("far", 2 * 3600))
+
+    async def run():
+        clock = ManualClock(START)
+        scheduler = ReminderScheduler(clock)
+        await scheduler.fire_due()
+        scheduler.schedule(far.id, far.remind_at)
+        skipped = len(scheduler._heap)
+        clock.advance(2 * 3600 + 1)
+        return skipped, await scheduler.fire_due()
+
+    skipped, fired = asyncio.run(run())
+    assert skipped == 0
+    assert [change.id for change in fired] == [far.id]
+
+
+# Many reminders due together go out FIRE_BATCH per transaction
+def test_fires_in_batches():
+    todos = add(*(reminded(f"todo {n}", 1) for n in range(2 * FIRE_BATCH + 5)))
+
+    async def run():
+        clock = ManualClock(START)
+        scheduler = ReminderScheduler(clock)
+        batches = []
+        fire = scheduler._fire
+
+        async def counted(due):
+            batches.append(len(due))
+            return await fire(due)
+
+        scheduler._fire = counted
+        clock.advance(1)
+        return batches, await scheduler.fire_due()
+
+    batches, fired = asyncio.run(run())
+    assert batches == [FIRE_BATCH, FIRE_BATCH, 5]
+    assert [change.id for change in fired] == [todo.id for todo in todos]
+
+
+# A reminder changed after it was loaded, without telling the scheduler
+# (another process did it), isn't cleared or sent at its old time
+def test_skips_reminders_changed_since_loaded():
+    changed, = add(reminded("changed", 5))
+
+    async def run():
+        clock = ManualClock(START)
+        scheduler = ReminderScheduler(clock)
+        await scheduler.fire_due()
+        async with reminders.asession() as session:
+            todo = await session.get(Todo, changed.id)
+            todo.remind_at = START + timedelta(hours=3)
+            await session.commit()
+        clock.advance(10)
+        return scheduler, await scheduler.fire_due()
+
+    scheduler, fired = asyncio.run(run())
+    assert fired == []
+    assert scheduler.fired_total == 0
+    assert list(scheduler.lag_seconds) == []
+    assert reload(Todo, changed.id).remind_at == START + timedelta(hours=3)
@@ -0,0 +1,124 @@
+import io
+import pytest
+from sqlmodel import Session, select
+from conftest import add, engine, reload
+from todo_app import services, transfer
+from todo_app.models import DEFAULT_LIST_ID, Todo, TodoList, TodoTree
+
+
+# Add a subtask under `parent` the way State does: the row, then its
+# closure rows and its ancestors' rollups
+def add_subtask(parent: Todo, text: str, completed: bool = False) -> Todo:
+    todo, = add(Todo(text=text, list_id=parent.list_id, parent_id=parent.id, completed=completed))
+    with Session(engine) as session:
+        services.attach_subtasks(session, [(todo.id, parent.id)])
+        session.commit()
+    return todo
+
+
+# (subtasks, subtasks_done) of each todo, by text
+def rollups(*todos: Todo) -> dict[str, tuple[int, int]]:
+    return {todo.text: (row.subtasks, row.subtasks_done) for todo in todos if (row := reload(Todo, todo.id))}
+
+
+# A
+# ├── B
+# │   └── C
+# │       └── E (done)
+# └── D
+def tree():
+    a, = add(Todo(text="A", list_id=DEFAULT_LIST_ID))
+    b = add_subtask(a, "B")
+    c = add_subtask(b, "C")
+    e = add_subtask(c, "E", completed=True)
+    d = add_subtask(a, "D")
+    return a, b, c, d, e
+
+
+# Adding subtasks counts them, and the done ones, at every level above
+def test_rollups_after_adding():
+    a, b, c, d, e = tree()
+    assert rollups(a, b, c, d, e) == {"A": (4, 1), "B": (2, 1), "C": (1, 1), "D": (0, 0), "E": (0, 0)}
+
+
+# Completing or reopening one subtask moves the done count of every
+# ancestor, and only theirs
+def test_rollups_after_completing_and_reopening():
+    a, b, c, d, e = tree()
+    with Session(engine) as session:
+        services.update_todo(session, c.id, c.version, {"completed": True})
+        services.rollup_completed(session, {c.id: True})
+        session.commit()
+    assert rollups(a, b, c, d) == {"A": (4, 2), "B": (2, 2), "C": (1, 1), "D": (0, 0)}
+    with Session(engine) as session:
+        services.update_todo(session, e.id, e.version, {"completed": False})
+        services.rollup_completed(session, {e.id: False})
+        session.commit()
+    assert rollups(a, b, c) == {"A": (4, 1), "B": (2, 1), "C": (1, 0)}
+
+
+# Completing a subtree flips only the rows that weren't done yet, and the
+# counts above and inside it follow; reopening it undoes that
+def test_rollups_after_completing_a_subtree():
+    a, b, c, d, e = tree()
+    with Session(engine) as session:
+        changed, _ = services.complete_subtree(session, b.id, True, b.version)
+        session.commit()
+    assert set(changed) == {b.id, c.id}
+    assert rollups(a, b, c, d, e) == {"A": (4, 3), "B": (2, 2), "C": (1, 1), "D": (0, 0), "E": (0, 0)}
+    with Session(engine) as session:
+        changed, _ = services.complete_subtree(session, b.id, False)
+        session.commit()
+    assert set(changed) == {b.id, c.id, e.id}
+    assert rollups(a, b, c) == {"A": (4, 0), "B": (2, 0), "C": (1, 0)}
+
+
+# A subtree written at a stale version isn't touched
+def test_complete_subtree_conflict():
+    a, b, c, d, e = tree()
+    with Session(engine) as session:
+        changed, found = services.complete_subtree(session, b.id, True, b.version + 1)
+        session.commit()
+    assert (changed, found) == ({}, [])
+    assert rollups(a) == {"A": (4, 1)}
+
+
+# Deleting a subtask takes it and everything under it off every count above
+def test_rollups_after_deleting():
+    a, b, c, d, e = tree()
+    with Session(engine) as session:
+        gone, found = services.delete_todos(session, DEFAULT_LIST_ID, {c.id: c.version})
+        session.commit()
+    assert {row.id for row in gone} == {c.id, e.id}
+    assert {row.id: (row.subtasks, row.subtasks_done) for row in found} == {a.id: (2, 0), b.id: (0, 0)}
+    assert rollups(a, b, d) == {"A": (2, 0), "B": (0, 0), "D": (0, 0)}
+    with Session(engine) as session:
+        assert session.exec(select(TodoTree).where(TodoTree.descendant.in_([c.id, e.id]))).all() == []
+
+
+# An exported list imports into another list with the same hierarchy and rollups
+def test_export_import_keeps_subtasks():
+    a, b, c, d, e = tree()
+    other, = add(TodoList(name="Copy"))
+    for fmt in transfer.FORMATS:
+        with Session(engine) as session:
+            exported = "".join(transfer.export_todos(session, DEFAULT_LIST_ID, fmt))
+            count = transfer.import_todos(session, other.id, transfer.read_records(io.StringIO(exported), fmt))
+        assert count == 5
+        with Session(engine) as session:
+            rows = session.exec(select(Todo).where(Todo.list_id == other.id).order_by(Todo.id.desc()).limit(5)).all()
+        by_id = {row.id: row for row in rows}
+        copied = {
+            row.text: (by_id[row.parent_id].text if row.parent_id else None, row.subtasks, row.subtasks_done)
+            for row in rows
+        }
+        assert copied == {
+            "A": (None, 4, 1), "B": ("A", 2, 1), "C": ("B", 1, 1), "D": ("A", 0, 0), "E": ("C", 0, 0),
+        }
+
+
+# A subtask has to come after the task it is under
+def test_import_rejects_parent_after_subtask():
+    records = io.StringIO('{"text": "sub", "id": 2, "parent_id": 1}\n{"text": "top", "id": 1}\n')
+    with Session(engine) as session, pytest.raises(transfer.TransferError, match="doesn't come before it"):
+        transfer.import_todos(session, DEFAULT_LIST_ID, transfer.read_records(records, "ndjson"))
@@ -0,0 +1,73 @@
+import hashlib
+import io
+import pytest
+from PIL import Image
+from starlette.testclient import TestClient
+from todo_app import thumbnails
+from todo_app.api import FALLBACK, IMMUTABLE, api
+from todo_app.thumbnails import original_path, variant_path
+
+
+# Store an image file under its content hash, the way uploads do
+def stored(content: bytes, extension: str = "png") -> str:
+    name = f"{hashlib.sha256(content).hexdigest()}.{extension}"
+    path = original_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return name
+
+
+def png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client():
+    with TestClient(api) as client:
+        yield client
+
+
+# A variant is made on first request and cached for good
+def test_serves_variant(client):
+    name = stored(png(800, 600))
+    response = client.get(f"/thumbs/200/images/{name}")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["etag"] == f'"{name}.w200"'
+    assert Image.open(io.BytesIO(response.content)).size == (200, 150)
+    assert variant_path(name, 200).exists()
+    again = client.get(f"/thumbs/200/images/{name}", headers={"if-none-match": response.headers["etag"]})
+    assert again.status_code == 304
+
+
+# Without Pillow the original goes out, and not as if it were the variant
+def test_without_pillow_serves_original_briefly(client, monkeypatch):
+    monkeypatch.setattr(thumbnails, "can_resize", lambda: False)
+    content = png(300, 300)
+    name = stored(content)
+    response = client.get(f"/thumbs/200/images/{name}")
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["cache-control"] == FALLBACK
+    assert response.headers.get("etag") != f'"{name}.w200"'
+
+
+# An image that can't be resized falls back to the original too, and isn't
+# resized again on every request
+def test_failed_resize_serves_original_and_is_remembered(client, monkeypatch):
+    content = b"not really a png"
+    name = stored(content)
+    response = client.get(f"/thumbs/200/images/{name}")
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["cache-control"] == FALLBACK
+    assert variant_path(name, 200) in thumbnails._failed
+    monkeypatch.setattr(thumbnails, "_executor", lambda: pytest.fail("resized again"))
+    assert client.get(f"/thumbs/200/images/{name}").headers["cache-control"] == FALLBACK
+
+
+def test_unknown_images_are_not_found(client):
+    assert client.get(f"/thumbs/200/images/{'0' * 64}.png").status_code == 404
+    assert client.get("/thumbs/123/images/x.png").status_code == 404
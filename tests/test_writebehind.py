@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+import rxconfig
+from conftest import add, call, reload, session_state
+from todo_app import state, writebehind
+from todo_app.models import DEFAULT_LIST_ID, Todo
+from todo_app.state import CONFLICT_MESSAGE
+from todo_app.writebehind import WriteBehindQueue
+
+
+# Stage edits in write-behind mode for every test here, on a queue that
+# doesn't remember earlier tests' writes
+@pytest.fixture(autouse=True)
+def write_behind(monkeypatch):
+    monkeypatch.setattr(rxconfig, "write_mode", "write_behind")
+    monkeypatch.setattr(state, "writes", WriteBehindQueue(rxconfig.write_behind_ms))
+
+
+# The write-behind timer writes a staged edit before the user saves: the
+# save must not conflict with it, and must keep the edits that weren't staged
+def test_save_after_timer_flush():
+    todo, = add(Todo(text="before", list_id=DEFAULT_LIST_ID))
+
+    async def run():
+        tab = session_state("a")
+        await call(tab, "view_details", todo.id)
+        await call(tab, "set_selected_text", "typed")
+        await call(tab, "set_selected_due", "2030-01-01T10:00")
+        await asyncio.sleep(0.3)
+        await call(tab, "save_selected_todo")
+        return tab
+
+    tab = asyncio.run(run())
+    assert tab.error_message != CONFLICT_MESSAGE
+    assert tab.selected_todo is None
+    saved = reload(Todo, todo.id)
+    assert saved.text == "typed"
+    assert saved.due_at is not None
+
+
+# Another session's edit written by the timer is not this session's to
+# catch up with: saving over it must conflict, not overwrite it
+def test_save_after_other_sessions_flush():
+    todo, = add(Todo(text="shared", list_id=DEFAULT_LIST_ID))
+
+    async def run():
+        first, second = session_state("a"), session_state("b")
+        await call(first, "view_details", todo.id)
+        await call(second, "view_details", todo.id)
+        await call(second, "set_selected_text", "theirs")
+        await asyncio.sleep(0.3)
+        await call(first, "set_selected_due", "2030-01-01T10:00")
+        await call(first, "save_selected_todo")
+        return first
+
+    first = asyncio.run(run())
+    assert first.error_message == CONFLICT_MESSAGE
+    saved = reload(Todo, todo.id)
+    assert saved.text == "theirs"
+    assert saved.due_at is None
+
+
+# A timer flush that fails is tried again on its own, with a growing wait,
+# without anything else being staged
+def test_failed_flush_is_retried(monkeypatch):
+    todo, = add(Todo(text="before", list_id=DEFAULT_LIST_ID))
+    failures = []
+    asession = writebehind.asession
+
+    def flaky():
+        if len(failures) < 2:
+            failures.append(True)
+            raise ConnectionError("database is down")
+        return asession()
+
+    monkeypatch.setattr(writebehind, "asession", flaky)
+    monkeypatch.setattr(writebehind, "RETRY_SECONDS", 0.05)
+
+    async def run():
+        queue = WriteBehindQueue(10)
+        queue.stage("a", todo.id, text="typed")
+        await asyncio.sleep(0.1)
+        retry = queue._retry
+        await asyncio.sleep(0.3)
+        return retry, queue
+
+    retry, queue = asyncio.run(run())
+    assert len(failures) == 2
+    assert retry == 0.1
+    assert queue._retry == 0.0
+    assert queue.pending(todo.id) == {}
+    assert reload(Todo, todo.id).text == "typed"
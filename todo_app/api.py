@@ -0,0 +1,141 @@
+import asyncio
+import io
+import math
+import tempfile
+import reflex as rx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from . import changefeed, metrics, transfer
+from .cache import snapshots
+from .db import asession
+from .models import DEFAULT_LIST_ID
+from .thumbnails import IMAGE_NAME, VARIANT_WIDTHS, ensure_variant, original_path
+
+# Import bodies up to this size are buffered in memory, bigger ones on disk
+SPOOL_BYTES = 8 * 1024 * 1024
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Variants are named after the image's content hash, so they never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+# The original served in place of a variant that isn't there (yet)
+FALLBACK = "public, max-age=300"
+
+# Plain HTTP routes served next to the Reflex app (see todo_app.py)
+
+
+# Hit/miss counters of the shared todo list cache
+async def cache_stats(request: Request):
+    return JSONResponse(snapshots.stats())
+
+
+# Handler timings and SQL counts in Prometheus text format
+async def metrics_endpoint(request: Request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# A threshold_ms parameter as milliseconds (None when not given). Raises
+# ValueError unless it is a finite number, zero or more.
+def _threshold(value: str | None) -> float | None:
+    if not value:
+        return None
+    threshold = float(value)
+    if not 0 <= threshold < math.inf:
+        raise ValueError(value)
+    return threshold
+
+
+# Switch the slow-handler log on or off, e.g. POST /metrics/slow_log?enabled=1&threshold_ms=100
+async def slow_log(request: Request):
+    if request.method == "POST":
+        try:
+            threshold = _threshold(request.query_params.get("threshold_ms"))
+        except ValueError:
+            return JSONResponse({"error": "threshold_ms must be a number of milliseconds."}, status_code=400)
+        metrics.set_slow_log(request.query_params.get("enabled", "1") in ("1", "true", "on"), threshold)
+    return JSONResponse(metrics.slow_log)
+
+
+# A resized variant of an uploaded image, made on first request if missing
+async def thumbnail(request: Request):
+    name = request.path_params["name"]
+    width = request.path_params["width"]
+    if width not in VARIANT_WIDTHS or not IMAGE_NAME.match(name) or not original_path(name).exists():
+        return Response(status_code=404)
+    etag = f'"{name}.w{width}"'
+    headers = {"Cache-Control": IMMUTABLE, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    variant = await ensure_variant(name, width)
+    if variant is None:
+        # Not cached for long, so browsers pick up the variant once there is one
+        return FileResponse(original_path(name), headers={"Cache-Control": FALLBACK})
+    return FileResponse(variant, headers=headers)
+
+
+# The list a request is about, from ?list=<id>
+def _list_id(request: Request) -> int | None:
+    value = request.query_params.get("list", str(DEFAULT_LIST_ID))
+    return int(value) if value.isdigit() else None
+
+
+# Read a spooled import body and write its todos (blocking; runs in a thread)
+def _import_file(body, list_id: int, fmt: str) -> int:
+    with rx.session() as session:
+        records = transfer.read_records(io.TextIOWrapper(body, encoding="utf-8", newline=""), fmt)
+        return transfer.import_todos(session, list_id, records)
+
+
+# Append todos from a CSV or NDJSON request body to a list, e.g.
+# curl --data-binary @todos.ndjson 'localhost:8000/todos/import?format=ndjson&list=2'
+async def import_todos(request: Request):
+    fmt = request.query_params.get("format") or (
+        "ndjson" if "ndjson" in request.headers.get("content-type", "") else "csv"
+    )
+    list_id = _list_id(request)
+    if fmt not in transfer.FORMATS or list_id is None:
+        return JSONResponse({"error": "Unknown format or list."}, status_code=400)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as body:
+        async for chunk in request.stream():
+            # Past SPOOL_BYTES this writes to disk, so keep it off the event loop
+            await asyncio.to_thread(body.write, chunk)
+        body.seek(0)
+        try:
+            count = await asyncio.to_thread(_import_file, body, list_id, fmt)
+        except (transfer.TransferError, UnicodeDecodeError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        finally:
+            snapshots.bump(list_id)
+            # Sessions showing the list reload it
+            async with asession() as session:
+                await changefeed.commit(session, [changefeed.resync(list_id)])
+    return JSONResponse({"imported": count})
+
+
+# Every todo on a list as CSV or NDJSON, streamed a page at a time
+async def export_todos(request: Request):
+    fmt = request.query_params.get("format", "csv")
+    list_id = _list_id(request)
+    if fmt not in transfer.FORMATS or list_id is None:
+        return JSONResponse({"error": "Unknown format or list."}, status_code=400)
+
+    def stream():
+        with rx.session() as session:
+            yield from transfer.export_todos(session, list_id, fmt)
+
+    return StreamingResponse(
+        stream(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="todos.{fmt}"'},
+    )
+
+
+api = Starlette(routes=[
+    Route("/cache/stats", cache_stats),
+    Route("/metrics", metrics_endpoint),
+    Route("/metrics/slow_log", slow_log, methods=["GET", "POST"]),
+    Route("/thumbs/{width:int}/images/{name}", thumbnail),
+    Route("/todos/import", import_todos, methods=["POST"]),
+    Route("/todos/export", export_todos),
+])
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+from .models import ArchivedTodo, Todo
+from .services import chunked, delete_subtrees, utcnow
+from . import changefeed
+from .cache import snapshots
+from .changefeed import deleted
+from .db import asession
+from sqlmodel import Session, insert, select, update
+import rxconfig
+
+# Hot/cold split for completed todos. The index page only reads the todo
+# table, so completed tasks left there slow down every list, however long
+# ago they were done. The archiver moves completed todos older than
+# archive_after_days into the archivedtodo table. Each batch of
+# archive_batch rows is its own short transaction, so live edits never
+# wait long on it. Archived tasks are still shown on demand by the "show
+# archived" view (see State.toggle_archived).
+#
+# A task with subtasks is archived together with all of them, once it is
+# old enough and every subtask is completed too. Subtasks are never
+# archived on their own, so no task is left pointing at an archived parent.
+# The archive keeps them as a flat list.
+#
+# The app runs the archiver in the background every archive_interval_s
+# seconds. It can also be run by hand:
+#
+#     python -m todo_app.archive --days 30
+
+# Columns copied from todo to archivedtodo
+COLUMNS = ["id", "text", "description", "image", "list_id", "completed_at"]
+
+# Todos this process moved to the archive (served at /metrics)
+archived_total = 0
+
+
+# Start the clock on completed todos that have no completed_at yet (e.g.
+# ones that came in through an import)
+def stamp_completed(session: Session):
+    session.execute(
+        update(Todo)
+        .where(Todo.completed == True, Todo.completed_at == None)  # noqa: E711, E712
+        .values(completed_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Move up to `limit` top-level todos completed before `cutoff`, with their
+# subtasks, to the archive, oldest first. Returns (id, list_id) of the todos
+# moved. On Postgres the rows are locked as they are picked and rows locked
+# by someone else are skipped, so several app processes can archive at
+# once without waiting on each other. Completing or reopening a subtask
+# updates its top-level task's rollups, so it waits on that lock too.
+def archive_batch(session: Session, cutoff: datetime, limit: int) -> list[tuple[int, int]]:
+    due = (
+        Todo.completed == True, Todo.completed_at < cutoff,  # noqa: E712
+        Todo.parent_id == None, Todo.subtasks_done == Todo.subtasks,  # noqa: E711
+    )
+    ids = session.exec(
+        select(Todo.id).where(*due).order_by(Todo.completed_at).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+    archived_at = utcnow()
+    moved = []
+    for chunk in chunked(ids):
+        # Check again: a todo may have been reopened since it was picked
+        chunk = session.exec(select(Todo.id).where(Todo.id.in_(chunk), *due)).all()
+        rows, _ = delete_subtrees(session, chunk)
+        if rows:
+            session.execute(insert(ArchivedTodo), [
+                {**{name: getattr(row, name) for name in COLUMNS}, "archived_at": archived_at} for row in rows
+            ])
+        moved += [(row.id, row.list_id) for row in rows]
+    return moved
+
+
+# Archive every todo completed more than `days` days ago (default:
+# archive_after_days), a batch at a time. Returns how many were moved.
+async def archive_once(days: float | None = None) -> int:
+    global archived_total
+    cutoff = utcnow() - timedelta(days=rxconfig.archive_after_days if days is None else days)
+    async with asession() as session:
+        await session.run_sync(stamp_completed)
+        await session.commit()
+    moved = 0
+    while True:
+        async with asession() as session:
+            rows = await session.run_sync(archive_batch, cutoff, rxconfig.archive_batch)
+            # Open sessions drop the archived rows from their lists
+            await changefeed.commit(session, [deleted(list_id, todo_id) for todo_id, list_id in rows])
+        for list_id in {list_id for _, list_id in rows}:
+            snapshots.bump(list_id)
+        moved += len(rows)
+        archived_total += len(rows)
+        if len(rows) < rxconfig.archive_batch:
+            return moved
+
+
+# Archive in the background for as long as the app runs
+async def run():
+    if not rxconfig.archive_after_days:
+        return
+    while True:
+        try:
+            moved = await archive_once()
+            if moved:
+                logging.info("Archived %s completed todos", moved)
+        except Exception:
+            logging.exception("Archiving failed")
+        await asyncio.sleep(rxconfig.archive_interval_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed todos to the archive.")
+    parser.add_argument("--days", type=float, help="archive todos completed more than this many days ago")
+    args = parser.parse_args()
+    print(f"Archived {asyncio.run(archive_once(args.days))} todos.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+
+# A read-through cache of todo list pages, shared by every browser session in
+# this process. Without it, each session runs the same query on mount and
+# keeps its own copy of the result.
+#
+# Entries are keyed by a version number that State bumps after every write,
+# so a page cached before the write is never served afterwards. Versions are
+# kept per partition, so later on one list's writes don't throw away
+# another list's pages. The cache only knows about writes made in this
+# process.
+#
+# It is bounded by the rows it holds as well as by entries, since one
+# snapshot can be a whole long list: the least recently used snapshots go
+# first, and a snapshot bigger than max_rows // OVERSIZE_SHARE isn't kept
+# at all, so one huge list can't push out everybody else's pages.
+OVERSIZE_SHARE = 8
+
+
+class SnapshotCache:
+    def __init__(self, max_entries: int = 256, max_rows: int = 50_000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._versions: dict[Hashable, int] = {}
+        self._changed: dict[Hashable, float] = {}
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+        # Rows (items) in all the cached snapshots together
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    # Current version of a partition
+    def version(self, partition: Hashable = None) -> int:
+        with self._lock:
+            return self._versions.get(partition, 0)
+
+    # Mark a partition as changed: every snapshot taken before now is stale
+    def bump(self, partition: Hashable = None):
+        with self._lock:
+            self._versions[partition] = self._versions.get(partition, 0) + 1
+            self._changed[partition] = time.monotonic()
+            for entry in [entry for entry in self._entries if entry[0] == partition]:
+                self._rows -= len(self._entries.pop(entry))
+
+    # Seconds since a partition last changed (infinite if it hasn't since
+    # the process started)
+    def age(self, partition: Hashable = None) -> float:
+        with self._lock:
+            changed = self._changed.get(partition)
+        return time.monotonic() - changed if changed is not None else float("inf")
+
+    # Return the snapshot for `key`, awaiting `load()` to build it on a miss.
+    # Snapshots are shared between sessions, so callers must not mutate them.
+    async def get(self, key: Hashable, load: Callable[[], Awaitable], partition: Hashable = None) -> tuple:
+        with self._lock:
+            version = self._versions.get(partition, 0)
+            entry = (partition, version, key)
+            if entry in self._entries:
+                self._entries.move_to_end(entry)
+                self.hits += 1
+                return self._entries[entry]
+            self.misses += 1
+        # Load outside the lock so a slow query doesn't block other sessions
+        value = tuple(await load())
+        with self._lock:
+            # Don't keep it if a write landed while we were loading, or if
+            # it is too big to share the cache
+            fits = len(value) <= self.max_rows // OVERSIZE_SHARE
+            if fits and self._versions.get(partition, 0) == version and entry not in self._entries:
+                self._entries[entry] = value
+                self._rows += len(value)
+                while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                    self._rows -= len(self._entries.popitem(last=False)[1])
+        return value
+
+    # Drop every cached snapshot (counters are kept)
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    # Hit/miss counters and size, for sizing the cache
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "rows": self._rows,
+                "max_rows": self.max_rows,
+            }
+
+
+# The one cache every session in this process shares
+snapshots = SnapshotCache()
@@ -0,0 +1,227 @@
+import asyncio
+import dataclasses
+import json
+import logging
+from collections import defaultdict
+from sqlmodel import text
+from .cache import snapshots
+from .db import async_db_url, get_async_engine
+from .models import Todo
+import rxconfig
+
+# Change feed that keeps every open session's list current without reloads.
+# Each write publishes compact Change events (which todo, what happened,
+# which fields changed, the row's new version). Every session following
+# that list applies them to its rows in place.
+#
+# The "local" broker only reaches sessions in this process. The "postgres"
+# broker sends changes with NOTIFY inside the writing transaction, so they
+# go out only if it commits, and every app process LISTENs for them.
+#
+# A follower that falls too far behind doesn't hold up writers: its queue
+# is replaced by a single "resync" change, and it reloads its list instead.
+
+CHANNEL = "todo_changes"
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7900
+# A commit touching more rows than this is sent as one resync
+MAX_CHANGES = 100
+# Seconds between reconnect attempts of the Postgres listener
+RETRY_SECONDS = 1.0
+
+
+# One change to one todo. op is "insert", "update", "delete", "rollup"
+# (new subtask counts) or "resync" (reload the whole list). version is the
+# row's version after the change, so a follower can skip changes older than
+# what it already shows. Rollups don't bump the version (they aren't an
+# edit of the task), so followers apply them in the order they arrive.
+@dataclasses.dataclass(frozen=True, slots=True)
+class Change:
+    list_id: int
+    id: int | None
+    op: str
+    fields: dict = dataclasses.field(default_factory=dict)
+    version: int = 0
+
+
+# A new todo, with the fields the list shows and the task it is under
+def inserted(todo: Todo) -> Change:
+    fields = {"text": todo.text, "completed": todo.completed, "order": todo.order, "parent_id": todo.parent_id}
+    return Change(todo.list_id, todo.id, "insert", fields, todo.version)
+
+
+# Some fields of a todo changed
+def updated(todo: Todo, *names: str) -> Change:
+    return Change(todo.list_id, todo.id, "update", {name: getattr(todo, name) for name in names}, todo.version)
+
+
+# A todo was deleted
+def deleted(list_id: int, todo_id: int) -> Change:
+    return Change(list_id, todo_id, "delete")
+
+
+# New subtask counts of some todos, from rows of (id, list_id, subtasks,
+# subtasks_done) as services returns them
+def rolled_up(rows) -> list[Change]:
+    return [
+        Change(row.list_id, row.id, "rollup", {"subtasks": row.subtasks, "subtasks_done": row.subtasks_done})
+        for row in rows
+    ]
+
+
+# Too much changed to describe; followers reload the list
+def resync(list_id: int) -> Change:
+    return Change(list_id, None, "resync")
+
+
+# Replace long runs of changes to a list with one resync
+def _compact(changes: list[Change]) -> list[Change]:
+    by_list = defaultdict(list)
+    for change in changes:
+        by_list[change.list_id].append(change)
+    compact = []
+    for list_id, items in by_list.items():
+        compact += [resync(list_id)] if len(items) > MAX_CHANGES else items
+    return compact
+
+
+# Changes as a NOTIFY payload
+def _encode(changes: list[Change]) -> str:
+    return json.dumps([dataclasses.astuple(change) for change in changes])
+
+
+# A session's queue of changes to one list
+class Subscription:
+    def __init__(self, broker: "LocalBroker", list_id: int, size: int):
+        self.broker = broker
+        self.list_id = list_id
+        self.queue: asyncio.Queue[Change] = asyncio.Queue(size)
+
+    # Queue a change without waiting. When the queue is full the follower
+    # is too slow to catch up change by change, so it gets a resync instead.
+    def offer(self, change: Change):
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(resync(self.list_id))
+            self.broker.overflows += 1
+
+    # Wait up to `timeout` seconds for changes; returns all that are queued
+    async def get(self, timeout: float) -> list[Change]:
+        try:
+            first = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        changes = [first]
+        while not self.queue.empty():
+            changes.append(self.queue.get_nowait())
+        return changes
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+# Delivers changes to the sessions in this process
+class LocalBroker:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.overflows = 0
+        self._subscribers: dict[int, set[Subscription]] = defaultdict(set)
+
+    # Start following the changes to a list
+    def subscribe(self, list_id: int) -> Subscription:
+        subscription = Subscription(self, list_id, self.queue_size)
+        self._subscribers[list_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers[subscription.list_id].discard(subscription)
+
+    # Called with the writing session before it commits
+    async def stage(self, session, changes: list[Change]):
+        pass
+
+    # Called once the write has committed
+    def committed(self, changes: list[Change]):
+        self.dispatch(changes)
+
+    # Hand changes to every follower of their list
+    def dispatch(self, changes: list[Change]):
+        for change in changes:
+            for subscription in list(self._subscribers.get(change.list_id, ())):
+                subscription.offer(change)
+
+
+# Sends changes with Postgres NOTIFY and delivers what LISTEN receives, so
+# sessions in every app process see every write
+class PostgresBroker(LocalBroker):
+    def __init__(self, queue_size: int):
+        super().__init__(queue_size)
+        self._listener: asyncio.Task | None = None
+
+    def subscribe(self, list_id: int) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return super().subscribe(list_id)
+
+    # NOTIFY is transactional: the changes go out when the session commits
+    async def stage(self, session, changes: list[Change]):
+        if not changes:
+            return
+        payload = _encode(changes)
+        if len(payload) > MAX_PAYLOAD:
+            payload = _encode([resync(list_id) for list_id in {change.list_id for change in changes}])
+        await session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+    # Delivery happens when the notification comes back through LISTEN
+    def committed(self, changes: list[Change]):
+        pass
+
+    def _on_notify(self, connection, pid, channel, payload):
+        changes = [Change(*fields) for fields in json.loads(payload)]
+        # Another process may have written: its pages in our cache are stale
+        for list_id in {change.list_id for change in changes}:
+            snapshots.bump(list_id)
+        self.dispatch(changes)
+
+    # Hold a connection that LISTENs, reconnecting when it drops
+    async def _listen(self):
+        while True:
+            try:
+                async with get_async_engine().connect() as connection:
+                    raw = (await connection.get_raw_connection()).driver_connection
+                    closed = asyncio.Event()
+                    raw.add_termination_listener(lambda _: closed.set())
+                    await raw.add_listener(CHANNEL, self._on_notify)
+                    await closed.wait()
+            except Exception:
+                logging.exception("Change feed listener failed")
+            # Whatever was sent while we weren't listening is lost
+            self.dispatch([resync(list_id) for list_id, followers in self._subscribers.items() if followers])
+            await asyncio.sleep(RETRY_SECONDS)
+
+
+_feed: LocalBroker | None = None
+
+
+# The broker picked by change_feed in rxconfig.py, created on first use
+def get_feed() -> LocalBroker:
+    global _feed
+    if _feed is None:
+        mode = rxconfig.change_feed
+        if mode == "auto":
+            mode = "postgres" if async_db_url().startswith("postgresql+asyncpg") else "local"
+        broker = PostgresBroker if mode == "postgres" else LocalBroker
+        _feed = broker(rxconfig.change_feed_queue)
+    return _feed
+
+
+# Commit a session and publish the changes it made
+async def commit(session, changes: list[Change]):
+    changes = _compact(changes)
+    feed = get_feed()
+    await feed.stage(session, changes)
+    await session.commit()
+    feed.committed(changes)
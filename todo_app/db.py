@@ -0,0 +1,101 @@
+from contextlib import asynccontextmanager
+from reflex.config import get_config
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+import rxconfig
+
+# The async database engine State handlers use, so a slow query only waits
+# on its own event instead of blocking every other websocket event in the
+# worker. Pool settings come from db_pool in rxconfig.py.
+#
+# With read_db_url set in rxconfig.py, read-only queries can go to a
+# replica through a second engine with its own pool (see read_session), so
+# page loads don't compete with writes on the primary. Writes always use
+# the primary.
+
+_engine: AsyncEngine | None = None
+_read_engine: AsyncEngine | None = None
+
+# Async drivers to use when only the plain db_url is configured
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+# A database url with an async driver
+def _with_async_driver(url: str) -> str:
+    scheme, _, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+# The async database url: async_db_url if set, otherwise db_url with an async driver
+def async_db_url() -> str:
+    conf = get_config()
+    if conf.async_db_url:
+        return conf.async_db_url
+    return _with_async_driver(conf.db_url)
+
+
+# True when reads can go to a replica
+def has_replica() -> bool:
+    return bool(rxconfig.read_db_url)
+
+
+# Keyword arguments for create_async_engine, built from rxconfig.db_pool
+def engine_args(url: str) -> dict:
+    pool = rxconfig.db_pool
+    args = {"pool_pre_ping": pool["pool_pre_ping"]}
+    if url.startswith("sqlite"):
+        return args
+    args.update(
+        pool_size=pool["pool_size"],
+        max_overflow=pool["max_overflow"],
+        pool_timeout=pool["pool_timeout"],
+        pool_recycle=pool["pool_recycle"],
+    )
+    timeout = pool["statement_timeout_ms"]
+    if timeout and url.startswith("postgresql+asyncpg"):
+        args["connect_args"] = {"server_settings": {"statement_timeout": str(timeout)}}
+    elif timeout and url.startswith("postgresql"):
+        args["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return args
+
+
+# The shared async engine, created on first use
+def get_async_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        url = async_db_url()
+        _engine = create_async_engine(url, **engine_args(url))
+    return _engine
+
+
+# The replica's engine, created on first use (the primary's without a replica)
+def get_read_engine() -> AsyncEngine:
+    global _read_engine
+    if not has_replica():
+        return get_async_engine()
+    if _read_engine is None:
+        url = _with_async_driver(rxconfig.read_db_url)
+        _read_engine = create_async_engine(url, **engine_args(url))
+    return _read_engine
+
+
+# Open an async session. Rows stay readable after commit, so handlers can
+# patch State from them without another round-trip.
+@asynccontextmanager
+async def asession():
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+# Open a session for reads only. It uses the replica unless `primary` is
+# set, which callers do when the replica may not have a write yet that
+# they need to see.
+@asynccontextmanager
+async def read_session(primary: bool = False):
+    engine = get_async_engine() if primary else get_read_engine()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import dataclasses
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from .models import JournalEntry, JournalSnapshot, Todo, TodoTree
+from .services import CHUNK_SIZE, attach_subtasks, chunked, delete_todos, rollup_completed, utcnow
+from .changefeed import Change, deleted, rolled_up
+from .db import asession
+from sqlalchemy import case
+from sqlmodel import Session, delete, func, insert, select, tuple_, update
+import rxconfig
+
+# Append-only journal of every write State makes to the todo table. Each
+# write adds one entry in its own transaction: the op, and per row the id,
+# the version the write left it at and the changed fields (whole rows for
+# inserts and deletes, the fields before and after for updates). That is
+# an audit trail, and it is what undo works from.
+#
+# Undo writes the inverse of an entry: a delete puts the rows back with one
+# batch insert, an insert deletes them again, an update writes the old
+# values back. Like every other write it is conditional: rows someone
+# changed since the entry are left alone and reported as conflicts. The
+# inverse is journaled too, as an entry that `undoes` the first, so redo is
+# just undoing the undo. Undo keeps the subtask hierarchy whole: restored
+# subtasks go back under their parents, and a task isn't deleted again if
+# it got subtasks of its own since.
+#
+# Compaction keeps the journal bounded. Entries older than
+# journal_keep_days are folded into one snapshot of their list's rows per
+# list. The app compacts in the background every journal_compact_interval_s
+# seconds; it can also be run by hand:
+#
+#     python -m todo_app.journal --days 7
+
+# Columns journaled for inserts and deletes, enough to put a row back as it was
+COLUMNS = [
+    "id", "list_id", "text", "description", "completed", "image", "order", "version",
+    "completed_at", "due_at", "remind_at", "parent_id", "subtasks", "subtasks_done",
+]
+# Timestamp columns, kept as ISO strings in the JSON
+DATETIMES = {"completed_at", "due_at", "remind_at"}
+# Fields the change feed carries; the others aren't shown in lists
+SHOWN = ("text", "completed", "order")
+
+# Entries this process removed by compaction (served at /metrics)
+compacted_total = 0
+
+
+# The inverse of an entry, as written by revert()
+@dataclasses.dataclass(frozen=True, slots=True)
+class Reverted:
+    entry_id: int | None  # The new entry (None when no row could be reverted)
+    list_id: int
+    changes: list[Change]
+    conflicts: list[int]  # Rows left alone because they changed since
+
+
+# Todo values as they are stored in the journal's JSON
+def _dump(values: dict) -> dict:
+    return {
+        name: value.isoformat() if name in DATETIMES and value is not None else value
+        for name, value in values.items()
+    }
+
+
+# Journal JSON back as todo values
+def _load(values: dict) -> dict:
+    return {
+        name: datetime.fromisoformat(value) if name in DATETIMES and value is not None else value
+        for name, value in values.items()
+    }
+
+
+# The fields to journal for a write of `names`: completed_at changes
+# together with completed, so it is kept with it
+def _fields(names) -> list[str]:
+    names = list(names)
+    return names + ["completed_at"] if "completed" in names and "completed_at" not in names else names
+
+
+# What some fields of some todos (the given ids, or those matching `where`)
+# hold now, {id: {field: value}}. Called in a write's transaction before the
+# write, for the journal to know what to write back on undo.
+def before(session: Session, names, ids: list[int] | None = None, where=()) -> dict[int, dict]:
+    names = _fields(names)
+    query = select(Todo.id, *[getattr(Todo, name) for name in names]).where(*where)
+    if ids is None:
+        rows = session.execute(query).all()
+    else:
+        rows = [row for chunk in chunked(ids) for row in session.execute(query.where(Todo.id.in_(chunk))).all()]
+    return {row[0]: dict(zip(names, row[1:])) for row in rows}
+
+
+# Journal rows for inserted or deleted todos (Todo objects or rows with
+# every column)
+def images(rows) -> list[dict]:
+    return [_dump({name: getattr(row, name) for name in COLUMNS}) for row in rows]
+
+
+# Journal rows for updated todos: {id: new version}, their fields before
+# the write ({id: {field: value}}, from before()) and the values written
+def updates(versions: dict[int, int], old: dict[int, dict], new: dict[int, dict]) -> list[dict]:
+    return [
+        {
+            "id": todo_id, "version": version,
+            "before": _dump({name: old[todo_id][name] for name in _fields(new[todo_id])}),
+            "after": _dump(new[todo_id]),
+        }
+        for todo_id, version in versions.items() if todo_id in old
+    ]
+
+
+# Add an entry to the journal in the caller's transaction. Returns its id,
+# or None when there were no rows to journal.
+def record(session: Session, list_id: int, op: str, rows: list[dict], undoes: int | None = None) -> int | None:
+    if not rows:
+        return None
+    entry = JournalEntry(list_id=list_id, op=op, rows=rows, undoes=undoes, created_at=utcnow())
+    session.add(entry)
+    session.flush()
+    return entry.id
+
+
+# Write the inverse of a journal entry and journal that too. Returns None
+# if the entry was compacted away.
+def revert(session: Session, entry_id: int) -> Reverted | None:
+    entry = session.get(JournalEntry, entry_id)
+    if entry is None:
+        return None
+    if entry.op == "insert":
+        op, rows, changes, conflicts = _remove(session, entry)
+    elif entry.op == "delete":
+        op, rows, changes, conflicts = _restore(session, entry)
+    else:
+        op, rows, changes, conflicts = _rewrite(session, entry)
+    return Reverted(record(session, entry.list_id, op, rows, undoes=entry.id), entry.list_id, changes, conflicts)
+
+
+# Inverse of an insert: delete the rows again, if nobody changed them since.
+# Rows that got subtasks the entry didn't insert are kept, so nobody's
+# later subtasks are deleted with them.
+def _remove(session: Session, entry: JournalEntry):
+    versions = {row["id"]: row["version"] for row in entry.rows}
+    busy = set()
+    for chunk in chunked(list(versions)):
+        busy.update(
+            ancestor for ancestor, descendant in session.execute(
+                select(TodoTree.ancestor, TodoTree.descendant).where(TodoTree.ancestor.in_(chunk))
+            ).all()
+            if descendant not in versions
+        )
+    gone, rollups = delete_todos(session, entry.list_id, {i: v for i, v in versions.items() if i not in busy})
+    removed = {row.id for row in gone}
+    changes = [deleted(entry.list_id, row.id) for row in gone] + rolled_up(rollups)
+    return "delete", images(gone), changes, [todo_id for todo_id in versions if todo_id not in removed]
+
+
+# The rows of a delete entry that can go back, parents before their
+# subtasks. A row whose id is in use again is left out, and so is every
+# row under it or under a parent that is gone for good.
+def _restorable(session: Session, rows: list[dict]) -> tuple[list[dict], list[int]]:
+    ids = {row["id"] for row in rows}
+    parents = {row["parent_id"] for row in rows if row["parent_id"] is not None and row["parent_id"] not in ids}
+    taken, present = set(), set()
+    for chunk in chunked(list(ids | parents)):
+        found = set(session.exec(select(Todo.id).where(Todo.id.in_(chunk))).all())
+        taken |= found & ids
+        present |= found & parents
+    children = defaultdict(list)
+    for row in rows:
+        children[row["parent_id"]].append(row)
+    ordered = []
+    stack = [row for row in rows if row["parent_id"] is None or row["parent_id"] in present]
+    while stack:
+        row = stack.pop()
+        if row["id"] not in taken:
+            ordered.append(row)
+            stack += children[row["id"]]
+    kept = {row["id"] for row in ordered}
+    return ordered, sorted(row["id"] for row in rows if row["id"] not in kept)
+
+
+# Inverse of a delete: put the rows back with one batch insert, and back
+# into the subtask hierarchy. Ids that are in use again are left alone.
+def _restore(session: Session, entry: JournalEntry):
+    # (Entries from before subtasks have no parent_id)
+    rows, conflicts = _restorable(session, [{"parent_id": None, **_load(row)} for row in entry.rows])
+    # They keep their version: the row is back exactly as it was at that
+    # version, so the entries before the delete can still be undone. Their
+    # rollups are worked out again from the subtasks that are put back.
+    if rows:
+        session.execute(insert(Todo), [{**row, "subtasks": 0, "subtasks_done": 0} for row in rows])
+    rollups = attach_subtasks(session, [(row["id"], row["parent_id"]) for row in rows])
+    changes = [
+        Change(row["list_id"], row["id"], "insert", {name: row[name] for name in (*SHOWN, "parent_id")}, row["version"])
+        for row in rows
+    ] + rolled_up(rollups)
+    return "insert", [_dump(row) for row in rows], changes, conflicts
+
+
+# One column's new values for a chunk of rows ({id: value}): a constant when
+# they are all the same, otherwise a CASE on the id
+def _values(name: str, values: dict[int, object]):
+    distinct = set(values.values())
+    if len(distinct) == 1:
+        return distinct.pop()
+    return case(values, value=Todo.id, else_=getattr(Todo, name))
+
+
+# Inverse of an update: write the old values back to the rows still at the
+# version the entry left them at. Rows that changed the same fields are
+# written together, with one UPDATE per chunk.
+def _rewrite(session: Session, entry: JournalEntry):
+    targets = {row["id"]: _load(row["before"]) for row in entry.rows}
+    versions = {row["id"]: row["version"] for row in entry.rows}
+    names = {name for values in targets.values() for name in values}
+    old = before(session, names, list(targets))
+    groups = defaultdict(list)
+    for todo_id, values in targets.items():
+        groups[tuple(sorted(values))].append(todo_id)
+    written = {}
+    for fields, ids in groups.items():
+        # Two bind parameters per row for the version check, two per field
+        for chunk in chunked(ids, CHUNK_SIZE // (2 + 2 * len(fields))):
+            written.update(session.execute(
+                update(Todo)
+                .where(tuple_(Todo.id, Todo.version).in_([(i, versions[i]) for i in chunk]))
+                .values(
+                    **{name: _values(name, {i: targets[i][name] for i in chunk}) for name in fields},
+                    version=Todo.version + 1,
+                )
+                .returning(Todo.id, Todo.version)
+                .execution_options(synchronize_session=False)
+            ).all())
+    old = {todo_id: {name: old[todo_id][name] for name in targets[todo_id]} for todo_id in written}
+    rollups = rollup_completed(session, {
+        todo_id: targets[todo_id]["completed"] for todo_id in written
+        if "completed" in targets[todo_id] and targets[todo_id]["completed"] != old[todo_id]["completed"]
+    })
+    changes = [
+        Change(entry.list_id, todo_id, "update", {name: targets[todo_id][name] for name in SHOWN if name in targets[todo_id]}, version)
+        for todo_id, version in written.items()
+    ] + rolled_up(rollups)
+    return "update", updates(written, old, targets), changes, [todo_id for todo_id in targets if todo_id not in written]
+
+
+# Fold a list's journal entries from before `cutoff` into a snapshot of its
+# rows, replacing the list's previous snapshot. Returns how many entries
+# were removed.
+def compact_list(session: Session, list_id: int, cutoff: datetime) -> int:
+    # Read the last entry first: every entry committed by then is in the rows read after
+    upto = session.exec(select(func.max(JournalEntry.id)).where(JournalEntry.list_id == list_id)).one()
+    rows = session.exec(
+        select(*[getattr(Todo, name) for name in COLUMNS]).where(Todo.list_id == list_id).order_by(Todo.order, Todo.id)
+    ).all()
+    session.execute(delete(JournalSnapshot).where(JournalSnapshot.list_id == list_id))
+    session.add(JournalSnapshot(list_id=list_id, upto=upto, taken_at=utcnow(), rows=images(rows)))
+    return session.execute(
+        delete(JournalEntry)
+        .where(JournalEntry.list_id == list_id, JournalEntry.id <= upto, JournalEntry.created_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# Compact every list with entries older than `days` days (default:
+# journal_keep_days), one list per transaction. Returns how many entries
+# were removed.
+async def compact(days: float | None = None) -> int:
+    global compacted_total
+    cutoff = utcnow() - timedelta(days=rxconfig.journal_keep_days if days is None else days)
+    async with asession() as session:
+        lists = (await session.exec(
+            select(JournalEntry.list_id).where(JournalEntry.created_at < cutoff).distinct()
+        )).all()
+    removed = 0
+    for list_id in lists:
+        async with asession() as session:
+            removed += await session.run_sync(compact_list, list_id, cutoff)
+            await session.commit()
+    compacted_total += removed
+    return removed
+
+
+# Compact in the background for as long as the app runs
+async def run():
+    while True:
+        try:
+            removed = await compact()
+            if removed:
+                logging.info("Compacted %s journal entries", removed)
+        except Exception:
+            logging.exception("Compacting the journal failed")
+        await asyncio.sleep(rxconfig.journal_compact_interval_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold old journal entries into per-list snapshots.")
+    parser.add_argument("--days", type=float, help="compact entries older than this many days")
+    args = parser.parse_args()
+    print(f"Compacted {asyncio.run(compact(args.days))} journal entries.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+import sqlalchemy
+from sqlalchemy.orm import Session
+from reflex.middleware import Middleware
+from reflex.utils.format import json_dumps
+from . import archive, changefeed, journal, reminders
+from .cache import snapshots
+
+# Per-handler timing for every State event: wall time, how many SQL
+# statements ran and how long they took, ORM rows loaded and the size of
+# the state delta sent back to the browser. Served in Prometheus text
+# format at /metrics (see api.py). With the slow-handler log switched on,
+# events slower than a threshold are logged together with their SQL.
+
+logger = logging.getLogger("todo_app.metrics")
+
+# Bucket upper bounds for each kind of measurement
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 10000)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+# A Prometheus histogram with one label (the handler name)
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, handler: str, value: float):
+        with self._lock:
+            series = self._series.setdefault(handler, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for handler, (counts, total) in sorted(self._series.items()):
+                running = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    running += count
+                    lines.append(f'{self.name}_bucket{{handler="{handler}",le="{bound}"}} {running}')
+                lines.append(f'{self.name}_sum{{handler="{handler}"}} {total}')
+                lines.append(f'{self.name}_count{{handler="{handler}"}} {running}')
+        return lines
+
+
+handler_seconds = Histogram("todo_handler_seconds", "Wall time of State event handlers.", SECONDS_BUCKETS)
+sql_statements = Histogram("todo_handler_sql_statements", "SQL statements run per event.", COUNT_BUCKETS)
+sql_seconds = Histogram("todo_handler_sql_seconds", "Time spent in SQL per event.", SECONDS_BUCKETS)
+rows_loaded = Histogram("todo_handler_rows_loaded", "ORM rows loaded per event.", COUNT_BUCKETS)
+delta_bytes = Histogram("todo_handler_delta_bytes", "Size of the state delta sent per event.", BYTES_BUCKETS)
+HISTOGRAMS = (handler_seconds, sql_statements, sql_seconds, rows_loaded, delta_bytes)
+
+
+# Slow-handler log; switch it at runtime with set_slow_log (POST /metrics/slow_log)
+slow_log = {
+    "enabled": os.environ.get("TODO_SLOW_LOG_MS") is not None,
+    "threshold_ms": float(os.environ.get("TODO_SLOW_LOG_MS", 250)),
+}
+
+
+def set_slow_log(enabled: bool, threshold_ms: float | None = None):
+    slow_log["enabled"] = enabled
+    if threshold_ms is not None:
+        slow_log["threshold_ms"] = threshold_ms
+
+
+# What one event has done so far
+@dataclass
+class EventRecord:
+    handler: str
+    started: float = field(default_factory=time.perf_counter)
+    statements: int = 0
+    sql_time: float = 0.0
+    rows: int = 0
+    delta: int = 0
+    # (seconds, sql) of each statement, only kept while the slow log is on
+    queries: list = field(default_factory=list)
+
+
+_current: contextvars.ContextVar[EventRecord | None] = contextvars.ContextVar("todo_event", default=None)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("todo_query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    record = _current.get()
+    if record is None or not conn.info.get("todo_query_start"):
+        return
+    elapsed = time.perf_counter() - conn.info["todo_query_start"].pop()
+    record.statements += 1
+    record.sql_time += elapsed
+    if slow_log["enabled"]:
+        record.queries.append((elapsed, statement))
+
+
+def _loaded(session, instance):
+    record = _current.get()
+    if record is not None:
+        record.rows += 1
+
+
+_installed = False
+
+
+# Hook the SQLAlchemy events that feed the per-event counters (once)
+def install():
+    global _installed
+    if not _installed:
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine, "before_cursor_execute", _before_execute)
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine, "after_cursor_execute", _after_execute)
+        sqlalchemy.event.listen(Session, "loaded_as_persistent", _loaded)
+        _installed = True
+
+
+def _finish(record: EventRecord):
+    elapsed = time.perf_counter() - record.started
+    handler_seconds.observe(record.handler, elapsed)
+    sql_statements.observe(record.handler, record.statements)
+    sql_seconds.observe(record.handler, record.sql_time)
+    rows_loaded.observe(record.handler, record.rows)
+    delta_bytes.observe(record.handler, record.delta)
+    if slow_log["enabled"] and elapsed * 1000 >= slow_log["threshold_ms"]:
+        queries = "".join(f"\n  {seconds * 1000:8.1f} ms  {sql}" for seconds, sql in record.queries)
+        logger.warning(
+            "Slow handler %s: %.1f ms, %d statements (%.1f ms in SQL), %d rows, %d delta bytes%s",
+            record.handler, elapsed * 1000, record.statements, record.sql_time * 1000,
+            record.rows, record.delta, queries,
+        )
+
+
+# True when an event runs a background handler. Looking the handler up
+# uses Reflex internals; if that fails, the event is treated as one.
+def _is_background(state, event) -> bool:
+    try:
+        _, handler = state._get_event_handler(event)
+        return handler.is_background
+    except Exception:
+        return True
+
+
+# Reflex middleware that times every event. preprocess, the handler and
+# postprocess run in the same task, so the SQL hooks above see the record.
+# Background handlers run in a task of their own and never reach
+# postprocess, so they aren't timed.
+class MetricsMiddleware(Middleware):
+    def __init__(self):
+        install()
+
+    async def preprocess(self, app, state, event):
+        background = _is_background(state, event)
+        _current.set(None if background else EventRecord(handler=event.name.rpartition(".")[2]))
+        return None
+
+    async def postprocess(self, app, state, event, update):
+        record = _current.get()
+        if record is not None:
+            record.delta += len(json_dumps(update.delta)) if update.delta else 0
+            if update.final:
+                _current.set(None)
+                _finish(record)
+        return update
+
+
+# Everything in Prometheus text format
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    stats = snapshots.stats()
+    lines += [
+        "# HELP todo_cache_hits_total Lookups served from the shared list cache.",
+        "# TYPE todo_cache_hits_total counter",
+        f"todo_cache_hits_total {stats['hits']}",
+        "# HELP todo_cache_misses_total Lookups that had to query the database.",
+        "# TYPE todo_cache_misses_total counter",
+        f"todo_cache_misses_total {stats['misses']}",
+        "# HELP todo_cache_entries Snapshots held in the shared list cache.",
+        "# TYPE todo_cache_entries gauge",
+        f"todo_cache_entries {stats['entries']}",
+        "# HELP todo_feed_overflows_total Change followers that fell behind and reloaded instead.",
+        "# TYPE todo_feed_overflows_total counter",
+        f"todo_feed_overflows_total {changefeed.get_feed().overflows}",
+        "# HELP todo_archived_total Completed todos this process moved to the archive.",
+        "# TYPE todo_archived_total counter",
+        f"todo_archived_total {archive.archived_total}",
+        "# HELP todo_journal_compacted_total Journal entries this process folded into snapshots.",
+        "# TYPE todo_journal_compacted_total counter",
+        f"todo_journal_compacted_total {journal.compacted_total}",
+        "# HELP todo_reminders_fired_total Reminders this process sent out.",
+        "# TYPE todo_reminders_fired_total counter",
+        f"todo_reminders_fired_total {reminders.scheduler.fired_total}",
+        "# HELP todo_reminder_lag_seconds Longest delay between a recent reminder coming due and going out.",
+        "# TYPE todo_reminder_lag_seconds gauge",
+        f"todo_reminder_lag_seconds {max(reminders.scheduler.lag_seconds, default=0)}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,19 @@
+import dataclasses
+from datetime import datetime
 import reflex as rx
+import sqlalchemy
+from sqlmodel import Field
+
+# The list every task belonged to before there were several lists
+DEFAULT_LIST_ID = 1
+
+
+# A named list of tasks. Each list is stored and queried on its own, so
+# one list's size doesn't slow down another's.
+class TodoList(rx.Model, table=True):
+    name: str  # Shown in the list picker
+    owner: str = Field(default="", index=True)  # Who the list belongs to ("" = shared by everyone)
+
 
 # This class defines what a task looks like in the database.
 # Each field is a piece of information about the task.
@@ -6,4 +21,131 @@ class Todo(rx.Model, table=True):
     text: str  # The name/title of the task
     description: str = ""  # Extra details about the task
     completed: bool = False  # True if the task is done
-    order: int = 0  # The position of the task in the list (for drag-and-drop)
\ No newline at end of file
+    image: str = ""  # Uploaded image, relative to the upload folder (see uploads.py)
+    order: float = 0  # Sort key of the task in the list (see ordering.py)
+    list_id: int = Field(foreign_key="todolist.id")  # The list the task is on
+    # Bumped by every write; writes only go through if the row is still at
+    # the version the writer last saw (see services.update_todo)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    # When the task was last marked completed (UTC); None while it is open.
+    # Completed tasks are moved to the archive some time after this.
+    completed_at: datetime | None = Field(default=None, index=True)
+    # When the task is due, and when to send a reminder about it (UTC).
+    # remind_at is cleared once the reminder has gone out (see reminders.py).
+    due_at: datetime | None = None
+    remind_at: datetime | None = Field(default=None, index=True)
+    # The task this one is a subtask of (None for a top-level task). The
+    # whole hierarchy is also kept in the todotree closure table.
+    parent_id: int | None = Field(default=None, foreign_key="todo.id", index=True)
+    # How many subtasks the task has at every level below it, and how many
+    # of those are completed. Kept up to date by every write that adds,
+    # removes or completes a subtask (see services.rollup_completed).
+    subtasks: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    subtasks_done: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+    # A list is always read in (order, id) order, page by page; the active
+    # and completed filters read just their part of it. The index page shows
+    # only top-level tasks, and an expanded task's subtasks are read the
+    # same way, so parent_id comes right after list_id. One composite index
+    # serves both filters, and also answers the filter counts on its own.
+    __table_args__ = (
+        sqlalchemy.Index("ix_todo_list_id_parent_id_order_id", "list_id", "parent_id", "order", "id"),
+        sqlalchemy.Index(
+            "ix_todo_list_id_parent_id_completed_order_id", "list_id", "parent_id", "completed", "order", "id"
+        ),
+    )
+
+
+# Closure table of the subtask hierarchy: one row for every task and each
+# task above it, however far up (a task's parent is at depth 1). A whole
+# subtree, or every ancestor of a task, is one indexed lookup here instead
+# of a walk up or down the tree one level at a time.
+class TodoTree(rx.Model, table=True):
+    ancestor: int = Field(foreign_key="todo.id", primary_key=True)
+    descendant: int = Field(foreign_key="todo.id", primary_key=True)
+    depth: int  # How many levels below `ancestor` the descendant is
+
+    # The primary key finds a subtree (by ancestor); this finds the
+    # ancestors of a task
+    __table_args__ = (sqlalchemy.Index("ix_todotree_descendant_ancestor", "descendant", "ancestor"),)
+
+
+# A completed task that was moved out of the todo table by the archiver
+# (see archive.py). It keeps its id, so it can be told apart from tasks
+# that are still live. The todo table only holds live tasks, so the
+# lists stay small however much history piles up.
+class ArchivedTodo(rx.Model, table=True):
+    text: str
+    description: str = ""
+    image: str = ""
+    list_id: int = Field(foreign_key="todolist.id")  # The list the task was on
+    completed_at: datetime  # When the task was completed (UTC)
+    archived_at: datetime  # When the archiver moved it here (UTC)
+
+    # The archive is read per list, most recently completed first, page by page
+    __table_args__ = (sqlalchemy.Index("ix_archivedtodo_list_id_completed_at_id", "list_id", "completed_at", "id"),)
+
+
+# One write to some tasks of a list, in the append-only change journal (see
+# journal.py). `rows` holds what the journal needs to reverse it: whole rows
+# for inserts and deletes, the changed fields before and after for updates.
+class JournalEntry(rx.Model, table=True):
+    list_id: int = Field(foreign_key="todolist.id")
+    op: str  # "insert", "update" or "delete"
+    rows: list = Field(sa_column=sqlalchemy.Column(sqlalchemy.JSON, nullable=False))
+    undoes: int | None = None  # The entry this one reverses, for undo and redo
+    created_at: datetime = Field(index=True)  # When it was written (UTC)
+
+    # Undo reads single entries by id; compaction goes through a list's
+    # entries in id order
+    __table_args__ = (sqlalchemy.Index("ix_journalentry_list_id_id", "list_id", "id"),)
+
+
+# A list's tasks as they were when older journal entries were compacted
+# away. Every entry of the list up to `upto` is reflected in it.
+class JournalSnapshot(rx.Model, table=True):
+    list_id: int = Field(foreign_key="todolist.id", index=True)
+    upto: int  # Id of the last journal entry taken into account
+    taken_at: datetime  # When it was taken (UTC)
+    rows: list = Field(sa_column=sqlalchemy.Column(sqlalchemy.JSON, nullable=False))
+
+
+# What the task list on the index page keeps for each task: only the fields
+# it shows. Rows are frozen so the shared list cache can hand the same row
+# objects to every session; change one with dataclasses.replace.
+@dataclasses.dataclass(frozen=True, slots=True)
+class TodoRow:
+    id: int
+    text: str
+    completed: bool = False
+    subtasks: int = 0  # Subtasks at every level below it
+    subtasks_done: int = 0  # How many of those are completed
+
+
+# A subtask as an expanded task on the index page shows it. An expanded
+# task's subtasks are kept as one flat list, each below its parent and
+# indented by its depth.
+@dataclasses.dataclass(frozen=True, slots=True)
+class SubtaskRow:
+    id: int
+    text: str
+    completed: bool = False
+    depth: int = 1  # Levels below the top-level task
+    subtasks: int = 0
+    subtasks_done: int = 0
+    expanded: bool = False  # True while its own subtasks are shown
+
+
+# A list as the list picker shows it
+@dataclasses.dataclass(frozen=True, slots=True)
+class ListRow:
+    id: int
+    name: str
+
+
+# An archived task as the "show archived" view lists it
+@dataclasses.dataclass(frozen=True, slots=True)
+class ArchivedRow:
+    id: int
+    text: str
+    completed_at: str  # Already formatted for display
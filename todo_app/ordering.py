@@ -0,0 +1,117 @@
+from .models import Todo
+from sqlalchemy import bindparam
+from sqlmodel import Session, func, select
+
+# Todos are kept in order by a floating point "order" key. Moving or adding a
+# task only gives that one task a new key that sits between its neighbours, so
+# every move, drag or append writes exactly one row. Halving the gap over and
+# over eventually runs out of float precision, so once two neighbours get too
+# close the whole list is renumbered in the background (see rebalance).
+
+# Distance between keys for new items and after a rebalance
+GAP = 1.0
+# Neighbouring keys closer than this trigger a rebalance
+MIN_GAP = 1e-9
+
+
+# Pick a key that sorts between two keys (either side may be None for the ends)
+def key_between(before: float | None, after: float | None) -> float:
+    if before is None and after is None:
+        return 0.0
+    if before is None:
+        return after - GAP
+    if after is None:
+        return before + GAP
+    return (before + after) / 2
+
+
+# True when the keys around a newly placed item are packed too tightly
+def too_dense(before: float | None, after: float | None) -> bool:
+    return before is not None and after is not None and after - before < MIN_GAP
+
+
+# The key for a task added to the end of a list (one index lookup, not a full scan)
+def next_order(session: Session, list_id: int) -> float:
+    return key_between(session.exec(select(func.max(Todo.order)).where(Todo.list_id == list_id)).one(), None)
+
+
+# Indices of the longest run of items that are already in increasing key order.
+# Those items can stay where they are; only the rest need new keys.
+def _stable_indices(keys: list[float]) -> set[int]:
+    tails: list[int] = []  # index of the smallest tail of each run length
+    parent: list[int] = [-1] * len(keys)
+    for i, key in enumerate(keys):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[tails[mid]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        parent[i] = tails[lo - 1] if lo else -1
+        if lo == len(tails):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    stable = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        stable.add(i)
+        i = parent[i]
+    return stable
+
+
+# Work out new keys for a list of ids so they end up in the given order.
+# Returns ({id: new key} for the rows that have to move, needs_rebalance).
+def plan_reorder(ids: list[int], current: dict[int, float]) -> tuple[dict[int, float], bool]:
+    keys = [current[todo_id] for todo_id in ids]
+    stable = _stable_indices(keys)
+    changes: dict[int, float] = {}
+    dense = False
+    i = 0
+    while i < len(ids):
+        if i in stable:
+            i += 1
+            continue
+        # Give a run of moved items evenly spaced keys between its fixed neighbours
+        start = i
+        while i < len(ids) and i not in stable:
+            i += 1
+        before = keys[start - 1] if start > 0 else None
+        after = keys[i] if i < len(ids) else None
+        count = i - start
+        for n in range(count):
+            if before is None and after is None:
+                key = n * GAP
+            elif before is None:
+                key = after - (count - n) * GAP
+            elif after is None:
+                key = before + (n + 1) * GAP
+            else:
+                key = before + (after - before) * (n + 1) / (count + 1)
+            keys[start + n] = key
+            changes[ids[start + n]] = key
+        if before is not None and after is not None:
+            dense = dense or too_dense(before, before + (after - before) / (count + 1))
+    return changes, dense
+
+
+# Write new keys for several rows with one executemany UPDATE (whatever
+# version they are at; each one's version is bumped)
+def apply_orders(session: Session, changes: dict[int, float]):
+    if changes:
+        table = Todo.__table__
+        session.execute(
+            table.update()
+            .where(table.c.id == bindparam("todo_id"))
+            .values(order=bindparam("key"), version=table.c.version + 1),
+            [{"todo_id": todo_id, "key": key} for todo_id, key in changes.items()],
+        )
+
+
+# Renumber every todo on a list to evenly spaced keys, keeping the current
+# order, in the caller's transaction. This touches the whole list, so it
+# only runs when keys got too dense.
+def rebalance(session: Session, list_id: int):
+    ids = session.exec(select(Todo.id).where(Todo.list_id == list_id).order_by(Todo.order, Todo.id)).all()
+    apply_orders(session, {todo_id: n * GAP for n, todo_id in enumerate(ids)})
@@ -0,0 +1,48 @@
+import importlib
+import sys
+import time
+import rxconfig
+
+# Every page of the app, registered by todo_app.py. Pages are added as
+# LazyPage objects, so a page's module is only imported, and its component
+# tree only built, when Reflex first evaluates the page: on compile, not
+# when a worker imports the app. Backend workers started from a compiled
+# app never build pages that don't define state, which keeps their start
+# (and so scaling out) quick.
+
+# (route, module in this package, page function, title)
+PAGES = [
+    ("/", "index", "index", "Todo App"),
+    ("/edit_details", "edit_details", "edit_details", "Edit Details"),
+    ("/view_details", "view_details", "view_details", "View Details"),
+]
+
+# Seconds each page took to import and build when last evaluated, by route
+timings: dict[str, dict[str, float]] = {}
+
+
+# A page that imports its module and builds its component when called
+class LazyPage:
+    def __init__(self, route: str, module: str, name: str):
+        self.route = route
+        self.module = module
+        self.name = name
+        # Reflex names the page's component after this
+        self.__name__ = name
+
+    def __call__(self):
+        start = time.perf_counter()
+        page = getattr(importlib.import_module(f"{__name__}.{self.module}"), self.name)
+        imported = time.perf_counter()
+        component = page()
+        timings[self.route] = {"import": imported - start, "build": time.perf_counter() - imported}
+        if rxconfig.profile_startup:
+            took = timings[self.route]
+            print(f"Page {self.route}: import {took['import'] * 1000:.1f} ms, build {took['build'] * 1000:.1f} ms", file=sys.stderr)
+        return component
+
+
+# Add every page to the app, without importing any of them yet
+def register(app):
+    for route, module, name, title in PAGES:
+        app.add_page(LazyPage(route, module, name), route=route, title=title)
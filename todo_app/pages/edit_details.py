@@ -1,10 +1,10 @@
 import reflex as rx
 from ..state import State
+from ..thumbnails import thumbnail_url
 
 # This page lets you edit the details of a selected task.
 def edit_details() -> rx.Component:
     return rx.container(
-        # Heading for the page
         rx.heading("Edit Details", size="7"),
         # Show a success message if there is one
         rx.cond(
@@ -13,56 +13,71 @@ def edit_details() -> rx.Component:
                 rx.text(State.success_message, color="green", font_weight="bold"),
                 rx.script("setTimeout(() => window.location.href = '/', 1500);")
             ),
-            rx.fragment()
         ),
         # If a task is selected, show its details for editing
         rx.cond(
-            State.selected_todo is not None,
-            rx.container(
-                rx.color_mode.button(position="top-right"),
-                rx.vstack(
-                    rx.heading("Edit Todo Details", size="8"),
-                    # Input for editing the task's title
+            State.selected_todo.is_not_none(),
+            rx.vstack(
+                rx.input(
+                    value=State.selected_todo["text"],
+                    on_change=lambda e: State.set_selected_text(e),
+                    placeholder="Task title",
+                    width="100%"
+                ),
+                rx.text_area(
+                    value=State.selected_todo["description"],
+                    on_change=lambda e: State.set_selected_description(e),
+                    placeholder="Task description",
+                    width="100%",
+                    height="100px"
+                ),
+                rx.checkbox(
+                    label="Completed",
+                    is_checked=State.selected_todo["completed"],
+                    on_change=lambda e: State.set_selected_completed(e)
+                ),
+                # Due date and reminder time, in UTC
+                rx.hstack(
+                    rx.text("Due (UTC)", width="120px"),
                     rx.input(
-                        placeholder="Edit todo text...",
-                        value=State.edit_todo_text,
-                        on_change=lambda e: State.set_edit_todo_text(e),
-                        width="300px",
-                    ),
-                    # Text area for editing the description
-                    rx.text_area(
-                        placeholder="Edit description...",
-                        value=State.edit_todo_description,
-                        on_change=lambda e: State.set_edit_todo_description(e),
-                        width="300px",
-                        min_height="80px",
+                        type="datetime-local",
+                        value=State.selected_todo["due_at"],
+                        on_change=lambda e: State.set_selected_due(e),
                     ),
-                    # Checkbox and buttons for completed, save, and back
-                    rx.hstack(
-                        rx.checkbox(
-                            checked=State.edit_todo_completed,
-                            on_change=lambda e: State.set_edit_todo_completed(e),
-                            label="Completed?",
-                        ),
-                        rx.button("Save", on_click=State.save_edit, color_scheme="green"),
-                        rx.button("Back", on_click=lambda: rx.redirect("/"), color_scheme="gray"),
-                    ),
-                    rx.upload(
-                        accept="image/*",
-                        max_files=1,
-                        on_upload=State.handle_upload,
-                        children=rx.button("Upload Image", color_scheme="blue"),
-                    ),
-                    rx.cond(
-                        State.edit_todo_image != "",
-                        rx.image(src=State.edit_todo_image, width="200px", margin_top="10px"),
-                        rx.fragment()
+                ),
+                rx.hstack(
+                    rx.text("Remind me (UTC)", width="120px"),
+                    rx.input(
+                        type="datetime-local",
+                        value=State.selected_todo["remind_at"],
+                        on_change=lambda e: State.set_selected_remind(e),
                     ),
-                    spacing="6",
-                    align_items="center",
-                    min_height="85vh",
                 ),
+                # Drop or pick an image for the task
+                rx.upload(
+                    rx.button("Upload Image", color_scheme="blue"),
+                    id="todo_image",
+                    accept={"image/*": []},
+                    max_files=1,
+                    on_drop=State.handle_upload(rx.upload_files(upload_id="todo_image")),
+                ),
+                rx.cond(
+                    State.error_message != "",
+                    rx.text(State.error_message, color="red"),
+                ),
+                rx.cond(
+                    State.selected_todo["image"] != "",
+                    rx.image(src=thumbnail_url(State.selected_todo["image"]), width="200px"),
+                ),
+                rx.hstack(
+                    rx.button("Save", on_click=State.save_selected_todo, color_scheme="blue"),
+                    rx.button("Delete", on_click=State.delete_selected_todo, color_scheme="red"),
+                    rx.button("Back", on_click=lambda: rx.redirect("/"), color_scheme="gray"),
+                ),
+                spacing="4"
             ),
             rx.text("No task selected.")
-        )
+        ),
+        # When leaving the page, write any edits still being held back
+        on_unmount=State.flush_pending,
     )
@@ -16,6 +16,42 @@ def index() -> rx.Component:
                 rx.text(State.success_message, color="green", font_weight="bold", margin_bottom="10px"),
                 rx.fragment()
             ),
+            # Show an error message if there is one
+            rx.cond(
+                State.error_message != "",
+                rx.text(State.error_message, color="red", margin_bottom="10px"),
+                rx.fragment()
+            ),
+            # The last reminder that went out for a task on this list
+            rx.cond(
+                State.reminder_message != "",
+                rx.hstack(
+                    rx.text(State.reminder_message, color="orange", font_weight="bold"),
+                    rx.button("Dismiss", on_click=State.dismiss_reminder, variant="ghost", size="1"),
+                ),
+                rx.fragment()
+            ),
+            # List picker: one button per list, plus a box to start a new list
+            rx.hstack(
+                rx.foreach(
+                    State.lists,
+                    lambda todo_list: rx.button(
+                        todo_list.name,
+                        on_click=State.select_list(todo_list.id),
+                        variant=rx.cond(todo_list.id == State.list_id, "solid", "soft"),
+                        size="1",
+                    ),
+                ),
+                rx.input(
+                    placeholder="New list...",
+                    value=State.new_list_name,
+                    on_change=State.set_new_list_name,
+                    width="150px",
+                    size="1",
+                ),
+                rx.button("Add list", on_click=State.add_list, size="1", variant="outline"),
+                wrap="wrap",
+            ),
             # Input box and add button for new tasks
             rx.hstack(
                 rx.input(
@@ -26,39 +62,222 @@ def index() -> rx.Component:
                 ),
                 rx.button("Add", on_click=State.add_todo, color_scheme="green"),
             ),
+            # Search box; waits for a pause in typing before searching
+            rx.input(
+                placeholder="Search todos...",
+                value=State.search_query,
+                on_change=State.search,
+                debounce_timeout=300,
+                width="300px",
+            ),
+            # Search results, best match first
+            rx.cond(
+                State.search_query != "",
+                rx.vstack(
+                    rx.foreach(
+                        State.search_results,
+                        lambda todo: rx.hstack(
+                            rx.text(
+                                todo.text,
+                                size="4",
+                                text_decoration=rx.cond(todo.completed, "line-through", "none"),
+                            ),
+                            rx.button("View", on_click=lambda: [State.view_details(todo.id), rx.redirect("/view_details")], color_scheme="blue", size="1"),
+                            spacing="3"
+                        )
+                    ),
+                    rx.cond(
+                        State.search_results.length() == 0,
+                        rx.text("No matching tasks.", color="gray"),
+                        rx.fragment()
+                    ),
+                    rx.cond(
+                        State.search_has_more,
+                        rx.button("More results", on_click=State.load_more_results, variant="soft", size="1"),
+                        rx.fragment()
+                    ),
+                    spacing="2",
+                    align_items="start",
+                ),
+                rx.fragment()
+            ),
+            # Buttons that act on many tasks at once
+            rx.hstack(
+                rx.button("Complete All", on_click=State.complete_all, color_scheme="purple", size="2"),
+                rx.button("Clear Completed", on_click=State.clear_completed, color_scheme="red", size="2"),
+                rx.button("Complete Selected", on_click=State.complete_selected, is_disabled=State.selected_ids.length() == 0, size="2"),
+                rx.button("Delete Selected", on_click=State.delete_selected, is_disabled=State.selected_ids.length() == 0, color_scheme="red", size="2"),
+                rx.button("Move to Top", on_click=State.move_selected_to_top, is_disabled=State.selected_ids.length() == 0, size="2"),
+                rx.button("Move to Bottom", on_click=State.move_selected_to_bottom, is_disabled=State.selected_ids.length() == 0, size="2"),
+                rx.button("Undo", on_click=State.undo, is_disabled=~State.can_undo, variant="soft", size="2"),
+                rx.button("Redo", on_click=State.redo, is_disabled=~State.can_redo, variant="soft", size="2"),
+                spacing="2",
+                wrap="wrap",
+            ),
+            # Filters; the counts come from the database, not from the loaded rows
+            rx.hstack(
+                rx.button(
+                    f"All ({State.count_all})",
+                    on_click=State.set_filter("all"),
+                    variant=rx.cond(State.filter_mode == "all", "solid", "soft"),
+                    size="1",
+                ),
+                rx.button(
+                    f"Active ({State.count_active})",
+                    on_click=State.set_filter("active"),
+                    variant=rx.cond(State.filter_mode == "active", "solid", "soft"),
+                    size="1",
+                ),
+                rx.button(
+                    f"Completed ({State.count_completed})",
+                    on_click=State.set_filter("completed"),
+                    variant=rx.cond(State.filter_mode == "completed", "solid", "soft"),
+                    size="1",
+                ),
+                spacing="2",
+            ),
             # List of all tasks with up/down buttons for reordering
             rx.vstack(
                 rx.foreach(
                     State.todos,
                     lambda todo, i: rx.vstack(
                         rx.hstack(
+                            # Show or hide its subtasks
+                            rx.button(
+                                rx.cond(State.subtasks.contains(todo.id), "▾", "▸"),
+                                on_click=lambda: State.toggle_subtasks(todo.id),
+                                variant="ghost",
+                                size="2",
+                            ),
+                            # Tick the task for a bulk action
+                            rx.checkbox(
+                                checked=State.selected_ids.contains(todo.id),
+                                on_change=lambda _: State.toggle_selected(todo.id),
+                            ),
                             rx.text(
-                                todo["text"],
+                                todo.text,
                                 size="5",
-                                text_decoration=rx.cond(todo["completed"], "line-through", "none"),
-                                color=rx.cond(todo["completed"], "gray", "black")
+                                text_decoration=rx.cond(todo.completed, "line-through", "none"),
+                                color=rx.cond(todo.completed, "gray", "black")
                             ),
-                            rx.button("Edit", on_click=lambda: [State.view_details(todo["id"]), rx.redirect("/edit_details")], color_scheme="yellow", size="2"),
-                            rx.button("View", on_click=lambda: [State.view_details(todo["id"]), rx.redirect("/view_details")], color_scheme="blue", size="2"),
-                            rx.button("Remove", on_click=lambda: State.remove_todo(i), color_scheme="red", size="2"),
-                            rx.button("Toggle", on_click=lambda: State.toggle_complete(i), color_scheme="purple", size="2"),
+                            # How many of its subtasks are done
+                            rx.cond(
+                                todo.subtasks > 0,
+                                rx.badge(f"{todo.subtasks_done}/{todo.subtasks} done", variant="soft"),
+                                rx.fragment()
+                            ),
+                            rx.button("Edit", on_click=lambda: [State.view_details(todo.id), rx.redirect("/edit_details")], color_scheme="yellow", size="2"),
+                            rx.button("View", on_click=lambda: [State.view_details(todo.id), rx.redirect("/view_details")], color_scheme="blue", size="2"),
+                            rx.button("Remove", on_click=lambda: State.remove_todo(todo.id), color_scheme="red", size="2"),
+                            rx.button("Toggle", on_click=lambda: State.toggle_complete(todo.id), color_scheme="purple", size="2"),
                             # Up button
-                            rx.button("↑", on_click=lambda: State.move_todo_up(i), is_disabled=(i == 0), size="2"),
+                            rx.button("↑", on_click=lambda: State.move_todo_up(todo.id), is_disabled=(i == 0), size="2"),
                             # Down button
-                            rx.button("↓", on_click=lambda: State.move_todo_down(i), is_disabled=(i == State.todos.length() - 1), size="2"),
+                            rx.button("↓", on_click=lambda: State.move_todo_down(todo.id), is_disabled=(i == State.todos.length() - 1) & ~State.has_more, size="2"),
                             spacing="3"
                         ),
                         rx.cond(
-                            todo["completed"],
+                            todo.completed,
                             rx.text("Completed: ✅", size="3", color="gray"),
                             rx.text("Completed: ❌", size="3", color="gray")
+                        ),
+                        # Its subtasks while it is expanded, each indented by its depth
+                        rx.cond(
+                            State.subtasks.contains(todo.id),
+                            rx.vstack(
+                                rx.foreach(
+                                    State.subtasks[todo.id],
+                                    lambda sub: rx.hstack(
+                                        rx.button(
+                                            rx.cond(sub.expanded, "▾", "▸"),
+                                            on_click=lambda: State.toggle_subtasks(sub.id),
+                                            variant="ghost",
+                                            size="1",
+                                            visibility=rx.cond(sub.subtasks > 0, "visible", "hidden"),
+                                        ),
+                                        rx.checkbox(checked=sub.completed, on_change=lambda _: State.toggle_subtask(sub.id)),
+                                        rx.text(
+                                            sub.text,
+                                            size="3",
+                                            text_decoration=rx.cond(sub.completed, "line-through", "none"),
+                                            color=rx.cond(sub.completed, "gray", "black")
+                                        ),
+                                        rx.cond(
+                                            sub.subtasks > 0,
+                                            rx.badge(f"{sub.subtasks_done}/{sub.subtasks} done", variant="soft"),
+                                            rx.fragment()
+                                        ),
+                                        # Add the subtask typed below under this one
+                                        rx.button("+", on_click=lambda: State.add_subtask(sub.id), variant="soft", size="1"),
+                                        rx.button("Remove", on_click=lambda: State.remove_subtask(sub.id), color_scheme="red", size="1"),
+                                        spacing="2",
+                                        padding_left=f"{sub.depth * 24}px",
+                                    )
+                                ),
+                                rx.hstack(
+                                    rx.input(
+                                        placeholder="New subtask...",
+                                        value=State.new_subtask,
+                                        on_change=State.set_new_subtask,
+                                        width="200px",
+                                        size="1",
+                                    ),
+                                    rx.button("Add subtask", on_click=lambda: State.add_subtask(todo.id), size="1"),
+                                    padding_left="24px",
+                                ),
+                                spacing="1",
+                                align_items="start",
+                            ),
+                            rx.fragment()
                         )
                     )
                 ),
+                # Only a page of tasks is loaded at a time
+                rx.cond(
+                    State.has_more,
+                    rx.button("Load more", on_click=State.load_more_todos, variant="soft", size="2"),
+                    rx.fragment()
+                ),
                 spacing="2",
                 align_items="start",
                 margin_top="20px",
             ),
+            # Completed tasks that were archived, only loaded on demand
+            rx.vstack(
+                rx.button(
+                    rx.cond(State.show_archived, "Hide archived", "Show archived"),
+                    on_click=State.toggle_archived,
+                    variant="ghost",
+                    size="2",
+                ),
+                rx.cond(
+                    State.show_archived,
+                    rx.vstack(
+                        rx.foreach(
+                            State.archived,
+                            lambda todo: rx.hstack(
+                                rx.text(todo.text, size="3", color="gray", text_decoration="line-through"),
+                                rx.text(f"completed {todo.completed_at}", size="2", color="gray"),
+                                spacing="3"
+                            )
+                        ),
+                        rx.cond(
+                            State.archived.length() == 0,
+                            rx.text("No archived tasks.", color="gray"),
+                            rx.fragment()
+                        ),
+                        rx.cond(
+                            State.archived_has_more,
+                            rx.button("More archived", on_click=State.load_more_archived, variant="soft", size="1"),
+                            rx.fragment()
+                        ),
+                        spacing="2",
+                        align_items="start",
+                    ),
+                    rx.fragment()
+                ),
+                align_items="start",
+            ),
             # Space and alignment for the whole page
             spacing="6",
             align_items="center",
@@ -66,4 +285,6 @@ def index() -> rx.Component:
         ),
         # When the page loads, get all tasks
         on_mount=State.on_mount,
+        # When leaving the page, write any changes still being held back
+        on_unmount=State.flush_pending,
     )
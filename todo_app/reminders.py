@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import logging
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timedelta
+from .models import Todo
+from .services import utcnow
+from . import changefeed
+from .changefeed import Change
+from .db import asession
+from sqlmodel import select, tuple_, update
+
+# Reminders for todos with a remind_at time. One scheduler per app process
+# keeps the reminders due next in a min-heap. It loads them a window at a
+# time with a range query over the remind_at index, sleeps until the
+# earliest one is due, then fires it. Firing clears remind_at in the
+# database and publishes a "remind" change, so every session following
+# the todo's list shows the reminder without polling the table.
+#
+# Nothing is kept only in memory: after a restart the next window is
+# loaded from the index again, and reminders that came due while the app
+# was down fire straight away. Clearing remind_at is conditional on it
+# still holding the time the heap has. A reminder that was changed or
+# removed after it was loaded, or that another process already fired, is
+# skipped.
+#
+# The scheduler reads time from a clock. ManualClock only moves when told
+# to, so firing order and lag can be tested without waiting.
+
+# How far ahead the scheduler loads reminders
+WINDOW = timedelta(hours=1)
+# Most reminders loaded at once; the window ends early when more are due
+WINDOW_SIZE = 1000
+# Most reminders fired per transaction, so their changes fit in one NOTIFY
+FIRE_BATCH = 20
+# Seconds to wait before trying again after the database failed
+RETRY_SECONDS = 5.0
+
+
+# Real time
+class SystemClock:
+    def now(self) -> datetime:
+        return utcnow()
+
+    # Sleep for up to `seconds`, or until `wake` is set
+    async def wait(self, seconds: float, wake: asyncio.Event):
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(wake.wait(), max(seconds, 0))
+
+
+# Time that only moves when advance() is called, for tests
+class ManualClock:
+    def __init__(self, start: datetime):
+        self._now = start
+        self._ticked = asyncio.Event()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+        self._ticked.set()
+
+    # Wait until the clock is advanced or `wake` is set
+    async def wait(self, seconds: float, wake: asyncio.Event):
+        self._ticked.clear()
+        ticked = asyncio.ensure_future(self._ticked.wait())
+        woken = asyncio.ensure_future(wake.wait())
+        await asyncio.wait([ticked, woken], return_when=asyncio.FIRST_COMPLETED)
+        ticked.cancel()
+        woken.cancel()
+
+
+class ReminderScheduler:
+    def __init__(self, clock: SystemClock | ManualClock | None = None):
+        self.clock = clock or SystemClock()
+        # (remind_at, todo id) of the loaded reminders, earliest first
+        self._heap: list[tuple[datetime, int]] = []
+        # Every reminder before this (remind_at, id) is on the heap
+        self._horizon: tuple[datetime, int] | None = None
+        self._wake = asyncio.Event()
+        self.fired_total = 0
+        # Seconds between when recent reminders were due and when they went out
+        self.lag_seconds: deque[float] = deque(maxlen=1000)
+
+    # Load the next window of reminders from the remind_at index
+    async def load_window(self):
+        horizon = (self.clock.now() + WINDOW, 0)
+        async with asession() as session:
+            rows = (await session.exec(
+                select(Todo.remind_at, Todo.id)
+                .where(Todo.remind_at != None, Todo.remind_at < horizon[0])  # noqa: E711
+                .order_by(Todo.remind_at, Todo.id)
+                .limit(WINDOW_SIZE)
+            )).all()
+        if len(rows) == WINDOW_SIZE:
+            # More are due within the window; stop at the last one loaded
+            horizon = tuple(rows[-1])
+            rows = rows[:-1]
+        # Keep anything schedule() pushed while the query ran
+        self._heap = [tuple(row) for row in rows] + [entry for entry in self._heap if entry < horizon]
+        heapq.heapify(self._heap)
+        self._horizon = horizon
+
+    # A session set or changed a reminder. One due within the loaded window
+    # goes on the heap now; later ones are loaded with their window.
+    def schedule(self, todo_id: int, remind_at: datetime | None):
+        if remind_at is not None and self._horizon is not None and (remind_at, todo_id) < self._horizon:
+            heapq.heappush(self._heap, (remind_at, todo_id))
+            self._wake.set()
+
+    # Fire every reminder that is due, loading new windows as the old ones
+    # run out. Returns the changes published, in firing order.
+    async def fire_due(self) -> list[Change]:
+        fired = []
+        while True:
+            now = self.clock.now()
+            if not self._heap and (self._horizon is None or now >= self._horizon[0]):
+                await self.load_window()
+                if not self._heap:
+                    return fired
+            if not self._heap or self._heap[0][0] > now:
+                return fired
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < FIRE_BATCH:
+                due.append(heapq.heappop(self._heap))
+            fired += await self._fire(due)
+
+    # Clear remind_at on the due todos that still have it, and publish a
+    # "remind" change for each of those
+    async def _fire(self, due: list[tuple[datetime, int]]) -> list[Change]:
+        async with asession() as session:
+            sent = {
+                todo_id: Change(list_id, todo_id, "remind", {"text": text}, version)
+                for todo_id, list_id, text, version in (await session.execute(
+                    update(Todo)
+                    .where(tuple_(Todo.remind_at, Todo.id).in_(due))
+                    .values(remind_at=None, version=Todo.version + 1)
+                    .returning(Todo.id, Todo.list_id, Todo.text, Todo.version)
+                    .execution_options(synchronize_session=False)
+                )).all()
+            }
+            changes = [sent[todo_id] for _, todo_id in due if todo_id in sent]
+            await changefeed.commit(session, changes)
+        now = self.clock.now()
+        self.lag_seconds.extend((now - remind_at).total_seconds() for remind_at, todo_id in due if todo_id in sent)
+        self.fired_total += len(changes)
+        return changes
+
+    # Fire reminders as they come due, for as long as the app runs
+    async def run(self):
+        while True:
+            try:
+                await self.fire_due()
+            except Exception:
+                logging.exception("Firing reminders failed")
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            next_due = self._heap[0][0] if self._heap else self._horizon[0]
+            self._wake.clear()
+            await self.clock.wait((next_due - self.clock.now()).total_seconds(), self._wake)
+
+
+# The scheduler every session in this process shares
+scheduler = ReminderScheduler()
+
+
+# Lifespan task that runs the scheduler (see todo_app.py)
+async def run():
+    await scheduler.run()
@@ -0,0 +1,413 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from .models import ArchivedTodo, Todo, TodoList, TodoTree
+from .ordering import GAP
+from sqlalchemy import case, exists, or_
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, delete, func, insert, select, text, tuple_, update
+
+# Set-based operations on many todos at once. Each function runs its
+# statements in the caller's session, so the caller commits them as one
+# transaction, and returns the ids it touched (with their new versions
+# where rows were updated) so State can patch its list instead of
+# reloading it.
+#
+# Writes to rows a session already shows are conditional: they only go
+# through if the row is still at the version the session last saw. Rows
+# that weren't written are conflicts (someone else changed or deleted them
+# first); State re-reads just those with current_rows and patches them in.
+#
+# Tasks can have subtasks, to any depth. Besides parent_id, every task has
+# a row in the todotree closure table for each task above it, so a whole
+# subtree, or every ancestor of a task, is one indexed query. Each task's
+# rollups (how many subtasks it has at every level, and how many of those
+# are done) are changed by writes as they go: the UPDATE counts the tasks
+# added, removed or completed below each ancestor in the closure table, so
+# nothing ever walks the tree or recounts a whole subtree. Every write that
+# changes `completed` calls rollup_completed with the rows it flipped.
+
+# How many todos the index page loads at a time
+PAGE_SIZE = 50
+# Extra rows loaded past the visible page so scrolling on doesn't wait
+PREFETCH = 25
+
+# How many search results are loaded at a time
+SEARCH_PAGE_SIZE = 20
+
+# Ids per IN (...) list. SQLite builds may cap bind parameters at 999 and
+# Postgres at 65535, so stay well under both.
+CHUNK_SIZE = 500
+
+
+# Every column of a todo, for deletes to return what they removed (the
+# journal keeps it so they can be undone)
+TODO_COLUMNS = list(Todo.__table__.c)
+
+
+# Split a list of ids into pieces of at most CHUNK_SIZE
+def chunked(ids: list[int], size: int = CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# The current time in UTC, as the naive datetimes the timestamp columns hold
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# completed_at for a write that sets `completed`: stamped when a todo
+# becomes completed, kept while it stays completed, cleared when reopened
+def completed_at(completed: bool):
+    if not completed:
+        return None
+    return func.coalesce(case((Todo.completed == True, Todo.completed_at)), utcnow())  # noqa: E712
+
+
+# Every list, oldest first
+def load_lists(session: Session) -> list[TodoList]:
+    return session.exec(select(TodoList).order_by(TodoList.id)).all()
+
+
+# Load the top-level todos of a list that come after the (order, id)
+# cursor, in list order; only completed or only open ones if `completed` is
+# given. Paging by key instead of OFFSET keeps every page as cheap as the
+# first, and the (list_id, parent_id, order, id) and (list_id, parent_id,
+# completed, order, id) indexes keep it independent of how many todos other
+# lists, the other filter, or subtasks have.
+def load_page(session: Session, list_id: int, after: tuple[float, int] | None = None, limit: int = PAGE_SIZE, completed: bool | None = None) -> list[Todo]:
+    query = select(Todo).where(Todo.list_id == list_id, Todo.parent_id == None)  # noqa: E711
+    if completed is not None:
+        query = query.where(Todo.completed == completed)
+    if after is not None:
+        query = query.where(tuple_(Todo.order, Todo.id) > after)
+    return session.exec(query.order_by(Todo.order, Todo.id).limit(limit)).all()
+
+
+# How many top-level todos a list has, and how many of them are completed,
+# from one aggregate query over the (list_id, parent_id, completed, order,
+# id) index
+def count_todos(session: Session, list_id: int) -> tuple[int, int]:
+    total, completed = session.exec(
+        select(func.count(), func.count().filter(Todo.completed == True))  # noqa: E712
+        .where(Todo.list_id == list_id, Todo.parent_id == None)  # noqa: E711
+    ).one()
+    return total, completed
+
+
+# Load a page of a list's archived todos, most recently completed first,
+# before the (completed_at, id) cursor
+def load_archived(session: Session, list_id: int, before: tuple[datetime, int] | None = None, limit: int = PAGE_SIZE) -> list[ArchivedTodo]:
+    query = select(ArchivedTodo).where(ArchivedTodo.list_id == list_id)
+    if before is not None:
+        query = query.where(tuple_(ArchivedTodo.completed_at, ArchivedTodo.id) < before)
+    return session.exec(query.order_by(ArchivedTodo.completed_at.desc(), ArchivedTodo.id.desc()).limit(limit)).all()
+
+
+# Turn what the user typed into an FTS5 query: every word must match, as a
+# prefix, and FTS5 operators in the input are treated as plain text
+def _fts5_query(query: str) -> str:
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in query.split())
+
+
+# Find todos on a list whose text or description match `query`, best
+# matches first. Uses the full-text index from migration 9c5e0b7d4a12: a
+# tsvector column on Postgres, an FTS5 table on SQLite.
+def search_todos(session: Session, list_id: int, query: str, limit: int = SEARCH_PAGE_SIZE, offset: int = 0) -> list[Todo]:
+    if not query.strip():
+        return []
+    if session.get_bind().dialect.name == "postgresql":
+        statement = text("""
+            SELECT todo.* FROM todo, websearch_to_tsquery('english', :query) AS query
+            WHERE todo.search_vector @@ query AND todo.list_id = :list_id
+            ORDER BY ts_rank(todo.search_vector, query) DESC, todo.id
+            LIMIT :limit OFFSET :offset
+        """).bindparams(query=query)
+    else:
+        statement = text("""
+            SELECT todo.* FROM todo_fts JOIN todo ON todo.id = todo_fts.rowid
+            WHERE todo_fts MATCH :query AND todo.list_id = :list_id
+            ORDER BY bm25(todo_fts), todo.id
+            LIMIT :limit OFFSET :offset
+        """).bindparams(query=_fts5_query(query))
+    statement = statement.bindparams(list_id=list_id, limit=limit, offset=offset)
+    return session.execute(select(Todo).from_statement(statement)).scalars().all()
+
+
+# Mark the given todos on a list as completed (or not) with one UPDATE per
+# chunk. Returns {id: new version} of the rows that changed; the caller
+# passes them on to rollup_completed.
+def set_completed(session: Session, list_id: int, ids: list[int], completed: bool = True) -> dict[int, int]:
+    changed = {}
+    for chunk in chunked(ids):
+        changed.update(session.execute(
+            update(Todo)
+            .where(Todo.list_id == list_id, Todo.id.in_(chunk), Todo.completed != completed)
+            .values(completed=completed, completed_at=completed_at(completed), version=Todo.version + 1)
+            .returning(Todo.id, Todo.version)
+            .execution_options(synchronize_session=False)
+        ).all())
+    return changed
+
+
+# Mark every open todo on a list, subtasks included, as completed. Returns
+# {id: new version}.
+def complete_all(session: Session, list_id: int) -> dict[int, int]:
+    return dict(session.execute(
+        update(Todo)
+        .where(Todo.list_id == list_id, Todo.completed == False)  # noqa: E712
+        .values(completed=True, completed_at=completed_at(True), version=Todo.version + 1)
+        .returning(Todo.id, Todo.version)
+        .execution_options(synchronize_session=False)
+    ).all())
+
+
+# Delete every completed todo on a list whose subtasks are all completed
+# too, with those subtasks. Returns (deleted rows, rollups), as
+# delete_subtrees.
+def clear_completed(session: Session, list_id: int) -> tuple[list, list]:
+    ids = session.exec(
+        select(Todo.id)
+        .where(Todo.list_id == list_id, Todo.completed == True, Todo.subtasks_done == Todo.subtasks)  # noqa: E712
+    ).all()
+    return delete_subtrees(session, ids)
+
+
+# Delete the given todos on a list, {id: version last seen}, with all their
+# subtasks. Rows changed since are kept (with their subtasks). Returns
+# (deleted rows, rollups), as delete_subtrees.
+def delete_todos(session: Session, list_id: int, versions: dict[int, int]) -> tuple[list, list]:
+    ids = []
+    # Two bind parameters per row
+    for chunk in chunked(list(versions), CHUNK_SIZE // 2):
+        ids += session.exec(
+            select(Todo.id)
+            .where(Todo.list_id == list_id, tuple_(Todo.id, Todo.version).in_([(i, versions[i]) for i in chunk]))
+            .with_for_update()
+        ).all()
+    return delete_subtrees(session, ids)
+
+
+# Write `values` to a todo if it is still at `version`. For a move, also
+# require each of `neighbours` ({id: order key}) to still have the key the
+# new position was worked out from. Returns the new version, or None on a
+# conflict.
+def update_todo(session: Session, todo_id: int, version: int, values: dict, neighbours: dict[int, float] | None = None) -> int | None:
+    if "completed" in values:
+        values = {**values, "completed_at": completed_at(values["completed"])}
+    statement = update(Todo).where(Todo.id == todo_id, Todo.version == version)
+    for other_id, key in (neighbours or {}).items():
+        other = aliased(Todo)
+        statement = statement.where(exists().where(other.id == other_id, other.order == key))
+    return session.execute(
+        statement
+        .values(**values, version=Todo.version + 1)
+        .returning(Todo.version)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+
+# Write new order keys ({id: key}) to the rows still at the versions in
+# `versions`, with one UPDATE per chunk. Returns {id: new version} of the
+# rows written.
+def update_orders(session: Session, changes: dict[int, float], versions: dict[int, int]) -> dict[int, int]:
+    written = {}
+    # Four bind parameters per row
+    for chunk in chunked(list(changes), CHUNK_SIZE // 4):
+        written.update(session.execute(
+            update(Todo)
+            .where(tuple_(Todo.id, Todo.version).in_([(i, versions[i]) for i in chunk]))
+            .values(order=case({i: changes[i] for i in chunk}, value=Todo.id), version=Todo.version + 1)
+            .returning(Todo.id, Todo.version)
+            .execution_options(synchronize_session=False)
+        ).all())
+    return written
+
+
+# The todos with the given ids as they are now (deleted ones are missing)
+def current_rows(session: Session, ids: list[int]) -> list[Todo]:
+    rows = []
+    for chunk in chunked(ids):
+        rows += session.exec(select(Todo).where(Todo.id.in_(chunk))).all()
+    return rows
+
+
+# Move the given todos ({id: version last seen}, in the order they should
+# end up) to the top or bottom of their list. Returns ({id: new order key},
+# {id: new version}) for the rows that were moved.
+def move_todos(session: Session, list_id: int, versions: dict[int, int], to_top: bool = False) -> tuple[dict[int, float], dict[int, int]]:
+    if not versions:
+        return {}, {}
+    if to_top:
+        first = session.exec(select(func.min(Todo.order)).where(Todo.list_id == list_id)).one()
+        start = (first if first is not None else 0) - GAP * len(versions)
+    else:
+        last = session.exec(select(func.max(Todo.order)).where(Todo.list_id == list_id)).one()
+        start = (last if last is not None else -GAP) + GAP
+    changes = {todo_id: start + GAP * n for n, todo_id in enumerate(versions)}
+    written = update_orders(session, changes, versions)
+    return {todo_id: key for todo_id, key in changes.items() if todo_id in written}, written
+
+
+# Condition for a todo and every todo below it, through the closure table
+def in_subtree(todo_id: int):
+    return or_(Todo.id == todo_id, Todo.id.in_(select(TodoTree.descendant).where(TodoTree.ancestor == todo_id)))
+
+
+# Mark a todo and every todo below it as completed (or not) with one
+# UPDATE, if the todo is still at `version`. Returns ({id: new version} of
+# the rows that changed, the new rollups as _rollup).
+def complete_subtree(session: Session, todo_id: int, completed: bool, version: int | None = None) -> tuple[dict[int, int], list]:
+    statement = update(Todo).where(in_subtree(todo_id), Todo.completed != completed)
+    if version is not None:
+        top = aliased(Todo)
+        statement = statement.where(exists().where(top.id == todo_id, top.version == version))
+    changed = dict(session.execute(
+        statement
+        .values(completed=completed, completed_at=completed_at(completed), version=Todo.version + 1)
+        .returning(Todo.id, Todo.version)
+        .execution_options(synchronize_session=False)
+    ).all())
+    return changed, rollup_completed(session, dict.fromkeys(changed, completed))
+
+
+# The subtasks of a task one level down, in order: one range of the
+# (list_id, parent_id, order, id) index
+def load_subtasks(session: Session, list_id: int, parent_id: int) -> list[Todo]:
+    return session.exec(
+        select(Todo).where(Todo.list_id == list_id, Todo.parent_id == parent_id).order_by(Todo.order, Todo.id)
+    ).all()
+
+
+# Every subtask below a task, at every level, with one query on the closure
+# table. Returns (todo, depth) pairs, each subtask right after its parent
+# and siblings in order, the way the details page lists them.
+def load_subtree(session: Session, todo_id: int) -> list[tuple[Todo, int]]:
+    rows = session.exec(
+        select(Todo, TodoTree.depth)
+        .join(TodoTree, TodoTree.descendant == Todo.id)
+        .where(TodoTree.ancestor == todo_id)
+        .order_by(Todo.order, Todo.id)
+    ).all()
+    children = defaultdict(list)
+    for todo, depth in rows:
+        children[todo.parent_id].append((todo, depth))
+    ordered = []
+    stack = list(reversed(children[todo_id]))
+    while stack:
+        todo, depth = stack.pop()
+        ordered.append((todo, depth))
+        stack += reversed(children[todo.id])
+    return ordered
+
+
+# The given todos and every todo below them, deepest first, so deleting
+# them in this order never leaves a subtask without its parent
+def subtree_ids(session: Session, ids: list[int]) -> list[int]:
+    depths = dict.fromkeys(ids, 0)
+    for chunk in chunked(ids):
+        for todo_id, depth in session.execute(
+            select(TodoTree.descendant, func.max(TodoTree.depth))
+            .where(TodoTree.ancestor.in_(chunk))
+            .group_by(TodoTree.descendant)
+        ).all():
+            depths[todo_id] = max(depth, depths.get(todo_id, 0))
+    return sorted(depths, key=depths.get, reverse=True)
+
+
+# Add (sign 1) or take away (sign -1) the given todos from the rollups of
+# every todo above them, with one UPDATE per chunk that counts them below
+# each ancestor in the closure table. Returns the new rollups, as rows of
+# (id, list_id, subtasks, subtasks_done).
+def _rollup(session: Session, ids: list[int], sign: int) -> list:
+    below = aliased(Todo)
+    rollups = {}
+    # Three bind parameters per id
+    for chunk in chunked(ids, CHUNK_SIZE // 3):
+        under = (TodoTree.ancestor == Todo.id, TodoTree.descendant.in_(chunk))
+        count = select(func.count()).select_from(TodoTree).where(*under).scalar_subquery()
+        done = (
+            select(func.count()).select_from(TodoTree).join(below, below.id == TodoTree.descendant)
+            .where(*under, below.completed == True)  # noqa: E712
+            .scalar_subquery()
+        )
+        rollups.update((row.id, row) for row in session.execute(
+            update(Todo)
+            .where(Todo.id.in_(select(TodoTree.ancestor).where(TodoTree.descendant.in_(chunk))))
+            .values(
+                subtasks=Todo.subtasks + count if sign > 0 else Todo.subtasks - count,
+                subtasks_done=Todo.subtasks_done + done if sign > 0 else Todo.subtasks_done - done,
+            )
+            .returning(Todo.id, Todo.list_id, Todo.subtasks, Todo.subtasks_done)
+            .execution_options(synchronize_session=False)
+        ).all())
+    return list(rollups.values())
+
+
+# Put new (or restored) todos into the hierarchy, given as (id, parent_id)
+# with parents before their subtasks: their closure rows are their parent's
+# plus the parent itself, and they are added to the rollups of every todo
+# above them. Restored todos are inserted with zero rollups; they get them
+# back from their restored subtasks here. Returns the new rollups, as
+# _rollup.
+def attach_subtasks(session: Session, rows: list[tuple[int, int | None]]) -> list:
+    parents = dict(rows)
+    above = defaultdict(list)
+    outside = list({parent for parent in parents.values() if parent is not None and parent not in parents})
+    for chunk in chunked(outside):
+        for ancestor, descendant, depth in session.execute(
+            select(TodoTree.ancestor, TodoTree.descendant, TodoTree.depth).where(TodoTree.descendant.in_(chunk))
+        ).all():
+            above[descendant].append((ancestor, depth))
+    links = []
+    for todo_id, parent in rows:
+        if parent is not None:
+            above[todo_id] = [(parent, 1)] + [(ancestor, depth + 1) for ancestor, depth in above[parent]]
+            links += [{"ancestor": ancestor, "descendant": todo_id, "depth": depth} for ancestor, depth in above[todo_id]]
+    if links:
+        session.execute(insert(TodoTree), links)
+    return _rollup(session, [todo_id for todo_id, parent in rows if parent is not None], 1)
+
+
+# Delete the given todos with every todo below them, and take them away
+# from the rollups of the todos above. Returns (deleted rows, rollups of
+# the todos above that are left, as _rollup).
+def delete_subtrees(session: Session, ids: list[int]) -> tuple[list, list]:
+    ids = subtree_ids(session, ids)
+    rollups = _rollup(session, ids, -1)
+    for chunk in chunked(ids):
+        session.execute(
+            delete(TodoTree).where(TodoTree.descendant.in_(chunk)).execution_options(synchronize_session=False)
+        )
+    deleted = []
+    for chunk in chunked(ids):
+        deleted += session.execute(
+            delete(Todo)
+            .where(Todo.id.in_(chunk))
+            .returning(*TODO_COLUMNS)
+            .execution_options(synchronize_session=False)
+        ).all()
+    gone = {row.id for row in deleted}
+    return deleted, [row for row in rollups if row.id not in gone]
+
+
+# Keep the rollups of the todos above some todos whose completed flag a
+# write just changed ({id: completed now}) in step, with one UPDATE per
+# chunk. Returns the new rollups, as _rollup.
+def rollup_completed(session: Session, flips: dict[int, bool]) -> list:
+    rollups = {}
+    # Three bind parameters per id
+    for chunk in chunked(list(flips), CHUNK_SIZE // 3):
+        counts = [
+            select(func.count()).select_from(TodoTree)
+            .where(TodoTree.ancestor == Todo.id, TodoTree.descendant.in_([i for i in chunk if flips[i] == done]))
+            .scalar_subquery()
+            for done in (True, False)
+        ]
+        rollups.update((row.id, row) for row in session.execute(
+            update(Todo)
+            .where(Todo.id.in_(select(TodoTree.ancestor).where(TodoTree.descendant.in_(chunk))))
+            .values(subtasks_done=Todo.subtasks_done + counts[0] - counts[1])
+            .returning(Todo.id, Todo.list_id, Todo.subtasks, Todo.subtasks_done)
+            .execution_options(synchronize_session=False)
+        ).all())
+    return list(rollups.values())
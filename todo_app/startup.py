@@ -0,0 +1,80 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Startup profile: where a new worker spends its time before it can serve
+# its first request. Imports the app in a fresh interpreter with
+# `python -X importtime`, then builds and renders every page, and reports
+# the slowest imports and the import, build and render time of each page.
+#
+#     python -m todo_app.startup --top 20
+#
+# For a quick check on a running worker, set TODO_PROFILE_STARTUP=1 instead
+# (see rxconfig.py).
+
+# One line of -X importtime output: self and cumulative microseconds, module
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+# Import the app in a new interpreter and return (module, self seconds,
+# cumulative seconds) for every module it imported
+def import_times(module: str = "todo_app.todo_app") -> list[tuple[str, float, float]]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, capture_output=True, text=True, check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, name = match.groups()
+            times.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return times
+
+
+# Build and render every page of the app; returns seconds per step, by route
+def compile_times() -> dict[str, dict[str, float]]:
+    from reflex.compiler.compiler import compile_page, compile_unevaluated_page
+    from .todo_app import app
+    from . import pages
+
+    times = {}
+    for route, page in app._unevaluated_pages.items():
+        component = compile_unevaluated_page(route, page, app.style, app.theme)
+        start = time.perf_counter()
+        compile_page(route, component)
+        built = pages.timings.get(getattr(page.component, "route", route), {})
+        times[route] = {**built, "render": time.perf_counter() - start}
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report where app startup spends its time.")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    args = parser.parse_args()
+
+    times = import_times()
+    total = max(cumulative for _, _, cumulative in times)
+    print(f"Importing the app: {total * 1000:.1f} ms\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, own, cumulative in sorted(times, key=lambda t: t[2], reverse=True)[:args.top]:
+        print(f"{cumulative * 1000:>14.1f} {own * 1000:>9.1f}  {name}")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  app module")
+    for name, own, cumulative in sorted(times, key=lambda t: t[2], reverse=True):
+        if name.startswith("todo_app") or name == "rxconfig":
+            print(f"{cumulative * 1000:>14.1f} {own * 1000:>9.1f}  {name}")
+
+    print(f"\n{'import ms':>10} {'build ms':>9} {'render ms':>10}  page")
+    for route, took in compile_times().items():
+        print(
+            f"{took.get('import', 0) * 1000:>10.1f} {took.get('build', 0) * 1000:>9.1f}"
+            f" {took['render'] * 1000:>10.1f}  {route}"
+        )
+
+
+if __name__ == "__main__":
+    main()
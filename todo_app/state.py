@@ -1,40 +1,177 @@
+import bisect
+import dataclasses
+import time
+from datetime import datetime
 import reflex as rx
-from sqlmodel import select
-from .models import Todo
-import os
+from reflex.utils import prerequisites
+from .models import DEFAULT_LIST_ID, ArchivedRow, ListRow, SubtaskRow, Todo, TodoList, TodoRow
+from .ordering import key_between, next_order, plan_reorder, rebalance, too_dense
+from . import services
+from .cache import snapshots
+from .thumbnails import generate_variants
+from .uploads import UploadError, save_upload
+from .db import asession, read_session
+from .writebehind import writes
+from . import writebehind
+from . import changefeed
+from . import journal
+from .changefeed import Change, deleted, inserted, resync, rolled_up
+from .reminders import scheduler
+from contextlib import asynccontextmanager
+import rxconfig
+
+
+# The slim row State.todos keeps for a database row
+def todo_to_row(todo: Todo) -> TodoRow:
+    return TodoRow(
+        id=todo.id, text=todo.text, completed=todo.completed,
+        subtasks=todo.subtasks, subtasks_done=todo.subtasks_done,
+    )
+
+
+# The row State.subtasks keeps for a subtask `depth` levels down
+def subtask_to_row(todo: Todo, depth: int) -> SubtaskRow:
+    return SubtaskRow(
+        id=todo.id, text=todo.text, completed=todo.completed, depth=depth,
+        subtasks=todo.subtasks, subtasks_done=todo.subtasks_done,
+    )
+
+
+# New subtask counts by id, from the rollup changes among `changes`
+def rollups_of(changes: list[Change]) -> dict[int, dict]:
+    return {change.id: change.fields for change in changes if change.op == "rollup"}
+
+
+# Where a loaded subtask's own subtasks end in its expanded task's rows
+def subtree_end(rows: list[SubtaskRow], index: int) -> int:
+    end = index + 1
+    while end < len(rows) and rows[end].depth > rows[index].depth:
+        end += 1
+    return end
+
+
+# All of a task's fields, for the details pages
+def todo_to_dict(todo: Todo) -> dict:
+    return {
+        "id": todo.id,
+        "text": todo.text,
+        "description": todo.description,
+        "completed": todo.completed,
+        "image": getattr(todo, "image", ""),
+        "order": getattr(todo, "order", 0),
+        "version": getattr(todo, "version", 1),
+        "due_at": to_local_input(todo.due_at),
+        "remind_at": to_local_input(todo.remind_at),
+    }
+
+
+# A timestamp as the value of a datetime-local input ("" for none)
+def to_local_input(value: datetime | None) -> str:
+    return f"{value:%Y-%m-%dT%H:%M}" if value else ""
+
+
+# A datetime-local input's value as a timestamp (None when empty or invalid)
+def from_local_input(value: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+# The index page's filters, and the `completed` value each one shows (None: all)
+FILTERS = {"all": None, "active": False, "completed": True}
+
+# Seconds a change follower waits before checking its tab is still open
+FOLLOW_IDLE_SECONDS = 30
+
+
+# Commit a write, publish what changed to the other open sessions and tell
+# the shared list cache that the list changed
+async def commit(session, list_id: int, changes: list[Change]):
+    await changefeed.commit(session, changes)
+    snapshots.bump(list_id)
+
+
+# True while the browser tab with this client token is connected
+def connected(token: str) -> bool:
+    namespace = prerequisites.get_and_validate_app().app.event_namespace
+    return namespace is None or token in namespace.token_to_sid
+
+
+# Open a session for a write. Changes staged by the write-behind queue are
+# flushed first, so they can't land on top of this write later; `versions`
+# (the row versions the session with client token `owner` knows) is brought
+# up to date with what the queue wrote of that session's staged edits, this
+# flush or an earlier one, so it doesn't conflict with its own edits.
+@asynccontextmanager
+async def write_session(versions: dict[int, int] | None = None, owner: str | None = None):
+    await writes.flush()
+    if versions is not None and owner is not None:
+        writes.catch_up(owner, versions)
+    async with asession() as session:
+        yield session
+
+
+# What a session tells the user when another session's write got to a task first
+CONFLICT_MESSAGE = "Someone else changed this task first; it now shows their change."
 
 
 # This is the main class that keeps track of all the app's data and logic.
 class State(rx.State):
     # Move a todo up in the order
-    def move_todo_up(self, index: int):
-        if index > 0:
-            todos = self.todos.copy()
-            # Swap order values
-            id1, id2 = todos[index]["id"], todos[index-1]["id"]
-            with rx.session() as session:
-                todo1 = session.get(Todo, id1)
-                todo2 = session.get(Todo, id2)
-                if todo1 and todo2:
-                    todo1.order, todo2.order = todo2.order, todo1.order
-                session.commit()
-            self.load_todos()
+    async def move_todo_up(self, todo_id: int):
+        index = self._index_of(todo_id)
+        if index is not None and index > 0:
+            return await self._move_todo(index, index - 1)
 
     # Move a todo down in the order
-    def move_todo_down(self, index: int):
-        if index < len(self.todos) - 1:
-            todos = self.todos.copy()
-            # Swap order values
-            id1, id2 = todos[index]["id"], todos[index+1]["id"]
-            with rx.session() as session:
-                todo1 = session.get(Todo, id1)
-                todo2 = session.get(Todo, id2)
-                if todo1 and todo2:
-                    todo1.order, todo2.order = todo2.order, todo1.order
-                session.commit()
-            self.load_todos()
-    # List of all tasks (each task is a dictionary)
-    todos: list[dict] = []
+    async def move_todo_down(self, todo_id: int):
+        index = self._index_of(todo_id)
+        if index is not None and (index < len(self.todos) - 1 or self.has_more):
+            return await self._move_todo(index, index + 1)
+
+    # The list being shown; every handler below only touches this list
+    list_id: int = DEFAULT_LIST_ID
+    # All lists, for the list picker
+    lists: list[ListRow] = []
+    # The name for a new list being typed
+    new_list_name: str = ""
+    # The loaded tasks, from the top of the list down
+    todos: list[TodoRow] = []
+    # Bumped to stop the running change follower (see follow_changes)
+    _follow_generation: int = 0
+    # Order key of each loaded task by id; only the server needs these
+    _orders: dict[int, float] = {}
+    # Version of each loaded task by id, as this session last saw it
+    _versions: dict[int, int] = {}
+    # Journal entries of this session's writes that can be undone, and of
+    # its undos that can be redone, most recent last (see journal.py)
+    _undo: list[int] = []
+    _redo: list[int] = []
+    # Whether the Undo and Redo buttons have anything to do
+    can_undo: bool = False
+    can_redo: bool = False
+    # Until when (time.time()) this session reads from the primary, because
+    # it wrote and a replica may not have caught up yet
+    _primary_until: float = 0.0
+    # Subtasks of the expanded top-level tasks, by top-level task id: each
+    # loaded subtask comes right after its parent. They are only read from
+    # the database when a task is expanded, one level at a time.
+    subtasks: dict[int, list[SubtaskRow]] = {}
+    # Version of each loaded subtask by id, as this session last saw it
+    _subtask_versions: dict[int, int] = {}
+    # The text for a new subtask being typed
+    new_subtask: str = ""
+    # Every subtask of the selected task, for the details page
+    selected_subtasks: list[SubtaskRow] = []
+    # True when there are more tasks in the database below the loaded ones
+    has_more: bool = False
+    # Which tasks are shown: "all", "active" or "completed" (see FILTERS)
+    filter_mode: str = "all"
+    # How many tasks the list has in all, open and completed
+    count_all: int = 0
+    count_active: int = 0
+    count_completed: int = 0
     # The text for a new task being typed
     new_todo: str = ""
     # Index of the task being edited
@@ -45,11 +182,39 @@ class State(rx.State):
     selected_todo: dict | None = None
     # Message to show when something is successfully done
     success_message: str = ""
+    # Message to show when something went wrong
+    error_message: str = ""
+    # The last reminder that went out for a task on this list
+    reminder_message: str = ""
+    # Ids of the tasks ticked for a bulk action
+    selected_ids: list[int] = []
+    # What the user typed in the search box
+    search_query: str = ""
+    # Tasks matching the search, best match first
+    search_results: list[TodoRow] = []
+    # True when more search results can be loaded
+    search_has_more: bool = False
+    # True while the list's archived tasks are shown
+    show_archived: bool = False
+    # Archived tasks loaded so far, most recently completed first
+    archived: list[ArchivedRow] = []
+    # True when more archived tasks can be loaded
+    archived_has_more: bool = False
+    # Keyset cursor (completed_at, id) of the last archived task loaded
+    _archived_cursor: tuple | None = None
 
     # Update the text for a new task
     def set_new_todo(self, value: str):
         self.new_todo = value
 
+    # Update the text for a new subtask
+    def set_new_subtask(self, value: str):
+        self.new_subtask = value
+
+    # Update the name for a new list
+    def set_new_list_name(self, value: str):
+        self.new_list_name = value
+
     # Update the text for the task being edited
     def set_edit_text(self, value: str):
         self.edit_text = value
@@ -58,94 +223,391 @@ class State(rx.State):
     def set_selected_text(self, value: str):
         if self.selected_todo:
             self.selected_todo["text"] = value
+            self._stage_selected(text=value)
 
     # Change the description of the selected task
     def set_selected_description(self, value: str):
         if self.selected_todo:
             self.selected_todo["description"] = value
+            self._stage_selected(description=value)
 
     # Mark the selected task as completed or not
     def set_selected_completed(self, value: bool):
         if self.selected_todo:
             self.selected_todo["completed"] = value
+            self._stage_selected(completed=value)
+
+    # Set when the selected task is due (saved with the Save button)
+    def set_selected_due(self, value: str):
+        if self.selected_todo:
+            self.selected_todo["due_at"] = value
+
+    # Set when to be reminded of the selected task (saved with the Save button)
+    def set_selected_remind(self, value: str):
+        if self.selected_todo:
+            self.selected_todo["remind_at"] = value
+
+    # Hide the reminder message
+    def dismiss_reminder(self):
+        self.reminder_message = ""
+
+    # In write-behind mode, edits to the selected task are saved as you type
+    def _stage_selected(self, **fields):
+        if writebehind.enabled():
+            writes.stage(self.router.session.client_token, self.selected_todo["id"], **fields)
+
+    # Write any staged changes now (pages call this when they unmount)
+    async def flush_pending(self):
+        await writes.flush()
 
     # Save an uploaded image for the selected task
-    def set_selected_image(self, file):
-        if self.selected_todo and file:
-            assets_dir = os.path.join(os.path.dirname(__file__), "..", "assets")
-            os.makedirs(assets_dir, exist_ok=True)
-            file_path = os.path.join(assets_dir, file.name)
-            with open(file_path, "wb") as f:
-                f.write(file.content)
-            self.selected_todo["image"] = file.name
-
-    # Load all tasks from the database and update the list, ordered by 'order' field
-    def load_todos(self):
-        with rx.session() as session:
-            self.todos = [
-                {
-                    "id": todo.id,
-                    "text": todo.text,
-                    "description": todo.description,
-                    "completed": todo.completed,
-                    "image": getattr(todo, "image", ""),
-                    "order": getattr(todo, "order", 0)
-                }
-                for todo in session.exec(select(Todo).order_by(Todo.order)).all()
-            ]
+    async def handle_upload(self, files: list[rx.UploadFile]):
+        if self.selected_todo and files:
+            try:
+                self.selected_todo["image"] = await save_upload(files[0])
+                self.error_message = ""
+                generate_variants(self.selected_todo["image"])
+            except UploadError as error:
+                self.error_message = str(error)
+
+    # Journal a write in its transaction; it becomes the next thing to undo
+    async def _journal(self, session, list_id: int, op: str, rows: list[dict]):
+        entry_id = await session.run_sync(journal.record, list_id, op, rows)
+        if entry_id is not None:
+            self._undo = [*self._undo, entry_id][-rxconfig.undo_depth:]
+            self._redo = []
+            self._history_changed()
+
+    # Keep the Undo and Redo buttons in step with what there is to do
+    def _history_changed(self):
+        self.can_undo = bool(self._undo)
+        self.can_redo = bool(self._redo)
+
+    # Open a session for a write. This session's reads stick to the primary
+    # for replica_max_lag_s afterwards, so it always sees its own writes.
+    @asynccontextmanager
+    async def _write_session(self, versions: dict[int, int] | None = None):
+        self._primary_until = time.time() + rxconfig.replica_max_lag_s
+        versions = self._versions if versions is None else versions
+        async with write_session(versions, self.router.session.client_token) as session:
+            yield session
+
+    # True when a read must go to the primary: this session wrote recently,
+    # or (for reads cached for every session) the list changed recently
+    def _reads_primary(self, list_id: int | None = None) -> bool:
+        if time.time() < self._primary_until:
+            return True
+        return list_id is not None and snapshots.age(list_id) < rxconfig.replica_max_lag_s
+
+    # Load the first page of tasks from the database, ordered by 'order' field.
+    # If more pages are already showing, reload that many rows so the view
+    # doesn't jump back to the top.
+    async def load_todos(self):
+        limit = max(len(self.todos), services.PAGE_SIZE + services.PREFETCH)
+        rows = await self._load_page(None, limit + 1)
+        await self._load_counts()
+        self.todos = [row for row, _, _ in rows[:limit]]
+        self._orders = {row.id: order for row, order, _ in rows[:limit]}
+        self._versions = {row.id: version for row, _, version in rows[:limit]}
+        self.has_more = len(rows) > limit
+        # Expanded tasks show their subtasks as they were read; start over
+        self.subtasks = {}
+        self._subtask_versions = {}
+
+    # Load the next page of tasks after the last one showing
+    async def load_more_todos(self):
+        if not (self.has_more and self.todos):
+            return
+        rows = await self._load_page(self._cursor(), services.PAGE_SIZE + 1)
+        self.todos.extend(row for row, _, _ in rows[:services.PAGE_SIZE])
+        self._orders.update((row.id, order) for row, order, _ in rows[:services.PAGE_SIZE])
+        self._versions.update((row.id, version) for row, _, version in rows[:services.PAGE_SIZE])
+        self.has_more = len(rows) > services.PAGE_SIZE
+
+    # Keyset cursor (order, id) of the last loaded task
+    def _cursor(self) -> tuple[float, int]:
+        last = self.todos[-1].id
+        return (self._orders[last], last)
+
+    # Read a page of (row, order key, version) through the cache shared by all sessions
+    async def _load_page(self, after: tuple[float, int] | None, limit: int) -> tuple[tuple[TodoRow, float, int], ...]:
+        list_id = self.list_id
+        completed = FILTERS[self.filter_mode]
+        primary = self._reads_primary(list_id)
+
+        async def load():
+            async with read_session(primary) as session:
+                rows = await session.run_sync(services.load_page, list_id, after, limit, completed)
+                return [(todo_to_row(todo), todo.order, todo.version) for todo in rows]
+        return await snapshots.get(("page", completed, after, limit), load, partition=list_id)
+
+    # Read the filter counts with one aggregate query, through the same cache
+    async def _load_counts(self):
+        list_id = self.list_id
+        primary = self._reads_primary(list_id)
+
+        async def load():
+            async with read_session(primary) as session:
+                return await session.run_sync(services.count_todos, list_id)
+        total, completed = await snapshots.get(("counts",), load, partition=list_id)
+        self.count_all = total
+        self.count_active = total - completed
+        self.count_completed = completed
+
+    # Show only open tasks, only completed ones or all of them. Only the
+    # rows that are shown are read.
+    async def set_filter(self, mode: str):
+        if mode in FILTERS and mode != self.filter_mode:
+            self.filter_mode = mode
+            self.todos = []
+            self.selected_ids = []
+            self.edit_index = -1
+            await self.load_todos()
+
+    # True if a task that is (or isn't) completed belongs in the current filter
+    def _shows(self, completed: bool) -> bool:
+        return FILTERS[self.filter_mode] in (None, completed)
+
+    # Load the lists for the list picker
+    async def load_lists(self):
+        async with read_session(self._reads_primary()) as session:
+            lists = await session.run_sync(services.load_lists)
+            self.lists = [ListRow(id=todo_list.id, name=todo_list.name) for todo_list in lists]
+
+    # Show another list
+    async def select_list(self, list_id: int):
+        self.list_id = list_id
+        self.todos = []
+        self._orders = {}
+        self._versions = {}
+        self.has_more = False
+        self.selected_ids = []
+        self.edit_index = -1
+        self.search_query = ""
+        self.search_results = []
+        self.search_has_more = False
+        self._hide_archived()
+        await self.load_todos()
+        return State.follow_changes
+
+    # Create a new list and switch to it
+    async def add_list(self):
+        if self.new_list_name.strip():
+            async with self._write_session() as session:
+                todo_list = TodoList(name=self.new_list_name.strip())
+                session.add(todo_list)
+                await session.commit()
+            self.new_list_name = ""
+            await self.load_lists()
+            return await self.select_list(todo_list.id)
+
+    # The helpers below patch only the changed rows into self.todos, so a
+    # handler does not have to re-read the whole table after every click.
+    # Writes only go through if the rows are still at the versions this
+    # session last saw; when one loses to someone else's write, just the
+    # rows involved are re-read and patched in (see _reconcile).
+
+    # Position of a loaded task, or None if it isn't showing
+    def _index_of(self, todo_id: int) -> int | None:
+        return next((i for i, todo in enumerate(self.todos) if todo.id == todo_id), None)
+
+    # Insert a freshly written row at the given position
+    def _insert_todo(self, index: int, row: TodoRow, order: float, version: int):
+        self.todos.insert(index, row)
+        self._orders[row.id] = order
+        self._versions[row.id] = version
+
+    # Replace the row at the given position with what was just written
+    def _replace_todo(self, index: int, row: TodoRow, version: int):
+        self.todos[index] = row
+        self._versions[row.id] = version
+
+    # Drop the row at the given position after it was deleted
+    def _drop_todo(self, index: int, todo_id: int):
+        del self.todos[index]
+        self._orders.pop(todo_id, None)
+        self._versions.pop(todo_id, None)
+        self._collapse(todo_id)
+
+    # Move a row to a new position after its order key was rewritten
+    def _place_todo(self, index: int, new_index: int, order: float, version: int):
+        row = self.todos.pop(index)
+        self.todos.insert(new_index, row)
+        self._orders[row.id] = order
+        self._versions[row.id] = version
+
+    # Re-read only these rows and patch them in as they are now (from the
+    # primary, since a replica may not have the write that beat ours yet)
+    async def _refresh_rows(self, ids: list[int]):
+        async with asession() as session:
+            rows = {todo.id: todo for todo in await session.run_sync(services.current_rows, ids)}
+        for todo_id in ids:
+            todo = rows.get(todo_id)
+            if todo is None or todo.list_id != self.list_id:
+                await self._apply_change(deleted(self.list_id, todo_id))
+            else:
+                await self._apply_change(inserted(todo))
+
+    # Another session's write got to these rows first: show them as they
+    # are now and tell the user
+    async def _reconcile(self, ids: list[int]):
+        await self._refresh_rows(ids)
+        self.error_message = CONFLICT_MESSAGE
+
+    # Write some fields of a loaded task if nobody changed it since we last
+    # saw it (and, for a move, its `neighbours` still have the keys we saw).
+    # Returns the new version, or None after reconciling a conflict.
+    async def _update_todo(self, todo_id: int, values: dict, neighbours: dict[int, float] | None = None) -> int | None:
+        known = self._versions if todo_id in self._versions else self._subtask_versions
+        async with self._write_session(known) as session:
+            old = await session.run_sync(journal.before, values, [todo_id])
+            version = await session.run_sync(
+                services.update_todo, todo_id, known[todo_id], values, neighbours
+            )
+            if version is not None:
+                rollups = []
+                if "completed" in values and todo_id in old and old[todo_id]["completed"] != values["completed"]:
+                    rollups = await session.run_sync(services.rollup_completed, {todo_id: values["completed"]})
+                await self._journal(session, self.list_id, "update", journal.updates({todo_id: version}, old, {todo_id: values}))
+                changes = [Change(self.list_id, todo_id, "update", values, version), *rolled_up(rollups)]
+                await commit(session, self.list_id, changes)
+        if version is None:
+            await self._reconcile([todo_id, *(neighbours or {})])
+        else:
+            self._set_rollups(rollups_of(changes))
+        return version
+
+    # Move the todo at `index` so it ends up at `new_index`. Only the moved
+    # row is written: it gets a key between its new neighbours, worked out
+    # from the loaded rows without reading them again.
+    async def _move_todo(self, index: int, new_index: int):
+        ids = [todo.id for todo in self.todos]
+        todo_id = ids.pop(index)
+        neighbours = {}
+        if new_index > len(ids):
+            # Moving past the last loaded row: its new neighbours are the
+            # next rows in the database, which aren't loaded yet. Read them
+            # from the primary: the key is written against them.
+            async with asession() as session:
+                beyond = await session.run_sync(
+                    services.load_page, self.list_id, self._cursor(), 2, FILTERS[self.filter_mode]
+                )
+            if not beyond:
+                # They were deleted; there is nothing below to move past
+                self.has_more = False
+                return
+            before_key = beyond[0].order
+            after_key = beyond[1].order if len(beyond) > 1 else None
+        else:
+            before_id = ids[new_index - 1] if new_index > 0 else None
+            after_id = ids[new_index] if new_index < len(ids) else None
+            neighbours = {i: self._orders[i] for i in (before_id, after_id) if i is not None}
+            before_key = neighbours.get(before_id)
+            after_key = neighbours.get(after_id)
+        key = key_between(before_key, after_key)
+        if writebehind.enabled() and new_index <= len(ids):
+            # Stage it, so a burst of up/down clicks becomes one write
+            writes.stage(self.router.session.client_token, todo_id, order=key)
+            self._place_todo(index, new_index, key, self._versions[todo_id])
+        else:
+            version = await self._update_todo(todo_id, {"order": key}, neighbours)
+            if version is None:
+                return
+            if new_index > len(ids):
+                self._drop_todo(index, todo_id)
+            else:
+                self._place_todo(index, new_index, key, version)
+        if too_dense(before_key, after_key):
+            return State.rebalance_orders
+
+    # Renumber all order keys when they got too close together. Runs in the
+    # background so the handler that noticed it is not held up.
+    @rx.event(background=True)
+    async def rebalance_orders(self):
+        list_id = self.list_id
+        async with write_session() as session:
+            await session.run_sync(rebalance, list_id)
+            await changefeed.commit(session, [resync(list_id)])
+        snapshots.bump(list_id)
+        async with self:
+            if self.list_id == list_id:
+                await self.load_todos()
 
     # Add a new task to the database and update the list
-    def add_todo(self):
+    async def add_todo(self):
         if self.new_todo.strip():
-            with rx.session() as session:
-                # Determine the next order value
-                max_order = session.exec(select(Todo.order)).all()
-                next_order = max(max_order) + 1 if max_order else 0
-                session.add(Todo(text=self.new_todo.strip(), description="", completed=False, order=next_order))
-                session.commit()
+            async with self._write_session() as session:
+                # The new task goes after the current last one
+                todo = Todo(
+                    text=self.new_todo.strip(), description="", completed=False,
+                    order=await session.run_sync(next_order, self.list_id), list_id=self.list_id,
+                )
+                session.add(todo)
+                await session.flush()
+                await self._journal(session, self.list_id, "insert", journal.images([todo]))
+                await commit(session, self.list_id, [inserted(todo)])
+                # If the end of the list isn't loaded, the new task shows up when it is
+                if not self.has_more and self._shows(False):
+                    self._insert_todo(len(self.todos), todo_to_row(todo), todo.order, todo.version)
             self.new_todo = ""
-            self.load_todos()
     # Reorder todos after drag-and-drop and persist new order in DB
-    def reorder_todos(self, new_order_list: list[int]):
+    async def reorder_todos(self, new_order_list: list[int]):
         """
         new_order_list: list of todo IDs in the new order
         """
-        with rx.session() as session:
-            for idx, todo_id in enumerate(new_order_list):
-                todo = session.get(Todo, todo_id)
-                if todo:
-                    todo.order = idx
-            session.commit()
-        self.load_todos()
+        ids = [todo_id for todo_id in new_order_list if todo_id in self._orders]
+        # Only rows that actually moved get a new key; a single drag writes one
+        # row, in one short UPDATE that takes no locks up front
+        changes, dense = plan_reorder(ids, self._orders)
+        async with self._write_session() as session:
+            old = await session.run_sync(journal.before, ["order"], list(changes))
+            written = await session.run_sync(services.update_orders, changes, self._versions)
+            await self._journal(session, self.list_id, "update", journal.updates(
+                written, old, {todo_id: {"order": changes[todo_id]} for todo_id in written}
+            ))
+            await commit(session, self.list_id, [
+                Change(self.list_id, todo_id, "update", {"order": changes[todo_id]}, version)
+                for todo_id, version in written.items()
+            ])
+        self._orders.update((todo_id, changes[todo_id]) for todo_id in written)
+        self._versions.update(written)
+        self.todos = sorted(self.todos, key=lambda todo: (self._orders[todo.id], todo.id))
+        conflicts = [todo_id for todo_id in changes if todo_id not in written]
+        if conflicts:
+            await self._reconcile(conflicts)
+        if dense:
+            return State.rebalance_orders
 
     # Remove a task from the database and update the list
-    def remove_todo(self, index: int):
-        if 0 <= index < len(self.todos):
-            todo_id = self.todos[index]["id"]
-            with rx.session() as session:
-                todo = session.get(Todo, todo_id)
-                if todo:
-                    session.delete(todo)
-                    session.commit()
-            self.load_todos()
+    async def remove_todo(self, todo_id: int):
+        index = self._index_of(todo_id)
+        if index is None:
+            return
+        async with self._write_session() as session:
+            gone, _ = await session.run_sync(services.delete_todos, self.list_id, {todo_id: self._versions[todo_id]})
+            if gone:
+                # Its subtasks go with it
+                await self._journal(session, self.list_id, "delete", journal.images(gone))
+                await commit(session, self.list_id, [deleted(self.list_id, row.id) for row in gone])
+        if gone:
+            self._drop_todo(index, todo_id)
+        else:
+            await self._reconcile([todo_id])
 
     # Start editing a task (store its index and text)
     def start_edit(self, index: int):
         self.edit_index = index
-        self.edit_text = self.todos[index]["text"]
+        self.edit_text = self.todos[index].text
 
     # Save changes to a task being edited
-    def save_edit(self):
+    async def save_edit(self):
         if 0 <= self.edit_index < len(self.todos):
-            todo_id = self.todos[self.edit_index]["id"]
-            with rx.session() as session:
-                todo = session.get(Todo, todo_id)
-                if todo:
-                    todo.text = self.edit_text
-                    session.commit()
+            row = self.todos[self.edit_index]
+            version = await self._update_todo(row.id, {"text": self.edit_text})
+            if version is not None:
+                self._replace_todo(self.edit_index, dataclasses.replace(row, text=self.edit_text), version)
             self.edit_index = -1
             self.edit_text = ""
-            self.load_todos()
 
     # Cancel editing a task
     def cancel_edit(self):
@@ -153,55 +615,630 @@ class State(rx.State):
         self.edit_text = ""
 
     # Toggle a task's completed status
-    def toggle_complete(self, index: int):
-        todo_id = self.todos[index]["id"]
-        with rx.session() as session:
-            todo = session.get(Todo, todo_id)
-            if todo:
-                todo.completed = not todo.completed
-                session.commit()
-        self.load_todos()
+    async def toggle_complete(self, todo_id: int):
+        index = self._index_of(todo_id)
+        if index is None:
+            return
+        row = self.todos[index]
+        completed = not row.completed
+        if row.subtasks:
+            return await self._complete_subtree(todo_id, completed)
+        if writebehind.enabled():
+            # Stage it; a quick second toggle just cancels the first
+            writes.stage(self.router.session.client_token, todo_id, completed=completed)
+            version = self._versions[todo_id]
+        else:
+            version = await self._update_todo(todo_id, {"completed": completed})
+            if version is None:
+                return
+        if self._shows(completed):
+            self._replace_todo(index, dataclasses.replace(row, completed=completed), version)
+        else:
+            self._drop_todo(index, todo_id)
+
+    # Tick or untick a task for a bulk action
+    def toggle_selected(self, todo_id: int):
+        if todo_id in self.selected_ids:
+            self.selected_ids.remove(todo_id)
+        else:
+            self.selected_ids.append(todo_id)
+
+    # Set the completed flag on the rows just written ({id: new version})
+    def _mark_completed(self, versions: dict[int, int], completed: bool = True):
+        if not self._shows(completed):
+            # They drop out of the filter
+            self._drop_todos([todo_id for todo_id in versions if todo_id in self._orders])
+        elif versions:
+            self.todos = [
+                dataclasses.replace(todo, completed=completed) if todo.id in versions else todo
+                for todo in self.todos
+            ]
+            self._versions.update((todo_id, version) for todo_id, version in versions.items() if todo_id in self._orders)
+        # The filter only applies to top-level tasks
+        for root_id, rows in list(self.subtasks.items()):
+            if any(row.id in versions for row in rows):
+                self.subtasks[root_id] = [
+                    dataclasses.replace(row, completed=completed) if row.id in versions else row for row in rows
+                ]
+        self._subtask_versions.update(
+            (todo_id, version) for todo_id, version in versions.items() if todo_id in self._subtask_versions
+        )
+
+    # Drop the listed rows from the list without reloading
+    def _drop_todos(self, ids: list[int]):
+        gone = set(ids)
+        if gone:
+            self.todos = [todo for todo in self.todos if todo.id not in gone]
+            self.selected_ids = [todo_id for todo_id in self.selected_ids if todo_id not in gone]
+            for todo_id in gone:
+                self._orders.pop(todo_id, None)
+                self._versions.pop(todo_id, None)
+                self._collapse(todo_id)
+            # Deleted subtasks; their own subtasks were deleted with them
+            for root_id, rows in list(self.subtasks.items()):
+                if any(row.id in gone for row in rows):
+                    self.subtasks[root_id] = [row for row in rows if row.id not in gone]
+            for todo_id in gone & set(self._subtask_versions):
+                del self._subtask_versions[todo_id]
+
+    # Feed changes for rows a bulk action updated ({id: new version})
+    def _updates(self, versions: dict[int, int], **fields) -> list[Change]:
+        return [Change(self.list_id, todo_id, "update", fields, version) for todo_id, version in versions.items()]
+
+    # Mark every task as completed in one UPDATE
+    async def complete_all(self):
+        async with self._write_session() as session:
+            old = await session.run_sync(
+                journal.before, ["completed"], None, (Todo.list_id == self.list_id, Todo.completed == False)  # noqa: E712
+            )
+            versions = await session.run_sync(services.complete_all, self.list_id)
+            rollups = await session.run_sync(services.rollup_completed, dict.fromkeys(versions, True))
+            await self._journal(session, self.list_id, "update", journal.updates(
+                versions, old, {todo_id: {"completed": True} for todo_id in versions}
+            ))
+            changes = self._updates(versions, completed=True) + rolled_up(rollups)
+            await commit(session, self.list_id, changes)
+        self._mark_completed(versions)
+        self._set_rollups(rollups_of(changes))
+
+    # Delete every completed task (and its subtasks, if they are all
+    # completed too)
+    async def clear_completed(self):
+        async with self._write_session() as session:
+            rows, rollups = await session.run_sync(services.clear_completed, self.list_id)
+            await self._journal(session, self.list_id, "delete", journal.images(rows))
+            changes = [deleted(self.list_id, row.id) for row in rows] + rolled_up(rollups)
+            await commit(session, self.list_id, changes)
+        self._drop_todos([row.id for row in rows])
+        self._set_rollups(rollups_of(changes))
+
+    # Mark the ticked tasks as completed
+    async def complete_selected(self):
+        async with self._write_session() as session:
+            old = await session.run_sync(journal.before, ["completed"], list(self.selected_ids))
+            versions = await session.run_sync(services.set_completed, self.list_id, list(self.selected_ids))
+            rollups = await session.run_sync(services.rollup_completed, dict.fromkeys(versions, True))
+            await self._journal(session, self.list_id, "update", journal.updates(
+                versions, old, {todo_id: {"completed": True} for todo_id in versions}
+            ))
+            changes = self._updates(versions, completed=True) + rolled_up(rollups)
+            await commit(session, self.list_id, changes)
+        self._mark_completed(versions)
+        self._set_rollups(rollups_of(changes))
+        self.selected_ids = []
+
+    # Delete the ticked tasks, unless someone changed them since we saw them
+    async def delete_selected(self):
+        async with self._write_session() as session:
+            versions = {todo_id: self._versions[todo_id] for todo_id in self.selected_ids if todo_id in self._versions}
+            rows, _ = await session.run_sync(services.delete_todos, self.list_id, versions)
+            await self._journal(session, self.list_id, "delete", journal.images(rows))
+            await commit(session, self.list_id, [deleted(self.list_id, row.id) for row in rows])
+        ids = [row.id for row in rows]
+        self._drop_todos(ids)
+        self.selected_ids = []
+        conflicts = [todo_id for todo_id in versions if todo_id not in set(ids)]
+        if conflicts:
+            await self._reconcile(conflicts)
+
+    # Move the ticked tasks, keeping their current order, to the top or bottom
+    async def _move_selected(self, to_top: bool):
+        selected = set(self.selected_ids)
+        async with self._write_session() as session:
+            versions = {todo.id: self._versions[todo.id] for todo in self.todos if todo.id in selected}
+            old = await session.run_sync(journal.before, ["order"], list(versions))
+            changes, written = await session.run_sync(services.move_todos, self.list_id, versions, to_top=to_top)
+            await self._journal(session, self.list_id, "update", journal.updates(
+                written, old, {todo_id: {"order": key} for todo_id, key in changes.items()}
+            ))
+            await commit(session, self.list_id, [
+                Change(self.list_id, todo_id, "update", {"order": key}, written[todo_id])
+                for todo_id, key in changes.items()
+            ])
+        moved = [todo for todo in self.todos if todo.id in changes]
+        rest = [todo for todo in self.todos if todo.id not in changes]
+        self._orders.update(changes)
+        self._versions.update(written)
+        if to_top:
+            self.todos = moved + rest
+        else:
+            # Rows moved to the bottom drop out of view if the end isn't loaded
+            self.todos = rest if self.has_more else rest + moved
+            if self.has_more:
+                for todo in moved:
+                    self._orders.pop(todo.id, None)
+                    self._versions.pop(todo.id, None)
+        self.selected_ids = []
+        conflicts = [todo_id for todo_id in versions if todo_id not in written]
+        if conflicts:
+            await self._reconcile(conflicts)
+
+    # Move the ticked tasks to the top of the list
+    async def move_selected_to_top(self):
+        await self._move_selected(to_top=True)
+
+    # Move the ticked tasks to the bottom of the list
+    async def move_selected_to_bottom(self):
+        await self._move_selected(to_top=False)
+
+    # Show or hide the subtasks of a task, top-level or itself a subtask.
+    # They are read when the task is expanded, one level at a time, so a
+    # big subtree costs nothing until someone opens it.
+    async def toggle_subtasks(self, todo_id: int):
+        found = self._find_subtask(todo_id)
+        if found is None:
+            if todo_id in self.subtasks:
+                self._collapse(todo_id)
+            elif todo_id in self._orders:
+                self.subtasks[todo_id] = await self._load_subtasks(todo_id, 1)
+            return
+        root_id, index = found
+        rows = self.subtasks[root_id]
+        row = rows[index]
+        end = subtree_end(rows, index)
+        if row.expanded:
+            for below in rows[index + 1:end]:
+                self._subtask_versions.pop(below.id, None)
+            self.subtasks[root_id] = [*rows[:index], dataclasses.replace(row, expanded=False), *rows[end:]]
+        else:
+            children = await self._load_subtasks(todo_id, row.depth + 1)
+            self.subtasks[root_id] = [*rows[:index], dataclasses.replace(row, expanded=True), *children, *rows[end:]]
+
+    # Read the subtasks one level below a task, as rows `depth` levels down
+    async def _load_subtasks(self, parent_id: int, depth: int) -> list[SubtaskRow]:
+        async with read_session(self._reads_primary()) as session:
+            rows = await session.run_sync(services.load_subtasks, self.list_id, parent_id)
+        self._subtask_versions.update((todo.id, todo.version) for todo in rows)
+        return [subtask_to_row(todo, depth) for todo in rows]
+
+    # Add a subtask, with the text typed for it, under a task
+    async def add_subtask(self, parent_id: int):
+        if not self.new_subtask.strip():
+            return
+        async with self._write_session() as session:
+            parent = await session.get(Todo, parent_id)
+            if parent is not None and parent.list_id == self.list_id:
+                todo = Todo(
+                    text=self.new_subtask.strip(), list_id=self.list_id, parent_id=parent_id,
+                    order=await session.run_sync(next_order, self.list_id),
+                )
+                session.add(todo)
+                await session.flush()
+                rollups = await session.run_sync(services.attach_subtasks, [(todo.id, parent_id)])
+                await self._journal(session, self.list_id, "insert", journal.images([todo]))
+                changes = [inserted(todo), *rolled_up(rollups)]
+                await commit(session, self.list_id, changes)
+        if parent is None or parent.list_id != self.list_id:
+            return await self._reconcile([parent_id])
+        self.new_subtask = ""
+        found = self._find_subtask(parent_id)
+        if parent_id in self.subtasks or (found and self.subtasks[found[0]][found[1]].expanded):
+            for change in changes:
+                await self._apply_change(change)
+        else:
+            # Show it: expanding reads it with its siblings
+            self._set_rollups(rollups_of(changes))
+            await self.toggle_subtasks(parent_id)
+
+    # Toggle a subtask's completed status; the tasks above it count it
+    async def toggle_subtask(self, todo_id: int):
+        found = self._find_subtask(todo_id)
+        if found is None:
+            return
+        root_id, index = found
+        row = self.subtasks[root_id][index]
+        if row.subtasks:
+            return await self._complete_subtree(todo_id, not row.completed)
+        completed = not row.completed
+        version = await self._update_todo(todo_id, {"completed": completed})
+        if version is not None:
+            await self._apply_change(Change(self.list_id, todo_id, "update", {"completed": completed}, version))
+
+    # Complete (or reopen) a task together with every subtask below it, in
+    # one UPDATE through the closure table, if nobody changed the task since
+    # we last saw it
+    async def _complete_subtree(self, todo_id: int, completed: bool):
+        known = self._versions if todo_id in self._versions else self._subtask_versions
+        async with self._write_session(known) as session:
+            old = await session.run_sync(journal.before, ["completed"], None, (services.in_subtree(todo_id),))
+            versions, rollups = await session.run_sync(services.complete_subtree, todo_id, completed, known[todo_id])
+            await self._journal(session, self.list_id, "update", journal.updates(
+                versions, old, {i: {"completed": completed} for i in versions}
+            ))
+            changes = self._updates(versions, completed=completed) + rolled_up(rollups)
+            await commit(session, self.list_id, changes)
+        if todo_id not in versions:
+            return await self._reconcile([todo_id])
+        self._mark_completed(versions, completed)
+        self._set_rollups(rollups_of(changes))
+
+    # Remove a subtask, with the subtasks below it
+    async def remove_subtask(self, todo_id: int):
+        if todo_id not in self._subtask_versions:
+            return
+        async with self._write_session(self._subtask_versions) as session:
+            gone, rollups = await session.run_sync(
+                services.delete_todos, self.list_id, {todo_id: self._subtask_versions[todo_id]}
+            )
+            if gone:
+                await self._journal(session, self.list_id, "delete", journal.images(gone))
+                changes = [deleted(self.list_id, row.id) for row in gone] + rolled_up(rollups)
+                await commit(session, self.list_id, changes)
+        if gone:
+            self._drop_todos([row.id for row in gone])
+            self._set_rollups(rollups_of(changes))
+        else:
+            await self._reconcile([todo_id])
+
+    # Undo this session's last write. Tasks someone else changed since are
+    # left as they are.
+    async def undo(self):
+        if self._undo:
+            entry_id = self._undo[-1]
+            self._undo = self._undo[:-1]
+            reverted = await self._revert(entry_id)
+            if reverted is not None:
+                self._redo = [*self._redo, reverted]
+            self._history_changed()
+
+    # Redo the last write this session undid
+    async def redo(self):
+        if self._redo:
+            entry_id = self._redo[-1]
+            self._redo = self._redo[:-1]
+            reverted = await self._revert(entry_id)
+            if reverted is not None:
+                self._undo = [*self._undo, reverted]
+            self._history_changed()
+
+    # Write the inverse of a journal entry and show it. Returns the id of
+    # the entry that journaled the inverse, or None if nothing was written.
+    async def _revert(self, entry_id: int) -> int | None:
+        async with self._write_session() as session:
+            reverted = await session.run_sync(journal.revert, entry_id)
+            if reverted is not None:
+                await commit(session, reverted.list_id, reverted.changes)
+        if reverted is None:
+            self.error_message = "That change is too old to undo."
+            return None
+        if reverted.list_id == self.list_id:
+            if len(reverted.changes) > changefeed.MAX_CHANGES:
+                await self.load_todos()
+            else:
+                for change in reverted.changes:
+                    await self._apply_change(change)
+            if reverted.conflicts:
+                await self._reconcile(reverted.conflicts)
+        elif reverted.conflicts:
+            self.error_message = CONFLICT_MESSAGE
+        return reverted.entry_id
+
+    # Search the tasks' titles and descriptions. The search box debounces
+    # its input, so this runs once the user stops typing, not per keystroke.
+    async def search(self, value: str):
+        self.search_query = value
+        self.search_results = []
+        await self._load_results()
+
+    # Load the next page of search results
+    async def load_more_results(self):
+        if self.search_has_more:
+            await self._load_results()
+
+    # Append a page of results for the current query, ranked by the database
+    async def _load_results(self):
+        if not self.search_query.strip():
+            self.search_results = []
+            self.search_has_more = False
+            return
+        page_size = services.SEARCH_PAGE_SIZE
+        async with read_session(self._reads_primary()) as session:
+            rows = await session.run_sync(
+                services.search_todos, self.list_id, self.search_query, page_size + 1, len(self.search_results)
+            )
+            self.search_results.extend(todo_to_row(todo) for todo in rows[:page_size])
+        self.search_has_more = len(rows) > page_size
+
+    # Show or hide the list's archived tasks. They are only read from the
+    # archive when asked for, a page at a time.
+    async def toggle_archived(self):
+        show = not self.show_archived
+        self._hide_archived()
+        if show:
+            self.show_archived = True
+            await self._load_archived()
+
+    # Load the next page of archived tasks
+    async def load_more_archived(self):
+        if self.archived_has_more:
+            await self._load_archived()
+
+    # Append a page of archived tasks after the last one loaded
+    async def _load_archived(self):
+        page_size = services.PAGE_SIZE
+        async with read_session(self._reads_primary()) as session:
+            rows = await session.run_sync(services.load_archived, self.list_id, self._archived_cursor, page_size + 1)
+        page = rows[:page_size]
+        self.archived.extend(
+            ArchivedRow(id=todo.id, text=todo.text, completed_at=f"{todo.completed_at:%Y-%m-%d}") for todo in page
+        )
+        if page:
+            self._archived_cursor = (page[-1].completed_at, page[-1].id)
+        self.archived_has_more = len(rows) > page_size
+
+    # Close the archived view and forget what it loaded
+    def _hide_archived(self):
+        self.show_archived = False
+        self.archived = []
+        self.archived_has_more = False
+        self._archived_cursor = None
 
     # Load a task's details for viewing or editing
-    def view_details(self, todo_id: int):
-        with rx.session() as session:
-            todo = session.get(Todo, todo_id)
+    async def view_details(self, todo_id: int):
+        async with read_session(self._reads_primary()) as session:
+            todo = await session.get(Todo, todo_id)
             if todo:
-                self.selected_todo = {
-                    "id": todo.id,
-                    "text": todo.text,
-                    "description": todo.description,
-                    "completed": todo.completed,
-                    "image": getattr(todo, "image", "")
-                }
-
-    # Save changes to the selected task
-    def save_selected_todo(self):
+                self.selected_todo = {**todo_to_dict(todo), **writes.pending(todo_id)}
+                subtree = await session.run_sync(services.load_subtree, todo_id) if todo.subtasks else []
+                self.selected_subtasks = [subtask_to_row(below, depth) for below, depth in subtree]
+
+    # The selected task changed since it was loaded: show it as it is now
+    async def _selected_conflict(self):
+        self.error_message = CONFLICT_MESSAGE
+        todo_id = self.selected_todo["id"]
+        self.selected_todo = None
+        await self.view_details(todo_id)
+
+    # Save changes to the selected task, unless someone else changed it
+    # since it was loaded
+    async def save_selected_todo(self):
         if self.selected_todo:
-            with rx.session() as session:
-                todo = session.get(Todo, self.selected_todo["id"])
-                if todo:
-                    todo.text = self.selected_todo["text"]
-                    todo.description = self.selected_todo["description"]
-                    todo.completed = self.selected_todo["completed"]
-                    todo.image = self.selected_todo.get("image", "")
-                    session.commit()
+            todo_id = self.selected_todo["id"]
+            known = {todo_id: self.selected_todo["version"]}
+            values = {
+                "text": self.selected_todo["text"],
+                "description": self.selected_todo["description"],
+                "completed": self.selected_todo["completed"],
+                "image": self.selected_todo.get("image", ""),
+                "due_at": from_local_input(self.selected_todo["due_at"]),
+                "remind_at": from_local_input(self.selected_todo["remind_at"]),
+            }
+            async with self._write_session(known) as session:
+                self.selected_todo["version"] = known[todo_id]
+                old = await session.run_sync(journal.before, values, [todo_id])
+                version = await session.run_sync(services.update_todo, todo_id, known[todo_id], values)
+                if version is not None:
+                    list_id = (await session.get(Todo, todo_id)).list_id
+                    rollups = []
+                    if old[todo_id]["completed"] != values["completed"]:
+                        rollups = await session.run_sync(services.rollup_completed, {todo_id: values["completed"]})
+                    await self._journal(session, list_id, "update", journal.updates({todo_id: version}, old, {todo_id: values}))
+                    await commit(session, list_id, [Change(
+                        list_id, todo_id, "update", {"text": values["text"], "completed": values["completed"]}, version
+                    ), *rolled_up(rollups)])
+            if version is None:
+                return await self._selected_conflict()
+            scheduler.schedule(todo_id, values["remind_at"])
             self.selected_todo = None
             self.success_message = "✅ Todo updated successfully!"
             return rx.redirect("/")
 
-    # Delete the selected task
-    def delete_selected_todo(self):
+    # Delete the selected task, unless someone else changed it since it was loaded
+    async def delete_selected_todo(self):
         if self.selected_todo:
-            with rx.session() as session:
-                todo = session.get(Todo, self.selected_todo["id"])
-                if todo:
-                    session.delete(todo)
-                    session.commit()
+            todo_id = self.selected_todo["id"]
+            known = {todo_id: self.selected_todo["version"]}
+            async with self._write_session(known) as session:
+                todo = await session.get(Todo, todo_id)
+                gone, rollups = await session.run_sync(services.delete_todos, todo.list_id, known) if todo else ([], [])
+                if gone:
+                    await self._journal(session, todo.list_id, "delete", journal.images(gone))
+                    await commit(session, todo.list_id, [deleted(todo.list_id, row.id) for row in gone] + rolled_up(rollups))
+            if todo is not None and not gone:
+                return await self._selected_conflict()
             self.selected_todo = None
-            rx.redirect("/")
+            return rx.redirect("/")
 
-    # When the page loads, clear any messages and load all tasks
-    def on_mount(self):
+    # When the page loads, clear any messages and load the first page of tasks
+    async def on_mount(self):
         self.success_message = ""
-        self.load_todos()
+        self.error_message = ""
+        self.todos = []
+        self._orders = {}
+        self._versions = {}
+        self._hide_archived()
+        # Make sure the list we load includes changes still being held back
+        await writes.flush()
+        await self.load_lists()
+        if self.lists and self.list_id not in [todo_list.id for todo_list in self.lists]:
+            self.list_id = self.lists[0].id
+        await self.load_todos()
+        return State.follow_changes
+
+    # Apply other sessions' changes to the shown list as they are committed.
+    # Runs in the background for as long as the tab is open; showing another
+    # list or mounting the page again starts a new follower and stops this one.
+    @rx.event(background=True)
+    async def follow_changes(self):
+        async with self:
+            self._follow_generation += 1
+            generation = self._follow_generation
+            list_id = self.list_id
+            token = self.router.session.client_token
+        subscription = changefeed.get_feed().subscribe(list_id)
+        try:
+            while True:
+                changes = await subscription.get(FOLLOW_IDLE_SECONDS)
+                if not changes and not connected(token):
+                    return
+                async with self:
+                    if self._follow_generation != generation:
+                        return
+                    for change in changes:
+                        await self._apply_change(change)
+                    # The counts are shared through the cache, so every
+                    # session following the list costs one query in all
+                    await self._load_counts()
+        finally:
+            subscription.close()
+
+    # Patch one change into the loaded rows. Changes this session made
+    # itself come back too; those are no newer than what it already shows.
+    async def _apply_change(self, change: Change):
+        if change.op == "resync":
+            await self.load_todos()
+            return
+        if change.op == "rollup":
+            self._set_rollups({change.id: change.fields})
+            return
+        if change.op == "remind" and self.selected_todo and self.selected_todo["id"] == change.id:
+            # Sending the reminder cleared remind_at; an open edit that hasn't
+            # missed any other change takes that version, so saving it
+            # doesn't conflict with the reminder or set it again
+            if change.version == self.selected_todo["version"] + 1:
+                self.selected_todo["remind_at"] = ""
+                self.selected_todo["version"] = change.version
+        if change.id in self._subtask_versions or change.fields.get("parent_id") is not None:
+            await self._apply_subtask_change(change)
+            return
+        index = self._index_of(change.id)
+        if change.op == "remind":
+            self.reminder_message = f"⏰ Reminder: {change.fields['text']}"
+            if index is not None:
+                self._versions[change.id] = max(change.version, self._versions[change.id])
+            return
+        if change.op == "delete":
+            if index is not None:
+                self._drop_todo(index, change.id)
+                self.selected_ids = [todo_id for todo_id in self.selected_ids if todo_id != change.id]
+            return
+        if index is not None and change.version <= self._versions.get(change.id, 0):
+            return
+        fields = {name: change.fields[name] for name in ("text", "completed") if name in change.fields}
+        if "completed" in fields and not self._shows(fields["completed"]):
+            # It no longer belongs in the filter
+            if index is not None:
+                self._drop_todo(index, change.id)
+            return
+        if index is None and "order" not in change.fields and "completed" in fields and FILTERS[self.filter_mode] is not None:
+            # It just came into the filter; fetch the rest of it
+            await self._refresh_rows([change.id])
+            return
+        if index is not None:
+            row = self.todos[index]
+            if any(getattr(row, name) != value for name, value in fields.items()):
+                row = self.todos[index] = dataclasses.replace(row, **fields)
+            self._versions[change.id] = change.version
+            if "order" not in change.fields or self._orders.get(change.id) == change.fields["order"]:
+                return
+            del self.todos[index]
+        elif "order" not in change.fields:
+            # Not loaded and not moving into view
+            return
+        elif len(fields) < 2:
+            # Moved into view, but we don't know what it looks like
+            await self._refresh_rows([change.id])
+            return
+        else:
+            row = TodoRow(id=change.id, **fields)
+        order = change.fields["order"]
+        self._orders.pop(change.id, None)
+        self._versions.pop(change.id, None)
+        position = bisect.bisect_left([(self._orders[todo.id], todo.id) for todo in self.todos], (order, change.id))
+        if position == len(self.todos) and self.has_more:
+            # It belongs past the loaded rows; it shows up when they're loaded
+            return
+        self._insert_todo(position, row, order, change.version)
+
+    # Where a loaded subtask is: (its top-level task's id, its index there)
+    def _find_subtask(self, todo_id: int) -> tuple[int, int] | None:
+        if todo_id not in self._subtask_versions:
+            return None
+        for root_id, rows in self.subtasks.items():
+            for index, row in enumerate(rows):
+                if row.id == todo_id:
+                    return root_id, index
+        return None
+
+    # Hide the subtasks of a top-level task and forget what was read
+    def _collapse(self, root_id: int):
+        for row in self.subtasks.pop(root_id, []):
+            self._subtask_versions.pop(row.id, None)
+
+    # Patch new subtask counts ({id: {"subtasks": n, "subtasks_done": n}})
+    # into the shown rows
+    def _set_rollups(self, rollups: dict[int, dict]):
+        if not rollups:
+            return
+        if any(todo.id in rollups for todo in self.todos):
+            self.todos = [
+                dataclasses.replace(todo, **rollups[todo.id]) if todo.id in rollups else todo for todo in self.todos
+            ]
+        for root_id, rows in list(self.subtasks.items()):
+            if any(row.id in rollups for row in rows):
+                self.subtasks[root_id] = [
+                    dataclasses.replace(row, **rollups[row.id]) if row.id in rollups else row for row in rows
+                ]
+
+    # Patch one change to a subtask into the expanded tasks. Subtasks aren't
+    # filtered, and new ones go last under their parent, if it is expanded.
+    async def _apply_subtask_change(self, change: Change):
+        found = self._find_subtask(change.id)
+        if change.op == "remind":
+            self.reminder_message = f"⏰ Reminder: {change.fields['text']}"
+            if found is not None:
+                self._subtask_versions[change.id] = max(change.version, self._subtask_versions[change.id])
+            return
+        if change.op == "delete":
+            if found is not None:
+                root_id, index = found
+                rows = self.subtasks[root_id]
+                end = subtree_end(rows, index)
+                for row in rows[index:end]:
+                    self._subtask_versions.pop(row.id, None)
+                self.subtasks[root_id] = [*rows[:index], *rows[end:]]
+            return
+        fields = {name: change.fields[name] for name in ("text", "completed") if name in change.fields}
+        if found is not None:
+            if change.version > self._subtask_versions[change.id]:
+                root_id, index = found
+                rows = list(self.subtasks[root_id])
+                rows[index] = dataclasses.replace(rows[index], **fields)
+                self.subtasks[root_id] = rows
+                self._subtask_versions[change.id] = change.version
+            return
+        if change.op != "insert":
+            return
+        parent_id = change.fields["parent_id"]
+        if parent_id in self.subtasks:
+            root_id, end, depth = parent_id, len(self.subtasks[parent_id]), 1
+        else:
+            parent = self._find_subtask(parent_id)
+            if parent is None or not self.subtasks[parent[0]][parent[1]].expanded:
+                return
+            root_id = parent[0]
+            end = subtree_end(self.subtasks[root_id], parent[1])
+            depth = self.subtasks[root_id][parent[1]].depth + 1
+        rows = self.subtasks[root_id]
+        self.subtasks[root_id] = [*rows[:end], SubtaskRow(id=change.id, depth=depth, **fields), *rows[end:]]
+        self._subtask_versions[change.id] = change.version
@@ -0,0 +1,121 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import reflex as rx
+from reflex.config import get_config
+from .uploads import images_dir
+
+# Small versions of uploaded images, so the details pages don't make the
+# browser download a full-size photo to show it 200px wide. Variants are
+# written next to the original as <sha256>.w<width>.webp. Images are
+# content-addressed, so a variant never changes and can be cached forever.
+# Resizing is CPU-bound, so it runs in a process pool, not on the event loop.
+# Pillow is optional: without it, or when an image can't be resized, the
+# original is served instead, with a short max-age so the variant is asked
+# for again later. A failed resize isn't tried again for FAILED_RETRY_SECONDS.
+
+# Widths we make variants for
+VARIANT_WIDTHS = (200, 400)
+# Processes used for resizing
+WORKERS = 2
+# Seconds before a variant that couldn't be made is tried again
+FAILED_RETRY_SECONDS = 3600
+
+# What a stored image name looks like (see uploads.store_image)
+IMAGE_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpe?g|gif|webp)$")
+
+_pool: ProcessPoolExecutor | None = None
+# Variants being made right now, so concurrent requests share one job
+_pending: dict[Path, asyncio.Future] = {}
+# When making each variant last failed (time.monotonic())
+_failed: dict[Path, float] = {}
+# Background jobs started after uploads (kept so they aren't garbage collected)
+_jobs: set[asyncio.Task] = set()
+
+
+# True when Pillow is installed and variants can be made
+def can_resize() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+
+# Where the original and a variant of a stored image live
+def original_path(name: str) -> Path:
+    return images_dir() / name
+
+
+def variant_path(name: str, width: int) -> Path:
+    return images_dir() / f"{name.rsplit('.', 1)[0]}.w{width}.webp"
+
+
+# URL of a variant of an image stored as "images/<name>", for the frontend
+def thumbnail_url(image: str | rx.Var, width: int = VARIANT_WIDTHS[0]) -> rx.Var:
+    return rx.Var.create(f"{get_config().api_url}/thumbs/{width}/{image}")
+
+
+# Resize one image. Runs in a worker process, so it only takes plain paths.
+def _render(source: str, target: str, width: int):
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail((width, width * 4))
+        tmp = f"{target}.{os.getpid()}.part"
+        image.save(tmp, "WEBP", quality=80)
+    os.replace(tmp, target)
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+# Forget a finished resize job, remembering when it failed
+def _render_done(target: Path, future: asyncio.Future):
+    _pending.pop(target, None)
+    error = None if future.cancelled() else future.exception()
+    if future.cancelled() or error is not None:
+        _failed[target] = time.monotonic()
+        logging.error("Could not make %s", target.name, exc_info=error)
+
+
+# Make sure a variant exists on disk, making it if needed, and return its
+# path. Returns None when there is no variant to serve: Pillow isn't
+# installed, or making it failed (recently).
+async def ensure_variant(name: str, width: int) -> Path | None:
+    target = variant_path(name, width)
+    if target.exists():
+        return target
+    if not can_resize() or time.monotonic() - _failed.get(target, -FAILED_RETRY_SECONDS) < FAILED_RETRY_SECONDS:
+        return None
+    future = _pending.get(target)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_executor(), _render, str(original_path(name)), str(target), width)
+        _pending[target] = future
+        future.add_done_callback(lambda done: _render_done(target, done))
+    try:
+        # Shielded: a request that goes away doesn't cancel the job others share
+        await asyncio.shield(future)
+    except Exception:
+        return None
+    return target
+
+
+async def _make_all(name: str):
+    for width in VARIANT_WIDTHS:
+        await ensure_variant(name, width)
+
+
+# Make every variant of a freshly uploaded image in the background
+def generate_variants(image: str):
+    name = image.removeprefix("images/")
+    if can_resize() and IMAGE_NAME.match(name):
+        job = asyncio.create_task(_make_all(name))
+        _jobs.add(job)
+        job.add_done_callback(_jobs.discard)
@@ -0,0 +1,238 @@
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from typing import IO, Iterable, Iterator
+from .models import DEFAULT_LIST_ID, Todo, TodoList
+from .ordering import GAP, next_order
+from .services import attach_subtasks, load_subtree
+from sqlmodel import Session, insert, select, tuple_, update
+
+# Bulk import and export of todos as CSV or NDJSON (one JSON object per
+# line). Both stream: imports are written in batches, each in its own
+# transaction, and exports read the list a page at a time, so neither ever
+# holds a whole file or table in memory. Used by the CLI below and by the
+# /todos/import and /todos/export routes in api.py.
+#
+# Subtasks travel with their tasks: every record carries its id and the id
+# of the task it is under (empty for top-level tasks), and exports list
+# each task right before its subtasks. An import puts the records under
+# their parents with new ids; a parent has to come before its subtasks in
+# the file. Files without those columns import as top-level tasks.
+#
+#   python -m todo_app.transfer import todos.csv --list 2
+#   python -m todo_app.transfer export --format ndjson > todos.ndjson
+
+FORMATS = ("csv", "ndjson")
+# Columns read and written, in CSV column order
+FIELDS = ("text", "description", "completed", "image")
+# Columns placing a record in the subtask hierarchy, after FIELDS
+TREE_FIELDS = ("id", "parent_id")
+# Rows written per transaction on import
+BATCH_SIZE = 5000
+# Rows read per query on export
+EXPORT_PAGE_SIZE = 1000
+
+# COPY statement for Postgres imports; "order" is a reserved word
+COPY_SQL = 'COPY todo (text, description, completed, image, "order", list_id) FROM STDIN'
+
+# Image paths accepted on import; anything else is dropped
+IMAGE_PATH = re.compile(r"^images/[0-9a-f]{64}\.(png|jpe?g|gif|webp)$")
+# Spellings of "done" in the completed column
+TRUE_VALUES = ("1", "true", "yes", "y", "on", "x")
+
+
+# Raised when an import file can't be read. Batches before the bad record
+# are already committed; the batch holding it is not written.
+class TransferError(ValueError):
+    pass
+
+
+# Guess the format from a file name, defaulting to CSV
+def format_for(filename: str) -> str:
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+# Turn one parsed record into the columns of a new todo, plus its id in
+# the file and its parent's. `seen` holds the ids of the records before it.
+def _clean(record: dict, line: int, seen: set[str]) -> dict:
+    if not isinstance(record, dict) or not str(record.get("text") or "").strip():
+        raise TransferError(f"Record {line} has no text.")
+    ref = str(record.get("id") or "") or None
+    parent = str(record.get("parent_id") or "") or None
+    if parent is not None and parent not in seen:
+        raise TransferError(f"Record {line} is under {parent}, which doesn't come before it.")
+    if ref is not None:
+        if ref in seen:
+            raise TransferError(f"Record {line} repeats id {ref}.")
+        seen.add(ref)
+    completed = record.get("completed")
+    if isinstance(completed, str):
+        completed = completed.strip().lower() in TRUE_VALUES
+    image = str(record.get("image") or "")
+    return {
+        "text": str(record["text"]),
+        "description": str(record.get("description") or ""),
+        "completed": bool(completed),
+        "image": image if IMAGE_PATH.match(image) else "",
+        "id": ref,
+        "parent_id": parent,
+    }
+
+
+# Read records from a text stream, one at a time
+def read_records(stream: IO[str], fmt: str) -> Iterator[dict]:
+    seen = set()
+    if fmt == "csv":
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            yield _clean(record, number, seen)
+    elif fmt == "ndjson":
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise TransferError(f"Line {number} is not valid JSON: {e.msg}.") from None
+            yield _clean(record, number, seen)
+    else:
+        raise TransferError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+
+
+# Write one batch with COPY where the driver supports it, else executemany
+def _write_batch(session: Session, rows: list[dict]):
+    columns = FIELDS + ("order", "list_id")
+    driver = session.get_bind().dialect.driver
+    if driver not in ("psycopg2", "psycopg"):
+        session.execute(insert(Todo), rows)
+        return
+    connection = session.connection().connection.dbapi_connection
+    with connection.cursor() as cursor:
+        if driver == "psycopg":
+            with cursor.copy(COPY_SQL) as out:
+                for row in rows:
+                    out.write_row([row[c] for c in columns])
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([row[c] for c in columns] for row in rows)
+            buffer.seek(0)
+            # Unquoted empty fields are NULL in CSV COPY unless told otherwise
+            cursor.copy_expert(f"{COPY_SQL} WITH (FORMAT csv, FORCE_NOT_NULL (text, description, image))", buffer)
+
+
+# Write one batch of records. Records that are in the hierarchy are
+# inserted with RETURNING, to learn the new ids (`ids` maps file ids to
+# them, across batches), then put under their parents.
+def _write_records(session: Session, records: list[dict], ids: dict[str, int]):
+    rows = [{name: record[name] for name in FIELDS + ("order", "list_id")} for record in records]
+    if not any(record["id"] or record["parent_id"] for record in records):
+        _write_batch(session, rows)
+        return
+    new_ids = session.scalars(insert(Todo).returning(Todo.id, sort_by_parameter_order=True), rows).all()
+    links = []
+    for record, todo_id in zip(records, new_ids):
+        if record["id"] is not None:
+            ids[record["id"]] = todo_id
+        if record["parent_id"] is not None:
+            links.append((todo_id, ids[record["parent_id"]]))
+    if links:
+        session.execute(update(Todo), [{"id": todo_id, "parent_id": parent} for todo_id, parent in links])
+        attach_subtasks(session, links)
+
+
+# Append todos to the end of a list in the order they come, committing
+# every BATCH_SIZE rows. Returns how many were written.
+def import_todos(session: Session, list_id: int, records: Iterable[dict]) -> int:
+    if session.get(TodoList, list_id) is None:
+        raise TransferError(f"There is no list {list_id}.")
+    order = next_order(session, list_id)
+    count = 0
+    batch = []
+    ids = {}
+    for record in records:
+        batch.append({**record, "order": order, "list_id": list_id})
+        order += GAP
+        if len(batch) == BATCH_SIZE:
+            _write_records(session, batch, ids)
+            session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        _write_records(session, batch, ids)
+        session.commit()
+        count += len(batch)
+    return count
+
+
+# Every todo on a list in order, as plain rows: the top-level ones read a
+# page at a time by key, each followed by its subtasks
+def _iter_rows(session: Session, list_id: int) -> Iterator:
+    columns = [Todo.id, Todo.parent_id, Todo.order, Todo.subtasks] + [getattr(Todo, c) for c in FIELDS]
+    after = None
+    while True:
+        query = select(*columns).where(Todo.list_id == list_id, Todo.parent_id == None)  # noqa: E711
+        if after is not None:
+            query = query.where(tuple_(Todo.order, Todo.id) > after)
+        page = session.exec(query.order_by(Todo.order, Todo.id).limit(EXPORT_PAGE_SIZE)).all()
+        for row in page:
+            yield row
+            if row.subtasks:
+                yield from (todo for todo, _ in load_subtree(session, row.id))
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        after = (page[-1].order, page[-1].id)
+
+
+# Export every todo on a list in order, yielding the file a piece at a time
+def export_todos(session: Session, list_id: int, fmt: str) -> Iterator[str]:
+    if fmt not in FORMATS:
+        raise TransferError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS + TREE_FIELDS)
+        for row in _iter_rows(session, list_id):
+            writer.writerow([getattr(row, c) for c in FIELDS + TREE_FIELDS])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in _iter_rows(session, list_id):
+            yield json.dumps({c: getattr(row, c) for c in FIELDS + TREE_FIELDS}) + "\n"
+
+
+def main():
+    import reflex as rx
+
+    parser = argparse.ArgumentParser(description="Import or export todos as CSV or NDJSON.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import", help="append todos from a file ('-' for stdin)")
+    load.add_argument("file")
+    load.add_argument("--format", choices=FORMATS, help="default: from the file name")
+    dump = commands.add_parser("export", help="write every todo on a list to stdout")
+    dump.add_argument("--format", choices=FORMATS, default="csv")
+    for command in (load, dump):
+        command.add_argument("--list", type=int, default=DEFAULT_LIST_ID, help="list id (default: %(default)s)")
+    args = parser.parse_args()
+
+    with rx.session() as session:
+        if args.command == "export":
+            sys.stdout.writelines(export_todos(session, args.list, args.format))
+            return
+        fmt = args.format or format_for(args.file)
+        stream = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+        try:
+            count = import_todos(session, args.list, read_records(stream, fmt))
+        except TransferError as e:
+            sys.exit(f"Import stopped: {e}")
+        finally:
+            stream.close()
+    print(f"Imported {count} todos.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO
+import reflex as rx
+
+# Uploaded images are stored under the hash of their content, so the same
+# picture uploaded twice is kept once and two files that happen to share a
+# name never overwrite each other. The copy runs in chunks in a worker
+# thread, so a big upload doesn't stall other sessions' events.
+
+# Bytes read per chunk while copying an upload
+CHUNK_SIZE = 1024 * 1024
+# Largest upload we accept
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# File types we keep, by extension
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+
+# Raised when an upload can't be stored; the message is shown to the user
+class UploadError(ValueError):
+    pass
+
+
+# Folder inside Reflex's upload directory that holds the images
+def images_dir() -> Path:
+    return rx.get_upload_dir() / "images"
+
+
+# Copy `source` into the image store and return its path relative to the
+# upload directory (e.g. "images/<sha256>.png"). Blocking; run it in a thread.
+def store_image(source: BinaryIO, filename: str) -> str:
+    extension = Path(filename).suffix.lower()
+    if extension not in IMAGE_EXTENSIONS:
+        raise UploadError(f"Only {', '.join(sorted(IMAGE_EXTENSIONS))} images can be uploaded.")
+    folder = images_dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Write to a temp file in the same folder, so the final rename is atomic
+    with tempfile.NamedTemporaryFile(dir=folder, suffix=".part", delete=False) as tmp:
+        try:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadError(f"Images can be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    name = f"{digest.hexdigest()}{extension}"
+    target = folder / name
+    if target.exists():
+        # Already stored by an earlier upload
+        os.unlink(tmp.name)
+    else:
+        os.replace(tmp.name, target)
+    return f"images/{name}"
+
+
+# Store one uploaded file without blocking the event loop
+async def save_upload(file: rx.UploadFile) -> str:
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise UploadError(f"Images can be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    return await asyncio.to_thread(store_image, file.file, file.name or "")
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from sqlmodel import update
+from . import changefeed, journal
+from .cache import snapshots
+from .changefeed import Change
+from .db import asession
+from .models import Todo
+from .services import completed_at, rollup_completed
+import rxconfig
+
+# Optional write-behind layer for rapid-fire edits. Typing in the edit page,
+# double toggles and repeated up/down clicks each used to become their own
+# commit. In write_behind mode State stages those field changes here instead.
+# Changes to the same todo are merged, and everything staged within
+# write_behind_ms is written in one transaction; a flush that fails keeps
+# its batch and is tried again, waiting longer after each failure. The
+# queue is shared by the whole process, so a session closing its tab
+# doesn't lose anything staged. Each flush is journaled as one entry per
+# list, for the audit trail; it isn't on any session's undo stack, since
+# staged edits from several sessions can be merged into it.
+
+# How many todos the queue remembers its last written version for
+FLUSHED_KEEP = 10_000
+# Seconds before a failed flush is tried again, doubled after every
+# failure in a row up to RETRY_MAX_SECONDS
+RETRY_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+
+# True when State should stage edits here instead of committing them
+def enabled() -> bool:
+    return rxconfig.write_mode == "write_behind"
+
+
+class WriteBehindQueue:
+    def __init__(self, window_ms: int):
+        self.window = window_ms / 1000
+        self._pending: dict[int, dict] = {}
+        # Client tokens of the sessions that staged each pending todo
+        self._stagers: dict[int, set[str]] = {}
+        # Version the queue's last write left a todo at, for each session
+        # that staged it ({(token, id): version}), most recently written last
+        self._flushed: dict[tuple[str, int], int] = {}
+        self._timer: asyncio.Task | None = None
+        # Wait before the next retry; 0 while flushes succeed
+        self._retry = 0.0
+        self._lock = asyncio.Lock()
+
+    # Stage new values for some fields of a todo, for the session with
+    # client token `owner`; later values win
+    def stage(self, owner: str, todo_id: int, **fields):
+        self._pending.setdefault(todo_id, {}).update(fields)
+        self._stagers.setdefault(todo_id, set()).add(owner)
+        self._schedule(self.window)
+
+    # Staged values for a todo that aren't in the database yet
+    def pending(self, todo_id: int) -> dict:
+        return dict(self._pending.get(todo_id, {}))
+
+    # Bring versions the session `owner` knows ({id: version}) up to date
+    # with what the queue wrote of that session's own staged edits,
+    # including flushes the timer did while it wasn't looking. Writes of
+    # edits other sessions staged are left alone, so they still conflict.
+    def catch_up(self, owner: str, versions: dict[int, int]):
+        for todo_id, version in versions.items():
+            flushed = self._flushed.get((owner, todo_id))
+            if flushed is not None and flushed > version:
+                versions[todo_id] = flushed
+
+    # Remember the version a flush left a todo at, for a session that staged it
+    def _remember(self, owner: str, todo_id: int, version: int):
+        self._flushed.pop((owner, todo_id), None)
+        self._flushed[owner, todo_id] = version
+        if len(self._flushed) > FLUSHED_KEEP:
+            del self._flushed[next(iter(self._flushed))]
+
+    # Flush in `delay` seconds, unless a flush is already waiting to run
+    def _schedule(self, delay: float):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        # Anything staged or put back from here on needs a timer of its own
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logging.exception("Write-behind flush failed")
+
+    # Write staged changes (all of them, or only for `ids`) in one
+    # transaction. Returns the changes written, with the rows' new versions.
+    async def flush(self, ids: list[int] | None = None) -> list[Change]:
+        async with self._lock:
+            if ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {todo_id: self._pending.pop(todo_id) for todo_id in ids if todo_id in self._pending}
+            if not batch:
+                return []
+            stagers = {todo_id: self._stagers.pop(todo_id, set()) for todo_id in batch}
+            changes = []
+            try:
+                async with asession() as session:
+                    names = {name for fields in batch.values() for name in fields}
+                    old = await session.run_sync(journal.before, names, list(batch))
+                    rows = {}
+                    for todo_id, fields in batch.items():
+                        values = dict(fields)
+                        if "completed" in fields:
+                            values["completed_at"] = completed_at(fields["completed"])
+                        for list_id, version in (await session.execute(
+                            update(Todo).where(Todo.id == todo_id).values(**values, version=Todo.version + 1)
+                            .returning(Todo.list_id, Todo.version)
+                            .execution_options(synchronize_session=False)
+                        )).all():
+                            changes.append(Change(list_id, todo_id, "update", fields, version))
+                            rows.setdefault(list_id, []).extend(journal.updates({todo_id: version}, old, {todo_id: fields}))
+                    flips = {
+                        change.id: change.fields["completed"] for change in changes
+                        if "completed" in change.fields and change.fields["completed"] != old[change.id]["completed"]
+                    }
+                    changes += changefeed.rolled_up(await session.run_sync(rollup_completed, flips))
+                    for list_id, journaled in rows.items():
+                        await session.run_sync(journal.record, list_id, "update", journaled)
+                    await changefeed.commit(session, changes)
+            except Exception:
+                # Put the batch back (newer staged values win) so it is retried
+                for todo_id, fields in batch.items():
+                    self._pending[todo_id] = {**fields, **self._pending.get(todo_id, {})}
+                    self._stagers.setdefault(todo_id, set()).update(stagers[todo_id])
+                self._retry = min(self._retry * 2, RETRY_MAX_SECONDS) if self._retry else RETRY_SECONDS
+                self._schedule(self._retry)
+                raise
+            self._retry = 0.0
+            for change in changes:
+                if change.op == "update":
+                    for owner in stagers[change.id]:
+                        self._remember(owner, change.id, change.version)
+            for list_id in {change.list_id for change in changes}:
+                snapshots.bump(list_id)
+            return changes
+
+
+# The one queue every session in this process shares
+writes = WriteBehindQueue(rxconfig.write_behind_ms)